@@ -0,0 +1,39 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Parsing time of the datetimes of memento URLs, against `strptime`.
+
+    $ python benchmarks/bench_archive_datetime.py --number 1000000
+"""
+
+import argparse
+import time
+from datetime import datetime
+
+from memento_test.server import convert_archive_datetime, ARCHIVE_DATE_FORMAT
+
+DATETIMES = [2016, 201607, 20160713, 20170713121257]
+
+
+def strptime(mem_dt):
+    digits = str(mem_dt)
+    digits += "0101000000"[len(digits) - 4:]
+    return datetime.strptime(digits, ARCHIVE_DATE_FORMAT)
+
+
+def bench(parse, number):
+    start = time.time()
+    for _ in range(number // len(DATETIMES)):
+        for mem_dt in DATETIMES:
+            parse(mem_dt)
+    return (time.time() - start) / number
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=1000000, help="datetimes parsed")
+    args = parser.parse_args()
+
+    fast = bench(convert_archive_datetime, args.number)
+    slow = bench(strptime, args.number)
+    print("padding %.2f us, strptime %.2f us, %.1fx" % (fast * 1e6, slow * 1e6, slow / fast))
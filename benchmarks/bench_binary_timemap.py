@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Size, serialization and parsing time of the binary TimeMap against the
+link-format TimeMap, for a timeline of a million mementos.
+
+    $ python benchmarks/bench_binary_timemap.py --mementos 1000000
+"""
+
+import argparse
+import random
+import time
+from array import array
+
+from memento_test.binary_timemap import binary_timemap, decode_binary_timemap
+from memento_test.client import LinkFormatParser
+from memento_test.timemap import link_format_timemap
+
+URI_R = "http://www.espn.com/"
+HOST_NAME = "http://localhost:4000/"
+
+
+def make_timeline(count, seed=1):
+    rng = random.Random(seed)
+    seconds = 978307200
+    timeline = array("q")
+    for _ in range(count):
+        seconds += 1 + int(rng.expovariate(1 / 300.0))
+        timeline.append(seconds)
+    return timeline
+
+
+def timed(fn, *args):
+    start = time.time()
+    result = fn(*args)
+    return result, time.time() - start
+
+
+def serialize(serializer, timeline):
+    return b"".join(serializer(URI_R, timeline, HOST_NAME, HOST_NAME + "timemap/link/" + URI_R,
+                               HOST_NAME + "tg/" + URI_R))
+
+
+def parse_link_format(data):
+    parser = LinkFormatParser()
+    return parser.feed(data.decode("utf-8")) + parser.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mementos", type=int, default=1000000)
+    args = parser.parse_args()
+
+    timeline = make_timeline(args.mementos)
+    link, link_time = timed(serialize, link_format_timemap, timeline)
+    binary, binary_time = timed(serialize, binary_timemap, timeline)
+    entries, link_parse = timed(parse_link_format, link)
+    timemap, binary_parse = timed(decode_binary_timemap, binary)
+    assert len(timemap.epochs) == len(entries) - 3
+
+    print("%d mementos" % args.mementos)
+    print("bytes       link-format %11d, binary %11d, %6.1fx" % (
+        len(link), len(binary), len(link) / float(len(binary))))
+    print("serialize   link-format %9.3f s, binary %9.3f s, %6.1fx" % (
+        link_time, binary_time, link_time / binary_time))
+    print("parse       link-format %9.3f s, binary %9.3f s, %6.1fx" % (
+        link_parse, binary_parse, link_parse / binary_parse))
@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time to the first TimeGate response of a server indexing a synthetic archive,
+when it builds the index (cold start) and when it loads its snapshot (warm start).
+
+    $ python benchmarks/bench_cold_start.py --uris 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from werkzeug.test import Client
+
+from memento_test.archive import SyntheticArchive
+from memento_test.server import create_application
+from memento_test.snapshot import load_snapshot
+
+
+def start(path, settings, archive, uris):
+    """
+    :return: (float, bool) The time to the first response, and whether the
+    snapshot was loaded.
+    """
+    begin = time.time()
+    index, loaded = load_snapshot(path, settings, lambda: archive.materialize(uris))
+    client = Client(create_application(archive=index))
+    assert client.get("/tg/" + uris[0]).status_code == 302
+    elapsed = time.time() - begin
+    index.close()
+    return elapsed, loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uris", type=int, default=100000, help="indexed URI-Rs")
+    parser.add_argument("--density", type=float, default=10.0)
+    parser.add_argument("--starts", type=int, default=5, help="warm starts")
+    args = parser.parse_args()
+
+    archive = SyntheticArchive(seed=1, density=args.density)
+    uris = list(archive.uris(args.uris))
+    settings = {"seed": 1, "density": args.density, "uris": args.uris}
+    path = os.path.join(tempfile.mkdtemp(), "memento.snapshot")
+
+    cold, loaded = start(path, settings, archive, uris)
+    assert not loaded
+    warm = min(start(path, settings, archive, uris)[0] for _ in range(args.starts))
+    print("%d URI-Rs, %d bytes snapshot" % (args.uris, os.path.getsize(path)))
+    print("cold start %9.3f s, warm start %9.4f s, %7.1fx" % (cold, warm, cold / warm))
+    os.remove(path)
+    os.rmdir(os.path.dirname(path))
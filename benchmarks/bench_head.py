@@ -0,0 +1,65 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time of HEAD requests against GET requests, for TimeMaps and TimeGates of a
+synthetic archive. HEAD requests get the headers of the GET requests, with the
+Content-Length and the ETag of the TimeMaps, without serializing them.
+
+    $ python benchmarks/bench_head.py --number 200 --density 500
+"""
+
+import argparse
+import time
+
+from werkzeug.test import EnvironBuilder
+
+from memento_test.archive import SyntheticArchive, timeline_epochs
+from memento_test.server import create_application
+
+URI_R = "http://www.espn.com/"
+PATHS = [
+    "/timemap/link/" + URI_R,
+    "/timemap/json/" + URI_R,
+    "/tg/" + URI_R,
+]
+
+
+def request(application, environ):
+    """
+    Sends a request to the application and reads the whole body.
+    :return: (int) The length of the body.
+    """
+    def start_response(status, headers, exc_info=None):
+        pass
+    app_iter = application(dict(environ), start_response)
+    try:
+        return sum(len(chunk) for chunk in app_iter)
+    finally:
+        if hasattr(app_iter, "close"):
+            app_iter.close()
+
+
+def bench(application, environ, number):
+    start = time.time()
+    for _ in range(number):
+        request(application, environ)
+    return (time.time() - start) / number
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=200, help="requests per path and method")
+    parser.add_argument("--density", type=float, default=500.0,
+                        help="mementos per year of the synthetic archive")
+    args = parser.parse_args()
+
+    archive = SyntheticArchive(seed=1, density=args.density)
+    application = create_application(archive=archive)
+    print("%d mementos" % len(timeline_epochs(archive.timeline(URI_R))))
+
+    for path in PATHS:
+        get = bench(application, EnvironBuilder(path=path).get_environ(), args.number)
+        head = bench(application, EnvironBuilder(path=path, method="HEAD").get_environ(),
+                     args.number)
+        print("%-40s GET %9.1f us, HEAD %7.1f us, %6.1fx" % (
+            path, get * 1e6, head * 1e6, get / head))
@@ -0,0 +1,98 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-request time of the TimeGate over a new connection per request, with the
+server closing every connection, and over a kept alive connection, one request
+at a time and pipelined.
+
+    $ python benchmarks/bench_keepalive.py --number 5000 --depth 16
+"""
+
+import argparse
+import logging
+import re
+import socket
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+from memento_test.server import create_application
+from memento_test.serving import bind_socket, make_worker_server
+
+PATH = "/tg/http://www.espn.com"
+REQUEST = ("HEAD %s HTTP/1.1\r\nHost: localhost\r\n\r\n" % PATH).encode("ascii")
+STATUS = re.compile(br"HTTP/1\.1 \d{3} ")
+
+
+def start(keep_alive, number):
+    sock = bind_socket("127.0.0.1", 0)
+    server = make_worker_server(create_application(), sock, keep_alive=keep_alive)
+    # a single connection for all the requests
+    server.max_requests = number + 1
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return sock, server, thread
+
+
+def new_connections(port, number):
+    for _ in range(number):
+        connection = HTTPConnection("127.0.0.1", port)
+        connection.request("HEAD", PATH)
+        connection.getresponse().read()
+        connection.close()
+
+
+def kept_alive(port, number):
+    connection = HTTPConnection("127.0.0.1", port)
+    for _ in range(number):
+        connection.request("HEAD", PATH)
+        connection.getresponse().read()
+    connection.close()
+
+
+def pipelined(port, number, depth):
+    connection = socket.create_connection(("127.0.0.1", port))
+    for _ in range(number // depth):
+        connection.sendall(REQUEST * depth)
+        responses = 0
+        data = b""
+        while responses < depth:
+            chunk = connection.recv(65536)
+            if not chunk:
+                raise IOError("Connection closed by the server")
+            data += chunk
+            responses = len(STATUS.findall(data))
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=5000, help="requests per mode")
+    parser.add_argument("--depth", type=int, default=16, help="pipelined requests")
+    args = parser.parse_args()
+    # not the request log
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    results = []
+    for name, keep_alive, run in [
+            ("connection per request", False, new_connections),
+            ("keep-alive", True, kept_alive),
+            ("keep-alive, pipelined", True,
+             lambda port, number: pipelined(port, number, args.depth))]:
+        sock, server, thread = start(keep_alive, args.number)
+        try:
+            begin = time.time()
+            run(sock.getsockname()[1], args.number)
+            seconds = (time.time() - begin) / args.number
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+            sock.close()
+        results.append(seconds)
+        print("%-23s %7.1f us/request, %6.1fx" % (name, seconds * 1e6, results[0] / seconds))
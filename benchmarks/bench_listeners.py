@@ -0,0 +1,70 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Per-request latency of the server on a TCP loopback and on a Unix domain socket.
+
+    $ python benchmarks/bench_listeners.py --number 2000
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+from memento_test.server import create_application
+from memento_test.serving import bind_socket, make_worker_server, UnixHTTPConnection
+
+PATH = "/tg/http://www.espn.com"
+
+
+def bench(sock, connect, number):
+    server = make_worker_server(create_application(), sock)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        latencies = []
+        for _ in range(number):
+            start = time.time()
+            # a connection per request, as the server closes them
+            connection = connect()
+            connection.request("HEAD", PATH)
+            connection.getresponse().read()
+            connection.close()
+            latencies.append(time.time() - start)
+    finally:
+        server.shutdown()
+        thread.join()
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=2000, help="requests per listener")
+    args = parser.parse_args()
+    # not the request log
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    tmp = tempfile.mkdtemp()
+    try:
+        tcp = bind_socket("127.0.0.1", 0)
+        port = tcp.getsockname()[1]
+        path = os.path.join(tmp, "memento.sock")
+        unix = bind_socket("unix://" + path, 0)
+        for name, sock, connect in [
+                ("tcp loopback", tcp, lambda: HTTPConnection("127.0.0.1", port)),
+                ("unix socket", unix, lambda: UnixHTTPConnection(path))]:
+            median, p99 = bench(sock, connect, args.number)
+            sock.close()
+            print("%-12s median %7.1f us, p99 %7.1f us" % (name, median * 1e6, p99 * 1e6))
+    finally:
+        shutil.rmtree(tmp)
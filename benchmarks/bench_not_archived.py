@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Lookup time of the URI-Rs that are not archived in a shared memento index, with
+and without its Bloom filter, and the time of the 404 TimeGate responses.
+
+    $ python benchmarks/bench_not_archived.py --uris 1000000 --number 100000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from werkzeug.test import Client
+
+from memento_test.archive import SyntheticArchive
+from memento_test.server import create_application
+from memento_test.shared_index import SharedMementoIndex, write_index
+
+
+def bench(fn, uris):
+    start = time.time()
+    for uri_r in uris:
+        fn(uri_r)
+    return (time.time() - start) / len(uris)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uris", type=int, default=1000000, help="archived URI-Rs")
+    parser.add_argument("--number", type=int, default=100000, help="lookups")
+    args = parser.parse_args()
+
+    archive = SyntheticArchive(seed=1, density=1, max_mementos=4)
+    index = archive.materialize(archive.uris(args.uris))
+    missing = ["http://www.missing%d.example.com/" % i for i in range(args.number)]
+    directory = tempfile.mkdtemp()
+    results = {}
+    for name, error_rate in (("bloom", 0.01), ("no bloom", None)):
+        path = os.path.join(directory, name.replace(" ", "_") + ".mti")
+        size = write_index(index, path, error_rate=error_rate)
+        shared = SharedMementoIndex.open(path)
+        lookup = bench(shared.timeline, missing)
+        client = Client(create_application(archive=shared))
+        timegate = bench(lambda uri_r: client.get("/tg/" + uri_r), missing[:args.number // 10])
+        results[name] = lookup
+        print("%-9s %11d bytes, lookup %6.2f us, TimeGate 404 %7.2f us" % (
+            name, size, lookup * 1e6, timegate * 1e6))
+        shared.close()
+        os.remove(path)
+    os.rmdir(directory)
+    print("lookups %.1fx faster" % (results["no bloom"] / results["bloom"]))
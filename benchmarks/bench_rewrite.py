@@ -0,0 +1,59 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput of the streaming HTML rewriter on multi-MB pages.
+
+    $ python benchmarks/bench_rewrite.py --size 8 --chunk 65536
+"""
+
+import argparse
+import time
+
+from memento_test.rewrite import rewrite_html
+
+PREFIX = "http://localhost:4000/20170713121257/"
+BLOCK = (b'<div class="story"><a href="/news/story-%d.html">Story</a>'
+         b'<img src="//cdn.example.com/img/%d.jpg" alt="">'
+         b'<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed do eiusmod '
+         b'tempor incididunt ut labore et dolore magna aliqua.</p></div>\n')
+
+
+def page(size):
+    blocks = []
+    length = 0
+    i = 0
+    while length < size:
+        block = BLOCK % (i, i)
+        blocks.append(block)
+        length += len(block)
+        i += 1
+    return b"<html><body>\n" + b"".join(blocks) + b"</body></html>\n"
+
+
+def bench(data, chunk_size, repeat):
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        out = 0
+        for chunk in rewrite_html(chunks, "http://www.example.com/", PREFIX):
+            out += len(chunk)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=float, default=8, help="the page size in MB")
+    parser.add_argument("--chunk", type=int, action="append",
+                        help="the chunk size in bytes, can be repeated")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    data = page(int(args.size * 1024 * 1024))
+    for chunk_size in args.chunk or [4096, 65536, 1024 * 1024]:
+        elapsed, out = bench(data, chunk_size, args.repeat)
+        print("page %.1f MB, chunks of %7d bytes: %.3f s, %.1f MB/s, output %.1f MB" % (
+            len(data) / 1048576.0, chunk_size, elapsed,
+            len(data) / 1048576.0 / elapsed, out / 1048576.0))
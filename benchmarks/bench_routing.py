@@ -0,0 +1,46 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Matching time of the fast path router against werkzeug's map matching.
+
+    $ python benchmarks/bench_routing.py --number 100000
+"""
+
+import argparse
+import time
+
+from werkzeug.test import EnvironBuilder
+
+from memento_test.routing import match_request
+from memento_test.server import URL_MAP
+
+PATHS = [
+    "/",
+    "/tg/http://www.espn.com/",
+    "/20170713121257/http://www.espn.com/",
+    "/timemap/link/http://www.espn.com/",
+]
+
+
+def werkzeug_match(url_map, environ):
+    return url_map.bind_to_environ(environ).match()
+
+
+def bench(match, environ, number):
+    start = time.time()
+    for _ in range(number):
+        match(URL_MAP, environ)
+    return (time.time() - start) / number
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=100000, help="matches per path")
+    args = parser.parse_args()
+
+    for path in PATHS:
+        environ = EnvironBuilder(path=path).get_environ()
+        fast = bench(match_request, environ, args.number)
+        slow = bench(werkzeug_match, environ, args.number)
+        print("%-40s fast %6.2f us, werkzeug %6.2f us, %5.1fx" % (
+            path, fast * 1e6, slow * 1e6, slow / fast))
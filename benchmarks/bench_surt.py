@@ -0,0 +1,52 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+SURT canonicalizations per second, of repeated URI-Rs served by the LRU and of
+distinct URI-Rs canonicalized one by one.
+
+    $ python benchmarks/bench_surt.py --uris 1000000 --hot 1000
+"""
+
+import argparse
+import random
+import time
+
+from memento_test.archive import SyntheticArchive
+from memento_test.surt import surt, canonicalize
+
+# of a host and a path
+FORMS = ["http://www.%s%s", "https://%s%s", "http://%s%s?", "HTTP://WWW.%s:80%s#top"]
+
+
+def make_uris(count, hot, seed=1):
+    """
+    :return: (list) `count` URI-Rs, drawn from `hot` URI-Rs in various forms.
+    """
+    rng = random.Random(seed)
+    hosts = []
+    for uri_r in SyntheticArchive(seed=seed).uris(hot):
+        host, slash, path = uri_r[len("http://www."):].partition("/")
+        hosts.append((host, slash + path))
+    return [rng.choice(FORMS) % rng.choice(hosts) for _ in range(count)]
+
+
+def rate(fn, uris):
+    start = time.time()
+    for uri_r in uris:
+        fn(uri_r)
+    return len(uris) / (time.time() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--uris", type=int, default=1000000, help="canonicalizations")
+    parser.add_argument("--hot", type=int, default=1000, help="distinct hot URI-Rs")
+    args = parser.parse_args()
+
+    uris = make_uris(args.uris, args.hot)
+    surt.cache_clear()
+    hot = rate(surt, uris)
+    info = surt.cache_info()
+    cold = rate(canonicalize, uris)
+    print("memoized %10.0f URIs/s (%d hits, %d misses)" % (hot, info.hits, info.misses))
+    print("uncached %10.0f URIs/s" % cold)
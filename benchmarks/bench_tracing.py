@@ -0,0 +1,54 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time of the TimeGate and TimeMap requests without a tracer, with a tracer
+sampling some of the requests, and with every request traced.
+
+    $ python benchmarks/bench_tracing.py --number 20000 --sample 0.01
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from werkzeug.test import Client
+
+from memento_test.server import create_application
+from memento_test.tracing import Tracer, SpanExporter
+
+REQUESTS = (("TimeGate", "/tg/http://www.espn.com", [("Prefer", "tg_303")]),
+            ("TimeMap", "/timemap/link/http://www.espn.com", []))
+
+
+def bench(client, path, headers, number):
+    start = time.time()
+    for _ in range(number):
+        client.get(path, headers=headers)
+    return (time.time() - start) / number
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--number", type=int, default=20000, help="requests")
+    parser.add_argument("--sample", type=float, default=0.01, help="sample rate")
+    parser.add_argument("--format", choices=("json", "otlp"), default="json")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "spans.jsonl")
+    exporter = SpanExporter(path, span_format=args.format)
+    tracers = (("untraced", None), ("sampled %g" % args.sample, Tracer(exporter, args.sample)),
+               ("traced", Tracer(exporter)))
+    for name, path_info, headers in REQUESTS:
+        baseline = None
+        for tracer_name, tracer in tracers:
+            client = Client(create_application(tracer=tracer))
+            seconds = bench(client, path_info, headers, args.number)
+            baseline = baseline or seconds
+            print("%-8s %-14s %7.2f us (%+.1f%%)" % (
+                name, tracer_name, seconds * 1e6, (seconds / baseline - 1) * 100))
+    exporter.close()
+    print("dropped spans: %d, trace file %d bytes" % (exporter.dropped, os.path.getsize(path)))
+    os.remove(path)
+    os.rmdir(directory)
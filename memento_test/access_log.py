@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+A structured access log that does not block request handling.
+
+Requests only put a tuple on a bounded queue. A background thread turns the
+entries into JSON lines and appends them to the log file in batches of up to
+`batch_size` entries, at least every `flush_interval` seconds. Each batch is
+a single `write()` on a file opened in append mode, so the workers of a
+pre-forked server can share the file. When the queue is full, entries are
+dropped and counted instead of slowing the server down.
+
+eg:
+ {"time": 1500000000.123, "method": "GET", "endpoint": "timegate",
+  "uri_r": "http://www.espn.com", "prefer": "tg_303", "status": 303,
+  "latency_ms": 0.412}
+"""
+
+import atexit
+import json
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_FIELDS = ("time", "method", "endpoint", "uri_r", "prefer", "status", "latency_ms")
+
+_STOP = object()
+
+
+class BatchWriter(object):
+    """
+    Appends the queued entries to a file as JSON lines, in batches, from a
+    background thread. Subclasses may map the entries to JSON values with
+    `format_entry`, or format whole batches with `format_batch`.
+    """
+
+    thread_name = "memento-batch-writer"
+
+    def __init__(self, path, batch_size=512, flush_interval=1.0, max_queue=100000):
+        """
+        :param path: (str) The path of the file, appended to.
+        :param batch_size: (int) The maximum number of entries per write.
+        :param flush_interval: (float) The maximum number of seconds an entry waits
+        to be written.
+        :param max_queue: (int) The maximum number of entries waiting to be written.
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = open(path, "ab", buffering=0)
+        self._thread = threading.Thread(target=self._run, name=self.thread_name)
+        self._thread.daemon = True
+        self._thread.start()
+        atexit.register(self.close)
+
+    def put(self, entry):
+        """
+        Queues an entry, without blocking.
+        """
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def format_entry(self, entry):
+        """
+        :param entry: A queued entry.
+        :return: The JSON serializable value of the entry, by default the entry.
+        """
+        return entry
+
+    def format_batch(self, batch):
+        """
+        :param batch: (list) The entries of a batch.
+        :return: (list) The lines of the batch, without line breaks, by default a
+        JSON line per entry.
+        """
+        return [json.dumps(self.format_entry(entry), separators=(",", ":"))
+                for entry in batch]
+
+    def _run(self):
+        while True:
+            try:
+                entry = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch = []
+            while entry is not _STOP:
+                batch.append(entry)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._write(batch)
+            if entry is _STOP:
+                return
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self._file.write(("\n".join(self.format_batch(batch)) + "\n").encode("utf-8"))
+        except (IOError, OSError, ValueError):
+            logger.exception("Could not write %s", self.path)
+
+    def close(self):
+        """
+        Writes the queued entries and stops the writer thread.
+        """
+        if self._file.closed:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._file.close()
+
+
+class AccessLog(BatchWriter):
+    """
+    Writes one JSON line per request from a background thread.
+    """
+
+    thread_name = "memento-access-log"
+
+    def log(self, *entry):
+        """
+        Queues an entry, without blocking.
+        :param entry: the values of ACCESS_LOG_FIELDS, in order.
+        """
+        self.put(entry)
+
+    def format_entry(self, entry):
+        return dict(zip(ACCESS_LOG_FIELDS, entry))
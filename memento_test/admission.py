@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""
+Admission control for the Memento Test Server.
+
+`AdmissionControl` is a WSGI middleware that limits the number of requests
+handled at once. When `max_concurrent` requests are running, up to
+`max_queue` more wait for a slot, for at most `queue_timeout` seconds. The
+other requests get an immediate `503 Service Unavailable` with a `Retry-After`
+header, instead of waiting in the accept queue until the client times out.
+
+The `rate_limit=<n>/s` preference throttles a client (by its address) to n
+requests per second, with a token bucket holding up to n requests. The
+requests over the rate get a `429 Too Many Requests` with the `Retry-After` of
+the next token, to test the backoff of clients:
+
+    Prefer: rate_limit=10/s
+
+The counters of the middleware are served as JSON at `/_stats`, eg:
+ {"pid": 4242, "active": 2, "queued": 0, "admitted": 1840, "rejected": 12,
+  "throttled": 96, "peak_active": 8, "peak_queued": 4, ...}
+
+The limits and the counters are those of a worker process. For example:
+ ```python
+ from memento_test.admission import AdmissionControl
+ from memento_test.server import create_application
+
+ application = AdmissionControl(create_application(), max_concurrent=8, max_queue=32)
+ ```
+"""
+
+from collections import OrderedDict
+import json
+import math
+import os
+import re
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+from memento_test.prefer import parse_prefer
+
+STATS_PATH = "/_stats"
+RATE_LIMIT_PREFERENCE = "rate_limit"
+
+# the unquoted `rate_limit=10/s` is not a valid preference value, see `parse_rate_limit`
+_RATE_LIMIT = re.compile(
+    r"(?:^|,)[ \t]*rate_limit[ \t]*=[ \t]*([0-9]+(?:\.[0-9]+)?)/s[ \t]*(?:[;,]|$)", re.IGNORECASE)
+_RATE = re.compile(r"^([0-9]+(?:\.[0-9]+)?)(?:/s)?$")
+
+_clock = getattr(time, "monotonic", time.time)
+
+
+def parse_rate_limit(prefer):
+    """
+    Finds the `rate_limit` preference of a `Prefer` header.
+    eg: parse_rate_limit('tg_303, rate_limit=10/s') -> 10.0
+    :param prefer: (str) The value of the `Prefer` header(s).
+    :return: (float) The rate in requests per second, or None.
+    """
+    if not prefer or RATE_LIMIT_PREFERENCE not in prefer.lower():
+        return
+    for pref in parse_prefer(prefer):
+        if pref.name == RATE_LIMIT_PREFERENCE:
+            m = _RATE.match(pref.value or "")
+            rate = float(m.group(1)) if m else 0
+            return rate if rate > 0 else None
+    # the unquoted form, dropped by the parser
+    m = _RATE_LIMIT.search(prefer)
+    if m and float(m.group(1)) > 0:
+        return float(m.group(1))
+
+
+def format_rate(rate):
+    """
+    eg: format_rate(10.0) -> "10/s"
+    """
+    return "%s/s" % ("%d" % rate if rate == int(rate) else rate)
+
+
+class TokenBucket(object):
+    """
+    A bucket of up to `capacity` tokens, refilled with `rate` tokens per second.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        """
+        Takes a token.
+        :param now: (float) The current time, in seconds.
+        :return: (float) 0 if a token was taken, or the number of seconds until the
+        next token.
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+def _empty_response(start_response, status, headers):
+    headers.append(("Content-Type", "text/plain; charset=utf-8"))
+    headers.append(("Content-Length", "0"))
+    start_response(status, headers)
+    return []
+
+
+class AdmissionControl(object):
+    """
+    A WSGI middleware limiting the concurrent requests, and throttling the
+    clients of the `rate_limit` preference.
+    """
+
+    def __init__(self, application, max_concurrent=None, max_queue=0, queue_timeout=1.0,
+                 retry_after=1, max_clients=65536, extra_stats=None):
+        """
+        :param application: The WSGI application.
+        :param max_concurrent: (int) The largest number of requests handled at once,
+        None for no limit. Requires a threaded server.
+        :param max_queue: (int) The largest number of requests waiting for a slot.
+        :param queue_timeout: (float) The longest time in seconds a request waits
+        for a slot, before it is rejected.
+        :param retry_after: (int) The `Retry-After` seconds of the rejected requests.
+        :param max_clients: (int) The largest number of clients throttled at once,
+        the least recently seen ones are forgotten.
+        :param extra_stats: (dict) Functions returning other counters, by name, served
+        at `/_stats` too. eg: {"timemaps": single_flight.stats}
+        """
+        if max_concurrent is not None and max_concurrent < 1:
+            raise ValueError("max_concurrent must be at least 1")
+        if max_queue < 0:
+            raise ValueError("max_queue must not be negative")
+        self.application = application
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = str(int(retry_after))
+        self.max_clients = max_clients
+        self.extra_stats = extra_stats or {}
+        self.active = 0
+        self.queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.throttled = 0
+        self.peak_active = 0
+        self.peak_queued = 0
+        self._slots = threading.Condition(threading.Lock())
+        self._buckets = OrderedDict()
+        self._buckets_lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes a slot, waiting in the queue if there is room.
+        :return: (bool) False if the request is rejected.
+        """
+        with self._slots:
+            if self.max_concurrent is not None and self.active >= self.max_concurrent:
+                if self.queued >= self.max_queue:
+                    self.rejected += 1
+                    return False
+                self.queued += 1
+                self.peak_queued = max(self.peak_queued, self.queued)
+                deadline = _clock() + self.queue_timeout
+                try:
+                    while self.active >= self.max_concurrent:
+                        remaining = deadline - _clock()
+                        if remaining <= 0:
+                            self.rejected += 1
+                            self.timed_out += 1
+                            return False
+                        self._slots.wait(remaining)
+                finally:
+                    self.queued -= 1
+            self.active += 1
+            self.admitted += 1
+            self.peak_active = max(self.peak_active, self.active)
+            return True
+
+    def release(self):
+        """
+        Frees a slot taken by `acquire`, for the next queued request.
+        """
+        with self._slots:
+            self.active -= 1
+            self._slots.notify()
+
+    def throttle(self, client, rate):
+        """
+        Takes a token of the bucket of the client.
+        :param client: (str) The client, eg: its address.
+        :param rate: (float) The rate of the bucket in requests per second.
+        :return: (float) 0 if the request is allowed, or the number of seconds
+        until it would be.
+        """
+        key = (client, rate)
+        now = _clock()
+        with self._buckets_lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                bucket = TokenBucket(rate, max(1.0, rate), now)
+                if len(self._buckets) >= self.max_clients:
+                    self._buckets.popitem(last=False)
+            self._buckets[key] = bucket
+            wait = bucket.take(now)
+            if wait:
+                self.throttled += 1
+            return wait
+
+    def stats(self):
+        """
+        :return: (dict) The limits and the counters of the middleware.
+        """
+        with self._slots:
+            stats = {"pid": os.getpid(), "max_concurrent": self.max_concurrent,
+                     "max_queue": self.max_queue, "active": self.active,
+                     "queued": self.queued, "admitted": self.admitted,
+                     "rejected": self.rejected, "timed_out": self.timed_out,
+                     "throttled": self.throttled, "peak_active": self.peak_active,
+                     "peak_queued": self.peak_queued, "clients": len(self._buckets)}
+        for name, source in self.extra_stats.items():
+            stats[name] = source()
+        return stats
+
+    def _stats_response(self, environ, start_response):
+        body = json.dumps(self.stats(), sort_keys=True).encode("utf-8")
+        start_response("200 OK", [("Content-Type", "application/json"),
+                                  ("Content-Length", str(len(body))),
+                                  ("Cache-Control", "no-store")])
+        return [] if environ.get("REQUEST_METHOD") == "HEAD" else [body]
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO") == STATS_PATH:
+            # not limited, to monitor an overloaded server
+            return self._stats_response(environ, start_response)
+
+        rate = parse_rate_limit(environ.get("HTTP_PREFER"))
+        if rate is not None:
+            wait = self.throttle(environ.get("REMOTE_ADDR", ""), rate)
+            applied = RATE_LIMIT_PREFERENCE + "=" + format_rate(rate)
+            if wait:
+                return _empty_response(start_response, "429 Too Many Requests", [
+                    ("Retry-After", str(int(math.ceil(wait)))),
+                    ("Preference-Applied", applied)])
+            start_response = _applied(start_response, applied)
+
+        if not self.acquire():
+            return _empty_response(start_response, "503 Service Unavailable",
+                                   [("Retry-After", self.retry_after)])
+        try:
+            app_iter = self.application(environ, start_response)
+        except BaseException:
+            self.release()
+            raise
+        return ClosingIterator(app_iter, self.release)
+
+
+def _applied(start_response, preference):
+    """
+    Adds a preference to the `Preference-Applied` header of the response.
+    """
+    def _start_response(status, headers, exc_info=None):
+        for i, (name, value) in enumerate(headers):
+            if name.lower() == "preference-applied":
+                headers[i] = (name, value + ", " + preference)
+                break
+        else:
+            headers.append(("Preference-Applied", preference))
+        return start_response(status, headers, exc_info)
+    return _start_response
+
@@ -0,0 +1,290 @@
+# -*- coding: utf-8 -*-
+"""
+The asyncio variant of `memento_test.client.MementoSession`.
+
+The requests are sent over pooled, persistent HTTP/1.1 connections opened with
+`asyncio.open_connection`, and responses are read with their `Content-Length`
+or chunked framing. Many negotiations can run concurrently in one thread:
+ ```python
+ import asyncio
+ from memento_test.aioclient import AsyncMementoSession
+
+ async def main(uri_rs):
+     async with AsyncMementoSession() as session:
+         return await asyncio.gather(*[
+             session.negotiate("http://localhost:4000/tg/", uri_r) for uri_r in uri_rs])
+ ```
+"""
+
+import asyncio
+import codecs
+import json
+
+from urllib.parse import urlsplit, urljoin
+
+from memento_test.client import Negotiation, LinkFormatParser, MementoClientError, \
+    Response, TimeMapEntry, json_timemap_entries, lower_headers, request_headers, \
+    USER_AGENT, MAX_REDIRECTS, MAX_IDLE_CONNECTIONS, READ_CHUNK
+
+# the responses without a body
+NO_BODY_STATUSES = frozenset([204, 304])
+
+
+class _Connection(object):
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class _ResponseBody(object):
+    """
+    Reads the body of a response, with its framing.
+    """
+
+    def __init__(self, reader, length=None, chunked=False):
+        self._reader = reader
+        self._remaining = length
+        self._chunked = chunked
+        self._chunk_left = 0
+        self.done = length == 0
+
+    async def read(self, size=READ_CHUNK):
+        """
+        :return: (bytes) The next part of the body, b"" at the end.
+        """
+        if self.done:
+            return b""
+        if self._chunked:
+            if not self._chunk_left:
+                line = await self._reader.readline()
+                self._chunk_left = int(line.split(b";", 1)[0].strip(), 16)
+                if not self._chunk_left:
+                    # the trailers, up to the empty line
+                    while (await self._reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    self.done = True
+                    return b""
+            data = await self._reader.readexactly(min(size, self._chunk_left))
+            self._chunk_left -= len(data)
+            if not self._chunk_left:
+                await self._reader.readline()
+            return data
+        if self._remaining is None:
+            # delimited by the end of the connection
+            data = await self._reader.read(size)
+            self.done = not data
+            return data
+        data = await self._reader.readexactly(min(size, self._remaining))
+        self._remaining -= len(data)
+        self.done = not self._remaining
+        return data
+
+    async def read_all(self):
+        parts = []
+        while True:
+            data = await self.read()
+            if not data:
+                return b"".join(parts)
+            parts.append(data)
+
+
+class AsyncMementoSession(object):
+    """
+    A pooled, keep-alive asyncio Memento client session.
+    """
+
+    def __init__(self, timeout=10.0, max_redirects=MAX_REDIRECTS,
+                 max_idle=MAX_IDLE_CONNECTIONS, headers=None):
+        """
+        :param timeout: (float) The timeout of a request in seconds.
+        :param max_redirects: (int) The largest number of redirects of a negotiation.
+        :param max_idle: (int) The largest number of idle connections kept per host.
+        :param headers: (dict) Headers sent with every request.
+        """
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.max_idle = max_idle
+        self.headers = {"User-Agent": USER_AGENT}
+        self.headers.update(headers or {})
+        self._idle = {}
+
+    async def _connect(self, key):
+        scheme, host, port = key
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=scheme == "https"), self.timeout)
+        return _Connection(reader, writer)
+
+    def _release(self, key, conn, keep_alive):
+        idle = self._idle.setdefault(key, [])
+        if keep_alive and len(idle) < self.max_idle:
+            idle.append(conn)
+        else:
+            conn.close()
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def _exchange(self, conn, method, parts, headers):
+        target = parts.path or "/"
+        if parts.query:
+            target += "?" + parts.query
+        lines = ["%s %s HTTP/1.1" % (method, target), "Host: %s" % parts.netloc]
+        lines.extend("%s: %s" % item for item in headers.items())
+        conn.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await conn.writer.drain()
+
+        status_line = await conn.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by the server")
+        version, status = status_line.decode("latin-1").split(None, 2)[:2]
+        pairs = []
+        while True:
+            line = await conn.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            pairs.append((name.strip(), value.strip()))
+        status = int(status)
+        response_headers = lower_headers(pairs)
+
+        connection = response_headers.get("connection", "").lower()
+        keep_alive = version == "HTTP/1.1" and "close" not in connection
+        if method == "HEAD" or status in NO_BODY_STATUSES or 100 <= status < 200:
+            body = _ResponseBody(conn.reader, 0)
+        elif "chunked" in response_headers.get("transfer-encoding", "").lower():
+            body = _ResponseBody(conn.reader, chunked=True)
+        elif "content-length" in response_headers:
+            body = _ResponseBody(conn.reader, int(response_headers["content-length"]))
+        else:
+            body = _ResponseBody(conn.reader)
+            keep_alive = False
+        return status, response_headers, body, keep_alive
+
+    async def _send(self, method, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise MementoClientError("Unsupported URL: %s" % url)
+        key = (parts.scheme, parts.hostname,
+               parts.port or (443 if parts.scheme == "https" else 80))
+        while True:
+            idle = self._idle.get(key)
+            reused = bool(idle)
+            conn = idle.pop() if reused else await self._connect(key)
+            try:
+                status, response_headers, body, keep_alive = await asyncio.wait_for(
+                    self._exchange(conn, method, parts, headers), self.timeout)
+                return key, conn, status, response_headers, body, keep_alive
+            except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                conn.close()
+                # an idle connection closed by the server, retry on a new one
+                if not reused:
+                    raise
+
+    async def request(self, method, url, headers=None):
+        """
+        Sends a request on a pooled connection and reads the response.
+        :param method: (str) The HTTP method.
+        :param url: (str) The absolute URL.
+        :param headers: (dict) The headers of the request, the session headers by default.
+        :return: (Response) The response, with lower case header names.
+        """
+        key, conn, status, response_headers, body, keep_alive = \
+            await self._send(method, url, headers or self.headers)
+        try:
+            data = await asyncio.wait_for(body.read_all(), self.timeout)
+        except BaseException:
+            conn.close()
+            raise
+        self._release(key, conn, keep_alive)
+        return Response(url, status, response_headers, data)
+
+    async def negotiate(self, timegate, uri_r, accept_datetime=None, prefer=None,
+                        method="HEAD"):
+        """
+        Negotiates with a TimeGate, following its redirects to the memento.
+        See `MementoSession.negotiate`.
+        :return: (Memento) The memento, or the last response if there is none.
+        :raises: RedirectError on a redirect loop or too many redirects.
+        """
+        headers = request_headers(self.headers, accept_datetime, prefer)
+        negotiation = Negotiation(uri_r, timegate + uri_r, self.max_redirects)
+        url = negotiation.url
+        while True:
+            response = await self.request(method, url, headers)
+            url = negotiation.follow(response.status, response.headers)
+            if url is None:
+                return negotiation.memento(response.status, response.headers)
+
+    async def _timemap_page(self, url):
+        key, conn, status, response_headers, body, keep_alive = \
+            await self._send("GET", url, self.headers)
+        try:
+            if status != 200:
+                await body.read_all()
+                raise MementoClientError("TimeMap %s: HTTP %d" % (url, status))
+            if response_headers.get("content-type", "").startswith("application/json"):
+                document = json.loads((await body.read_all()).decode("utf-8"))
+                entries, next_uri = json_timemap_entries(document)
+                for entry in entries:
+                    yield entry
+                if next_uri:
+                    yield TimeMapEntry(next_uri, ["next"], None)
+            else:
+                parser = LinkFormatParser()
+                decoder = codecs.getincrementaldecoder("utf-8")()
+                while True:
+                    chunk = await asyncio.wait_for(body.read(), self.timeout)
+                    if not chunk:
+                        break
+                    for entry in parser.feed(decoder.decode(chunk)):
+                        yield entry
+                for entry in parser.feed(decoder.decode(b"", True)) + parser.close():
+                    yield entry
+        except BaseException:
+            conn.close()
+            raise
+        self._release(key, conn, keep_alive)
+
+    async def timemap(self, timemap_uri, follow_pages=True):
+        """
+        Reads a TimeMap page by page as it is received. See `MementoSession.timemap`.
+        :return: async generator of TimeMapEntry.
+        """
+        url = timemap_uri
+        seen = set()
+        while url is not None:
+            seen.add(url)
+            next_uri = None
+            async for entry in self._timemap_page(url):
+                if "next" in entry.rel:
+                    next_uri = urljoin(url, entry.uri)
+                yield entry
+            if not follow_pages or next_uri is None:
+                return
+            if next_uri in seen:
+                raise MementoClientError("TimeMap page loop at %s" % next_uri)
+            url = next_uri
+
+    async def mementos(self, timemap_uri, follow_pages=True):
+        """
+        :return: async generator of the TimeMapEntry of the mementos of the TimeMap.
+        """
+        async for entry in self.timemap(timemap_uri, follow_pages):
+            if "memento" in entry.rel:
+                yield entry
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+The asyncio variant of `memento_test.singleflight.SingleFlight`, in its own
+module so that the server does not import coroutines:
+ ```python
+ from memento_test.aiosingleflight import AsyncSingleFlight
+
+ flight = AsyncSingleFlight()
+ timemap = await flight.do(key, loop.run_in_executor, None, serialize, uri_r)
+ ```
+"""
+
+import asyncio
+
+from memento_test.singleflight import _FlightStats
+
+
+class AsyncSingleFlight(_FlightStats):
+    """
+    Coalesces the identical computations of concurrent asyncio tasks. The
+    computation runs in its own task, so that it is not cancelled with the
+    task that started it while others wait for it.
+    """
+
+    def __init__(self):
+        _FlightStats.__init__(self)
+        self._calls = {}
+
+    async def do(self, key, fn, *args):
+        """
+        Awaits `fn(*args)`, unless a call with the same key is in flight, in which
+        case its result is returned when it is ready.
+        :param key: (hashable) The identity of the computation.
+        :param fn: A function returning an awaitable, eg: a coroutine function or
+        `loop.run_in_executor` for blocking functions.
+        :param args: The arguments of `fn`.
+        :return: The result of the awaitable.
+        :raises: the exception of the awaitable, in every waiting task.
+        """
+        self.calls += 1
+        task = self._calls.get(key)
+        if task is None:
+            self.executions += 1
+            task = self._calls[key] = asyncio.ensure_future(fn(*args))
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled() and task.exception() is not None:
+            self.errors += 1
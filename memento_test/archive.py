@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+"""
+Compact, array backed memento timelines and a deterministic synthetic archive.
+
+A timeline is the sorted list of memento datetimes of a single URI-R. Timelines
+are stored as `array('q')` epoch seconds (8 bytes per memento), or as NumPy
+`datetime64[s]` arrays sharing the same buffer when NumPy is available and
+requested. No per-memento Python objects are created.
+
+For example, to serve a synthetic archive:
+ ```python
+ from memento_test.archive import SyntheticArchive
+ from memento_test.server import create_application
+
+ archive = SyntheticArchive(seed=42, density=120)
+ application = create_application(archive=archive)
+ ```
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from datetime import datetime, date, timedelta
+import calendar
+import hashlib
+import random
+import threading
+import time
+
+from memento_test.singleflight import SingleFlight
+from memento_test.surt import surt
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+EPOCH = datetime(1970, 1, 1)
+SECONDS_PER_YEAR = 31556952
+
+HTTP_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+HTTP_MONTHS = (None, "Jan", "Feb", "Mar", "Apr", "May", "Jun",
+               "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def to_epoch(dt):
+    """
+    Converts a date or a naive datetime object to epoch seconds.
+    eg: datetime(2001, 1, 1) -> 978307200
+    :param dt: (date|datetime) The date to convert.
+    :return: (int) seconds since 1970-01-01T00:00:00.
+    """
+    if dt is None:
+        return
+    return calendar.timegm(dt.timetuple())
+
+
+def from_epoch(seconds):
+    """
+    Converts epoch seconds to a naive datetime object.
+    eg: 978307200 -> datetime(2001, 1, 1)
+    :param seconds: (int) seconds since 1970-01-01T00:00:00.
+    :return: (datetime) The datetime object.
+    """
+    return EPOCH + timedelta(seconds=int(seconds))
+
+
+def http_date(seconds):
+    """
+    Formats epoch seconds in the HTTP date format without going through
+    `strftime`, which is locale dependent and slow.
+    eg: 978307200 -> "Mon, 01 Jan 2001 00:00:00 GMT"
+    :param seconds: (int) seconds since 1970-01-01T00:00:00.
+    :return: (str) The date in HTTP format.
+    """
+    t = time.gmtime(seconds)
+    return "%s, %02d %s %04d %02d:%02d:%02d GMT" % (
+        HTTP_WEEKDAYS[t.tm_wday], t.tm_mday, HTTP_MONTHS[t.tm_mon],
+        t.tm_year, t.tm_hour, t.tm_min, t.tm_sec)
+
+
+def archive_timestamp(seconds):
+    """
+    Formats epoch seconds as the 14 digit timestamp used in memento URLs.
+    eg: 978307200 -> "20010101000000"
+    :param seconds: (int) seconds since 1970-01-01T00:00:00.
+    :return: (str) The timestamp.
+    """
+    return "%04d%02d%02d%02d%02d%02d" % time.gmtime(seconds)[:6]
+
+
+def iso_date(seconds):
+    """
+    Formats epoch seconds as an ISO 8601 UTC datetime, as used by JSON TimeMaps.
+    eg: 978307200 -> "2001-01-01T00:00:00Z"
+    :param seconds: (int) seconds since 1970-01-01T00:00:00.
+    :return: (str) The datetime.
+    """
+    return "%04d-%02d-%02dT%02d:%02d:%02dZ" % time.gmtime(seconds)[:6]
+
+
+def timeline_epochs(timeline):
+    """
+    Returns an integer view of a timeline, without copying it.
+    :param timeline: (array|memoryview|numpy.ndarray) The timeline.
+    :return: A sequence of epoch seconds.
+    """
+    if numpy is not None and isinstance(timeline, numpy.ndarray):
+        return timeline.view(numpy.int64)
+    return timeline
+
+
+def bisect_timeline(timeline, seconds, right=False):
+    """
+    Binary searches a timeline for a datetime.
+    :param timeline: The timeline to search.
+    :param seconds: (int) epoch seconds to look for.
+    :param right: (bool) Return the insertion point after any equal entries.
+    :return: (int) The insertion point of `seconds` in the timeline.
+    """
+    epochs = timeline_epochs(timeline)
+    if numpy is not None and isinstance(epochs, numpy.ndarray):
+        return int(epochs.searchsorted(seconds, "right" if right else "left"))
+    if right:
+        return bisect_right(epochs, seconds)
+    return bisect_left(epochs, seconds)
+
+
+def closest_memento(timeline, seconds):
+    """
+    Finds the memento closest to a datetime, the way a TimeGate would.
+    Ties are resolved in favour of the earlier memento.
+    :param timeline: The timeline to search.
+    :param seconds: (int) The requested datetime in epoch seconds.
+    :return: (int) The epoch seconds of the closest memento, or None.
+    """
+    epochs = timeline_epochs(timeline)
+    if not len(epochs):
+        return
+    i = bisect_timeline(timeline, seconds)
+    if i == 0:
+        return int(epochs[0])
+    if i == len(epochs):
+        return int(epochs[-1])
+    before = int(epochs[i - 1])
+    after = int(epochs[i])
+    if after - seconds < seconds - before:
+        return after
+    return before
+
+
+def timeline_nbytes(timeline):
+    """
+    The number of bytes used by the memento datetimes of a timeline.
+    :param timeline: The timeline.
+    :return: (int) bytes.
+    """
+    if timeline is None:
+        return 0
+    if isinstance(timeline, array):
+        return len(timeline) * timeline.itemsize
+    return timeline.nbytes
+
+
+def _store(epochs, use_numpy=False):
+    """
+    Wraps an `array('q')` in the requested storage type.
+    A NumPy array shares the buffer of the array, no copy is made.
+    """
+    if use_numpy and numpy is not None:
+        return numpy.frombuffer(epochs, dtype=numpy.int64).view("datetime64[s]")
+    return epochs
+
+
+class MementoIndex(object):
+    """
+    An in-memory URI-R -> timeline index.
+
+    Each timeline is kept as a single sorted `array('q')` of epoch seconds, or
+    as a NumPy `datetime64[s]` array when `use_numpy` is set and NumPy is installed.
+    The URI-Rs are keyed by their SURT, so that the equivalent forms of a URI-R
+    share a timeline, see `memento_test.surt`.
+    """
+
+    def __init__(self, use_numpy=False):
+        self.use_numpy = use_numpy
+        self._timelines = {}
+
+    def add(self, uri_r, datetimes):
+        """
+        Adds or replaces the timeline of a URI-R.
+        :param uri_r: (str) The URI-R.
+        :param datetimes: An iterable of epoch seconds, dates or datetimes.
+        """
+        epochs = array("q", sorted(set(
+            d if isinstance(d, int) else to_epoch(d) for d in datetimes)))
+        self._timelines[surt(uri_r)] = _store(epochs, self.use_numpy)
+
+    def add_timeline(self, uri_r, epochs):
+        """
+        Adds or replaces the timeline of a URI-R with a prebuilt timeline.
+        :param uri_r: (str) The URI-R.
+        :param epochs: (array) sorted, unique epoch seconds in an `array('q')`.
+        """
+        self._timelines[surt(uri_r)] = _store(epochs, self.use_numpy)
+
+    def timeline(self, uri_r):
+        """
+        :param uri_r: (str) The URI-R, or its SURT.
+        :return: The timeline of the URI-R, or None if it is not archived.
+        """
+        return self._timelines.get(surt(uri_r))
+
+    def uris(self):
+        """
+        :return: iterator of the SURTs of the archived URI-Rs.
+        """
+        return iter(self._timelines)
+
+    def nbytes(self):
+        """
+        :return: (int) The number of bytes used by all the memento datetimes.
+        """
+        return sum(timeline_nbytes(t) for t in self._timelines.values())
+
+    def memento_count(self):
+        return sum(len(t) for t in self._timelines.values())
+
+    def __contains__(self, uri_r):
+        return surt(uri_r) in self._timelines
+
+    def __len__(self):
+        return len(self._timelines)
+
+
+class SyntheticArchive(object):
+    """
+    A deterministic archive whose timelines are generated on demand.
+
+    The timeline of a URI-R only depends on the `seed`, the URI-R and the
+    generator settings, so any number of URI-Rs can be served without
+    materializing them. Mementos are created by a Poisson process of
+    `density` mementos per year between `first_datetime` and `last_datetime`
+    (default: now, in UTC), interrupted by gaps and sped up by bursts:
+
+    * `burst_probability`: the chance that a memento starts a burst of up to
+    `burst_size` mementos, `burst_spacing` seconds apart on average.
+    * `gap_probability`: the chance that the crawler goes away for
+    `gap_length` seconds on average instead of creating a memento.
+    * `density_spread`: the sigma of the log-normal factor applied to `density`
+    per URI-R, so that some URI-Rs are much more popular than others.
+    * `coverage`: the fraction of the URI-Rs that are archived, the others have
+    no timeline, eg: to test the "not archived" answers of a TimeGate.
+
+    Recently generated timelines are kept in an LRU of `cache_size` entries. The
+    concurrent misses of a URI-R share a single generation, see `single_flight`.
+    The equivalent forms of a URI-R have the same SURT, and the same timeline.
+    """
+
+    def __init__(self, seed=0, first_datetime=date(2001, 1, 1),
+                 last_datetime=None, density=50.0, density_spread=1.0,
+                 burst_probability=0.02, burst_size=25, burst_spacing=60,
+                 gap_probability=0.005, gap_length=90 * 86400,
+                 max_mementos=1000000, use_numpy=False, cache_size=1024, coverage=1.0):
+        if density <= 0:
+            raise ValueError("density must be positive, got %s" % density)
+        if burst_probability > 0 and burst_spacing <= 0:
+            raise ValueError("burst_spacing must be positive, got %s" % burst_spacing)
+        if gap_probability > 0 and gap_length <= 0:
+            raise ValueError("gap_length must be positive, got %s" % gap_length)
+        if not 0 <= coverage <= 1:
+            raise ValueError("coverage must be between 0 and 1, got %s" % coverage)
+
+        self.seed = seed
+        self.first_datetime = first_datetime
+        # epochs are UTC, so "now" must be too
+        self.last_datetime = last_datetime or datetime.utcnow()
+        self.density = density
+        self.density_spread = density_spread
+        self.burst_probability = burst_probability
+        self.burst_size = burst_size
+        self.burst_spacing = burst_spacing
+        self.gap_probability = gap_probability
+        self.gap_length = gap_length
+        self.max_mementos = max_mementos
+        self.use_numpy = use_numpy
+        self.cache_size = cache_size
+        self.coverage = coverage
+
+        self._start = to_epoch(first_datetime)
+        self._end = to_epoch(self.last_datetime)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        # coalesces the generations of the concurrent misses
+        self.single_flight = SingleFlight()
+
+    def _uri_seed(self, uri_r):
+        key = ("%s\x00%s" % (self.seed, surt(uri_r))).encode("utf-8")
+        return int.from_bytes(hashlib.md5(key).digest()[:8], "big")
+
+    def generate(self, uri_r):
+        """
+        Generates the timeline of a URI-R, bypassing the cache.
+        :param uri_r: (str) The URI-R.
+        :return: (array) sorted epoch seconds.
+        """
+        rng = random.Random(self._uri_seed(uri_r))
+        rate = self.density / float(SECONDS_PER_YEAR)
+        if self.density_spread:
+            rate *= rng.lognormvariate(0, self.density_spread)
+
+        epochs = array("q")
+        append = epochs.append
+        end = self._end
+        limit = self.max_mementos
+        t = self._start + rng.expovariate(rate)
+        last = self._start - 1
+
+        while t < end and len(epochs) < limit:
+            if rng.random() < self.gap_probability:
+                t += rng.expovariate(1.0 / self.gap_length)
+                continue
+            last = max(int(t), last + 1)
+            append(last)
+            if rng.random() < self.burst_probability:
+                for _ in range(rng.randint(1, self.burst_size)):
+                    t += 1 + rng.expovariate(1.0 / self.burst_spacing)
+                    if t >= end or len(epochs) >= limit:
+                        break
+                    last = max(int(t), last + 1)
+                    append(last)
+            t += rng.expovariate(rate)
+
+        if not epochs:
+            # every URI-R of a synthetic archive has at least one memento
+            append(int(self._start + rng.random() * (end - self._start)))
+        return epochs
+
+    def timeline(self, uri_r):
+        """
+        :param uri_r: (str) The URI-R.
+        :return: The timeline of the URI-R, or None if it is not archived.
+        """
+        if self.coverage < 1 and uri_r not in self:
+            return None
+        key = surt(uri_r)
+        with self._lock:
+            timeline = self._cache.get(key)
+            if timeline is not None:
+                self._cache.move_to_end(key)
+                return timeline
+        return self.single_flight.do(key, self._generate_cached, key)
+
+    def _generate_cached(self, uri_r):
+        timeline = _store(self.generate(uri_r), self.use_numpy)
+        with self._lock:
+            self._cache[uri_r] = timeline
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return timeline
+
+    def uris(self, count):
+        """
+        A deterministic list of URI-Rs for this archive, useful as test input.
+        :param count: (int) The number of URI-Rs.
+        :return: generator of URI-R strings.
+        """
+        rng = random.Random(self.seed)
+        for i in range(count):
+            yield "http://www.site%d.example.com/page/%d" % (
+                rng.randint(0, count // 10 + 1), i)
+
+    def materialize(self, uri_rs):
+        """
+        Generates the timelines of the archived URI-Rs into a MementoIndex.
+        :param uri_rs: An iterable of URI-Rs.
+        :return: (MementoIndex) The index.
+        """
+        index = MementoIndex(use_numpy=self.use_numpy)
+        for uri_r in uri_rs:
+            if uri_r not in self:
+                continue
+            index.add_timeline(uri_r, self.generate(uri_r))
+        return index
+
+    def __contains__(self, uri_r):
+        if self.coverage >= 1:
+            return True
+        # a hash of the URI-R independent of its timeline, uniform in [0, 1)
+        key = ("coverage\x00%s\x00%s" % (self.seed, surt(uri_r))).encode("utf-8")
+        return int.from_bytes(hashlib.md5(key).digest()[:8], "big") < self.coverage * 2 ** 64
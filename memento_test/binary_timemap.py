@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+A compact binary TimeMap, for bulk harvesters.
+
+A link-format TimeMap repeats the base URI of the archive, the URI-R and a
+29 byte HTTP date in every entry. The binary TimeMap has a single header with
+the URIs, followed by the memento datetimes delta-encoded as varints: the
+datetime of the first memento of the page, then the seconds since the previous
+memento, usually 1 to 4 bytes per memento.
+
+    magic       b"MTTM"
+    version     1 byte
+    flags       1 byte, FLAG_ORIGINAL when the original URI is a link of the TimeMap
+    strings     the URI-R, the base URI of the mementos, the URIs of the TimeMap,
+                the TimeGate, the previous and the next pages ("" for none), each a
+                varint length and UTF-8 bytes
+    total       varint, the number of mementos of the whole timeline
+    start       varint, the index of the first memento of the page
+    count       varint, the number of mementos of the page
+    first, last zigzag varints, the first and last epochs of the timeline (if total)
+    mementos    a zigzag varint epoch, then count - 1 varint deltas (if count)
+
+The URI of a memento is the base URI, its 14 digit timestamp, "/" and the URI-R.
+The TimeMaps are served when the `Accept` header of a TimeMap request names
+`BINARY_TIMEMAP_MIMETYPE`, and read with `decode_binary_timemap`:
+ ```python
+ from memento_test.binary_timemap import decode_binary_timemap, BINARY_TIMEMAP_MIMETYPE
+
+ response = session.request("GET", "http://localhost:4000/timemap/link/http://www.espn.com",
+                            headers={"Accept": BINARY_TIMEMAP_MIMETYPE})
+ timemap = decode_binary_timemap(response.body)
+ uris = [timemap.memento_uri(seconds) for seconds in timemap.epochs]
+ ```
+"""
+
+from array import array
+from collections import namedtuple
+import struct
+
+from memento_test.archive import timeline_epochs, archive_timestamp, numpy
+
+BINARY_TIMEMAP_MIMETYPE = "application/x-memento-timemap"
+BINARY_MAGIC = b"MTTM"
+BINARY_VERSION = 1
+FLAG_ORIGINAL = 1
+
+# mementos per chunk of the response body
+BINARY_CHUNK_ENTRIES = 65536
+
+_PREAMBLE = struct.Struct("<4sBB")
+
+
+class BinaryTimeMapError(ValueError):
+    pass
+
+
+class BinaryTimeMap(namedtuple("BinaryTimeMap", [
+        "uri_r", "host_name", "timemap_uri", "timegate_uri", "pages", "original",
+        "total", "start", "first", "last", "epochs"])):
+    """
+    A decoded binary TimeMap.
+    uri_r: (str) The URI-R.
+    host_name: (str) The base URI of the mementos.
+    timemap_uri, timegate_uri: (str) The URIs of the TimeMap and of the TimeGate.
+    pages: (dict) The URIs of the "prev" and "next" pages, if any.
+    original: (bool) The original URI is a link of the TimeMap.
+    total: (int) The number of mementos of the whole timeline.
+    start: (int) The index in the timeline of the first memento of the page.
+    first, last: (int) The first and last epochs of the timeline, or None.
+    epochs: (array) The epoch seconds of the mementos of the page.
+    """
+    __slots__ = ()
+
+    def memento_uri(self, seconds):
+        return "%s%s/%s" % (self.host_name, archive_timestamp(int(seconds)), self.uri_r)
+
+
+def _varint(value, out):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+
+
+def _string(value, out):
+    data = value.encode("utf-8")
+    _varint(len(data), out)
+    out.extend(data)
+
+
+def _header(uri_r, epochs, host_name, timemap_uri, timegate_uri, original, pages,
+            start, count):
+    out = bytearray(_PREAMBLE.pack(BINARY_MAGIC, BINARY_VERSION,
+                                   FLAG_ORIGINAL if original else 0))
+    pages = pages or {}
+    for value in (uri_r, host_name, timemap_uri, timegate_uri, pages.get("prev") or "",
+                  pages.get("next") or ""):
+        _string(value, out)
+    _varint(len(epochs), out)
+    _varint(start, out)
+    _varint(count, out)
+    if len(epochs):
+        _varint(_zigzag(int(epochs[0])), out)
+        _varint(_zigzag(int(epochs[-1])), out)
+    return out
+
+
+def _deltas(epochs, start, stop):
+    """
+    Encodes the mementos between start and stop, in chunks.
+    """
+    previous = int(epochs[start])
+    out = bytearray()
+    _varint(_zigzag(previous), out)
+    for chunk_start in range(start + 1, stop, BINARY_CHUNK_ENTRIES):
+        for i in range(chunk_start, min(chunk_start + BINARY_CHUNK_ENTRIES, stop)):
+            seconds = int(epochs[i])
+            delta = seconds - previous
+            if delta < 0:
+                raise ValueError("The timeline is not sorted")
+            previous = seconds
+            while delta > 0x7f:
+                out.append((delta & 0x7f) | 0x80)
+                delta >>= 7
+            out.append(delta)
+        yield bytes(out)
+        out = bytearray()
+    if out:
+        yield bytes(out)
+
+
+def binary_timemap(uri_r, timeline, host_name, timemap_uri, timegate_uri, original=True,
+                   invalid=False, start=0, stop=None, pages=None):
+    """
+    Serializes a timeline as a binary TimeMap.
+    :param uri_r: (str) The URI-R.
+    :param timeline: The sorted timeline of the URI-R.
+    :param host_name: (str) The base URI of the archive, with a trailing slash.
+    :param timemap_uri: (str) The URI of this TimeMap.
+    :param timegate_uri: (str) The URI of the TimeGate for the URI-R.
+    :param original: (bool) Include the original URI as a link.
+    :param invalid: (bool) Produce a truncated TimeMap, that cannot be decoded.
+    :param start: (int) The index of the first memento of the page.
+    :param stop: (int) The index after the last memento of the page, None for the end.
+    :param pages: (dict) The URIs of the "prev" and "next" pages, if any.
+    :return: generator of bytes.
+    """
+    epochs = timeline_epochs(timeline)
+    start, stop, step = slice(start, stop).indices(len(epochs))
+    count = max(0, stop - start)
+    # an invalid TimeMap announces one more memento than it has
+    yield bytes(_header(uri_r, epochs, host_name, timemap_uri, timegate_uri, original,
+                        pages, start, count + 1 if invalid else count))
+    if count:
+        for chunk in _deltas(epochs, start, stop):
+            yield chunk
+
+
+def binary_timemap_length(uri_r, timeline, host_name, timemap_uri, timegate_uri,
+                          original=True, invalid=False, start=0, stop=None, pages=None):
+    """
+    The length in bytes of the TimeMap of `binary_timemap` with the same arguments,
+    computed from the sizes of the deltas without encoding them.
+    :return: (int) The length of the TimeMap.
+    """
+    epochs = timeline_epochs(timeline)
+    start, stop, step = slice(start, stop).indices(len(epochs))
+    count = max(0, stop - start)
+    length = len(_header(uri_r, epochs, host_name, timemap_uri, timegate_uri, original,
+                         pages, start, count + 1 if invalid else count))
+    if count:
+        length += _varint_length(_zigzag(int(epochs[start])))
+        length += _deltas_length(epochs, start, stop)
+    return length
+
+
+def _varint_length(value):
+    return max(1, (value.bit_length() + 6) // 7)
+
+
+def _deltas_length(epochs, start, stop):
+    if numpy is not None and stop - start > 1:
+        deltas = numpy.diff(numpy.frombuffer(epochs, dtype=numpy.int64)[start:stop])
+        # one byte, and one more for each 7 bits over the first 7 bits
+        return int(len(deltas) + sum(int(numpy.count_nonzero(deltas >> shift))
+                                     for shift in range(7, 63, 7)))
+    return sum(_varint_length(int(epochs[i]) - int(epochs[i - 1]))
+               for i in range(start + 1, stop))
+
+
+class _Reader(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def varint(self):
+        data = self.data
+        pos = self.pos
+        value = 0
+        shift = 0
+        try:
+            while True:
+                byte = data[pos]
+                pos += 1
+                value |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+        except IndexError:
+            raise BinaryTimeMapError("Truncated binary TimeMap")
+        self.pos = pos
+        return value
+
+    def zigzag(self):
+        value = self.varint()
+        return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+    def string(self):
+        length = self.varint()
+        end = self.pos + length
+        if end > len(self.data):
+            raise BinaryTimeMapError("Truncated binary TimeMap")
+        value = bytes(self.data[self.pos:end]).decode("utf-8")
+        self.pos = end
+        return value
+
+
+def decode_binary_timemap(data):
+    """
+    Decodes a binary TimeMap.
+    :param data: (bytes) The binary TimeMap.
+    :return: (BinaryTimeMap) The TimeMap.
+    :raises: BinaryTimeMapError if the data is not a valid binary TimeMap.
+    """
+    if len(data) < _PREAMBLE.size:
+        raise BinaryTimeMapError("Truncated binary TimeMap")
+    magic, version, flags = _PREAMBLE.unpack_from(data, 0)
+    if magic != BINARY_MAGIC:
+        raise BinaryTimeMapError("Not a binary TimeMap")
+    if version != BINARY_VERSION:
+        raise BinaryTimeMapError("Unsupported binary TimeMap version %d" % version)
+    reader = _Reader(data)
+    reader.pos = _PREAMBLE.size
+    uri_r, host_name, timemap_uri, timegate_uri, prev, next_uri = \
+        [reader.string() for _ in range(6)]
+    total = reader.varint()
+    start = reader.varint()
+    count = reader.varint()
+    first = last = None
+    if total:
+        first = reader.zigzag()
+        last = reader.zigzag()
+    if start + count > total:
+        raise BinaryTimeMapError("Invalid page of %d mementos at %d of %d" % (
+            count, start, total))
+
+    epochs = array("q")
+    if count:
+        seconds = reader.zigzag()
+        epochs.append(seconds)
+        append = epochs.append
+        pos = reader.pos
+        end = len(data)
+        for _ in range(count - 1):
+            if pos >= end:
+                raise BinaryTimeMapError("Truncated binary TimeMap")
+            byte = data[pos]
+            pos += 1
+            if byte < 0x80:
+                seconds += byte
+            else:
+                reader.pos = pos - 1
+                seconds += reader.varint()
+                pos = reader.pos
+            append(seconds)
+        reader.pos = pos
+    if reader.pos != len(data):
+        raise BinaryTimeMapError("%d trailing bytes" % (len(data) - reader.pos))
+
+    pages = {}
+    if prev:
+        pages["prev"] = prev
+    if next_uri:
+        pages["next"] = next_uri
+    return BinaryTimeMap(uri_r, host_name, timemap_uri, timegate_uri, pages,
+                         bool(flags & FLAG_ORIGINAL), total, start, first, last, epochs)
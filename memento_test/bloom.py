@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+A Bloom filter of the URI-Rs of an archive, for fast "not archived" answers.
+
+Most of the TimeGate requests for URI-Rs that were never archived would probe
+the whole index, eg: a binary search over the memory-mapped keys of a shared
+index. The filter answers them in constant time, with `hashes` bit lookups:
+a URI-R that is not in the filter is definitely not archived, a URI-R that is
+in the filter is archived, or a false positive that the index lookup rejects.
+
+The filter is a flat bit array, so that it can be packed into an index file
+and memory-mapped with it, see `memento_test.shared_index`:
+ ```python
+ from memento_test.bloom import BloomFilter
+
+ bloom = BloomFilter.for_capacity(len(index), error_rate=0.01)
+ for uri_r in index.uris():
+     bloom.add(uri_r)
+ "http://www.espn.com" in bloom  # False: definitely not archived
+ ```
+"""
+
+import hashlib
+import math
+
+# the default rate of false positives, about 9.6 bits and 7 hashes per URI-R
+DEFAULT_ERROR_RATE = 0.01
+
+
+class BloomFilter(object):
+    """
+    A Bloom filter of strings, over a bit array of `bits` bits, a multiple of 64.
+    The `hashes` bit positions of a key are derived from a single 128 bit digest
+    by double hashing.
+    """
+
+    def __init__(self, bits, hashes, buf=None):
+        """
+        :param bits: (int) The number of bits of the filter, a multiple of 64.
+        :param hashes: (int) The number of bits set per key.
+        :param buf: A buffer of bits // 8 bytes holding the filter, eg: a view of
+        a memory-mapped index, or None for an empty filter.
+        """
+        if bits <= 0 or bits % 64:
+            raise ValueError("bits must be a positive multiple of 64, got %s" % bits)
+        if hashes <= 0:
+            raise ValueError("hashes must be positive, got %s" % hashes)
+        self.bits = bits
+        self.hashes = hashes
+        self._bytes = bytearray(bits // 8) if buf is None else memoryview(buf).cast("B")
+        if len(self._bytes) != bits // 8:
+            raise ValueError("A filter of %d bits needs %d bytes, got %d" % (
+                bits, bits // 8, len(self._bytes)))
+
+    @classmethod
+    def for_capacity(cls, count, error_rate=DEFAULT_ERROR_RATE):
+        """
+        An empty filter sized for a number of keys and a rate of false positives.
+        eg: 1000000 keys at 0.01 -> 9585088 bits (1.2MB) and 7 hashes
+        :param count: (int) The number of keys.
+        :param error_rate: (float) The rate of false positives, between 0 and 1.
+        :return: (BloomFilter) The filter.
+        """
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1, got %s" % error_rate)
+        count = max(count, 1)
+        bits = int(math.ceil(-count * math.log(error_rate) / math.log(2) ** 2))
+        bits = max(64, (bits + 63) // 64 * 64)
+        hashes = max(1, int(round(bits / float(count) * math.log(2))))
+        return cls(bits, hashes)
+
+    def _positions(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        # odd, so that the positions do not repeat for a power of two of bits
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        bits = self.bits
+        return [(h1 + i * h2) % bits for i in range(self.hashes)]
+
+    def add(self, key):
+        """
+        :param key: (str) The key, eg: a URI-R.
+        """
+        data = self._bytes
+        for position in self._positions(key):
+            data[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        position = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        bits = self.bits
+        data = self._bytes
+        # most keys that are not in the filter fail on the first bits
+        for _ in range(self.hashes):
+            position %= bits
+            if not data[position >> 3] & (1 << (position & 7)):
+                return False
+            position += step
+        return True
+
+    def tobytes(self):
+        """
+        :return: (bytes) The bit array of the filter.
+        """
+        return bytes(self._bytes)
+
+    def release(self):
+        """
+        Releases the view of the buffer of the filter, if any.
+        """
+        if isinstance(self._bytes, memoryview):
+            self._bytes.release()
@@ -0,0 +1,337 @@
+# -*- coding: utf-8 -*-
+"""
+A Memento conformance checker for TimeGates.
+
+Each URI-R is looked up at the TimeGate, the response is validated against
+the rules that the Prefer scenarios of the test server break, and the
+memento the TimeGate redirects to is validated in turn. The errors are named
+after the scenarios, eg: a TimeGate that does not send `Vary` is reported
+with the error `no_vary_header`.
+
+The URI-Rs are checked by a bounded pool of threads. Each thread keeps one
+persistent HTTP connection per host, so the TCP and TLS handshakes are not
+paid per request.
+
+For example:
+ ```python
+ from memento_test.checker import ConformanceChecker
+
+ checker = ConformanceChecker("http://localhost:4000/tg/", concurrency=32)
+ for report in checker.reports(["http://www.espn.com"]):
+     print(report["valid"], report["errors"])
+ ```
+"""
+
+import json
+import logging
+import threading
+import time
+
+try:
+    import http.client as httplib
+    from urllib.parse import urljoin, urlsplit
+except ImportError:
+    import httplib
+    from urlparse import urljoin, urlsplit
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from memento_test.server import parse_link_header, get_uri_dt_for_rel, convert_to_datetime
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = "memento_test_check"
+
+_STOP = object()
+
+
+def _valid_datetime(value):
+    try:
+        return convert_to_datetime(value) is not None
+    except ValueError:
+        return False
+
+
+def check_link_header(link, errors):
+    """
+    Validates a `Link` header: it must be parseable, have a rel="original" URI and
+    valid datetimes.
+    :param link: (str) The value of the Link header, or None.
+    :param errors: (list) The errors found are appended to this list.
+    :return: (dict) the parsed link header, or None.
+    """
+    if not link:
+        errors.append("no_link_header")
+        return
+    try:
+        links = parse_link_header(link)
+    except (ValueError, IndexError):
+        errors.append("invalid_link_header")
+        return
+    if not get_uri_dt_for_rel(links, ["original"]):
+        errors.append("no_original_link_header")
+    for uri in links:
+        if not all(_valid_datetime(dt) for dt in links[uri].get("datetime", [])):
+            errors.append("invalid_datetime_in_link_header")
+            break
+    return links
+
+
+def _check_memento_datetime(headers, errors, required=True):
+    mem_dt = headers.get("memento-datetime")
+    if mem_dt is None:
+        if required:
+            errors.append("no_memento_dt_header")
+    elif not _valid_datetime(mem_dt):
+        errors.append("invalid_memento_dt_header")
+
+
+def check_timegate_response(status, headers):
+    """
+    Validates the response of a TimeGate.
+    :param status: (int) The HTTP status of the response.
+    :param headers: (dict) The headers of the response, with lower case names.
+    :return: (list) The errors found.
+    """
+    errors = []
+    if status not in (200, 302, 303):
+        errors.append("unexpected_status")
+        return errors
+
+    vary = headers.get("vary")
+    if vary is None:
+        errors.append("no_vary_header")
+    elif "accept-datetime" not in [v.strip().lower() for v in vary.split(",")]:
+        errors.append("invalid_vary_header")
+
+    check_link_header(headers.get("link"), errors)
+
+    if status == 200:
+        # 200-style TimeGate, the TimeGate is also the memento
+        if not headers.get("content-location"):
+            errors.append("no_content_location_header")
+        _check_memento_datetime(headers, errors)
+    else:
+        if not headers.get("location"):
+            errors.append("no_location_header")
+        if "memento-datetime" in headers:
+            errors.append("unexpected_memento_dt_header")
+    return errors
+
+
+def check_memento_response(status, headers):
+    """
+    Validates the response of a memento, or of an archived or internal redirect.
+    :param status: (int) The HTTP status of the response.
+    :param headers: (dict) The headers of the response, with lower case names.
+    :return: (list) The errors found.
+    """
+    errors = []
+    if 300 <= status < 400:
+        if not headers.get("location"):
+            errors.append("no_location_header")
+        _check_memento_datetime(headers, errors, required=False)
+        if "memento-datetime" in headers:
+            # an archived redirect
+            check_link_header(headers.get("link"), errors)
+        return errors
+    if status != 200:
+        errors.append("unexpected_status")
+        return errors
+    _check_memento_datetime(headers, errors)
+    check_link_header(headers.get("link"), errors)
+    return errors
+
+
+class ConformanceChecker(object):
+    """
+    Checks the conformance of a TimeGate for many URI-Rs concurrently.
+    """
+
+    def __init__(self, timegate, concurrency=16, timeout=10.0, accept_datetime=None,
+                 prefer=None, follow=True, method="HEAD"):
+        """
+        :param timegate: (str) The base URL of the TimeGate, the URI-R is appended to it.
+        eg: http://localhost:4000/tg/
+        :param concurrency: (int) The number of concurrent requests.
+        :param timeout: (float) The socket timeout in seconds.
+        :param accept_datetime: (str) The Accept-Datetime of the requests, in HTTP format.
+        :param prefer: (str) The Prefer header of the requests.
+        :param follow: (bool) Also check the memento the TimeGate redirects to.
+        :param method: (str) The HTTP method of the requests.
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.timegate = timegate
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.follow = follow
+        self.method = method
+        self.headers = {"User-Agent": USER_AGENT}
+        if accept_datetime:
+            self.headers["Accept-Datetime"] = accept_datetime
+        if prefer:
+            self.headers["Prefer"] = prefer
+        self._local = threading.local()
+
+    def _connection(self, scheme, netloc):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            cls = httplib.HTTPSConnection if scheme == "https" else httplib.HTTPConnection
+            conn = connections[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+        return conn
+
+    def close(self):
+        """
+        Closes the connections of the calling thread.
+        """
+        connections = getattr(self._local, "connections", None) or {}
+        for conn in connections.values():
+            conn.close()
+        connections.clear()
+
+    def request(self, url):
+        """
+        Requests a URL on a persistent connection, reconnecting once if the
+        server closed it.
+        :param url: (str) The absolute URL.
+        :return: (int, dict) the status and the headers, with lower case names.
+        """
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        for attempt in (0, 1):
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request(self.method, path, headers=self.headers)
+                response = conn.getresponse()
+                response.read()
+            except (httplib.HTTPException, IOError, OSError):
+                conn.close()
+                del self._local.connections[(parts.scheme, parts.netloc)]
+                if attempt:
+                    raise
+                continue
+            headers = {}
+            for name, value in response.getheaders():
+                name = name.lower()
+                headers[name] = headers[name] + ", " + value if name in headers else value
+            if response.will_close:
+                conn.close()
+                del self._local.connections[(parts.scheme, parts.netloc)]
+            return response.status, headers
+
+    def check(self, uri_r):
+        """
+        Checks the TimeGate for a URI-R, and the memento it redirects to.
+        :param uri_r: (str) The URI-R.
+        :return: (dict) The report.
+        """
+        start = time.time()
+        report = {"uri_r": uri_r, "timegate": self.timegate + uri_r}
+        try:
+            status, headers = self.request(report["timegate"])
+        except (httplib.HTTPException, IOError, OSError) as e:
+            report["status"] = None
+            report["errors"] = ["connection_error"]
+            report["error"] = str(e)
+        else:
+            report["status"] = status
+            report["errors"] = check_timegate_response(status, headers)
+            location = headers.get("location")
+            if self.follow and location and status in (302, 303):
+                report["memento"] = self._check_memento(urljoin(report["timegate"], location))
+
+        report["valid"] = not report["errors"] and \
+            not report.get("memento", {}).get("errors")
+        report["elapsed_ms"] = round((time.time() - start) * 1000, 3)
+        return report
+
+    def _check_memento(self, uri_m):
+        memento = {"uri": uri_m}
+        try:
+            status, headers = self.request(uri_m)
+        except (httplib.HTTPException, IOError, OSError) as e:
+            memento["status"] = None
+            memento["errors"] = ["connection_error"]
+            memento["error"] = str(e)
+            return memento
+        memento["status"] = status
+        memento["datetime"] = headers.get("memento-datetime")
+        memento["errors"] = check_memento_response(status, headers)
+        return memento
+
+    def _work(self, tasks, results):
+        try:
+            while True:
+                uri_r = tasks.get()
+                if uri_r is _STOP:
+                    return
+                try:
+                    results.put(self.check(uri_r))
+                except Exception as e:
+                    logger.exception("Could not check %s", uri_r)
+                    results.put({"uri_r": uri_r, "status": None, "valid": False,
+                                 "errors": ["checker_error"], "error": str(e)})
+        finally:
+            self.close()
+            results.put(_STOP)
+
+    def reports(self, uri_rs):
+        """
+        Checks URI-Rs concurrently. Only `concurrency` URI-Rs are read ahead, so
+        any number of URI-Rs can be checked in constant memory.
+        Blank lines and lines starting with # are skipped.
+        :param uri_rs: iterable of str, eg: an open file.
+        :return: generator of reports, in the order they complete.
+        """
+        tasks = queue.Queue(maxsize=self.concurrency * 2)
+        results = queue.Queue()
+        workers = [threading.Thread(target=self._work, args=(tasks, results),
+                                    name="memento-check-%d" % i)
+                   for i in range(self.concurrency)]
+
+        def _feed():
+            try:
+                for uri_r in uri_rs:
+                    uri_r = uri_r.strip()
+                    if uri_r and not uri_r.startswith("#"):
+                        tasks.put(uri_r)
+            finally:
+                for _ in workers:
+                    tasks.put(_STOP)
+
+        feeder = threading.Thread(target=_feed, name="memento-check-feed")
+        for thread in workers + [feeder]:
+            thread.daemon = True
+            thread.start()
+
+        running = len(workers)
+        while running:
+            report = results.get()
+            if report is _STOP:
+                running -= 1
+                continue
+            yield report
+
+    def run(self, uri_rs, output):
+        """
+        Checks URI-Rs concurrently and writes a JSON line per URI-R.
+        :param uri_rs: iterable of str, eg: an open file.
+        :param output: a text file.
+        :return: (int, int) the number of URI-Rs checked and of invalid ones.
+        """
+        checked = invalid = 0
+        for report in self.reports(uri_rs):
+            checked += 1
+            if not report["valid"]:
+                invalid += 1
+            output.write(json.dumps(report, sort_keys=True) + "\n")
+        return checked, invalid
@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+A Memento client built on the Link header parser of the server.
+
+`MementoSession` negotiates with TimeGates and reads TimeMaps over pooled,
+persistent HTTP connections, so consecutive requests to the same archive do
+not pay a TCP handshake each. Redirects are followed up to `max_redirects`
+hops, and redirect loops are detected. TimeMaps are parsed as they are
+received, one link at a time, and paged TimeMaps (rel="next") are followed
+page by page, so a TimeMap of any size is read in constant memory.
+
+The session can be shared by threads. See `memento_test.aioclient` for the
+asyncio variant.
+
+For example:
+ ```python
+ from memento_test.client import MementoSession
+
+ with MementoSession() as session:
+     memento = session.negotiate("http://localhost:4000/tg/", "http://www.espn.com",
+                                 accept_datetime=datetime(2010, 1, 1))
+     print(memento.uri_m, memento.datetime)
+     for entry in session.mementos("http://localhost:4000/timemap/link/http://www.espn.com"):
+         print(entry.uri, entry.datetime)
+ ```
+"""
+
+from collections import namedtuple
+from datetime import datetime
+import codecs
+import json
+import re
+import threading
+
+try:
+    import http.client as httplib
+    from urllib.parse import urljoin, urlsplit
+except ImportError:
+    import httplib
+    from urlparse import urljoin, urlsplit
+
+from memento_test.server import parse_link_header, convert_to_datetime, \
+    convert_to_http_datetime
+
+USER_AGENT = "memento_test_client"
+MAX_REDIRECTS = 10
+MAX_IDLE_CONNECTIONS = 8
+READ_CHUNK = 65536
+
+REDIRECT_STATUSES = frozenset([301, 302, 303, 307, 308])
+
+Response = namedtuple("Response", "url status headers body")
+Memento = namedtuple("Memento", "uri_r uri_m datetime status headers links redirects")
+TimeMapEntry = namedtuple("TimeMapEntry", "uri rel datetime")
+
+# the characters that delimit the links of a link-format document
+_LINK_DELIMITERS = re.compile(r'[<>",]')
+
+
+class MementoClientError(Exception):
+    pass
+
+
+class RedirectError(MementoClientError):
+    """
+    Too many redirects, or a redirect loop.
+    """
+    pass
+
+
+def lower_headers(pairs):
+    """
+    :param pairs: iterable of (name, value) headers.
+    :return: (dict) The headers by lower case name, repeated headers joined with ", ".
+    """
+    headers = {}
+    for name, value in pairs:
+        name = name.lower()
+        headers[name] = headers[name] + ", " + value if name in headers else value
+    return headers
+
+
+def request_headers(base, accept_datetime=None, prefer=None):
+    """
+    :param base: (dict) The default headers.
+    :param accept_datetime: (datetime|str) The Accept-Datetime, or None.
+    :param prefer: (str) The Prefer header, or None.
+    :return: (dict) The headers of a request.
+    """
+    headers = dict(base)
+    if accept_datetime is not None:
+        if isinstance(accept_datetime, datetime):
+            accept_datetime = convert_to_http_datetime(accept_datetime)
+        headers["Accept-Datetime"] = accept_datetime
+    if prefer:
+        headers["Prefer"] = prefer
+    return headers
+
+
+class Negotiation(object):
+    """
+    The state of a TimeGate negotiation, independent of the I/O, shared by the
+    threaded and the asyncio sessions.
+    """
+
+    def __init__(self, uri_r, url, max_redirects=MAX_REDIRECTS):
+        self.uri_r = uri_r
+        self.url = url
+        self.max_redirects = max_redirects
+        self.redirects = []
+        self._seen = {url}
+
+    def follow(self, status, headers):
+        """
+        :param status: (int) The status of the response to `self.url`.
+        :param headers: (dict) The headers of the response, with lower case names.
+        :return: (str) The next URL to request, or None when done.
+        :raises: RedirectError on a loop or after `max_redirects` redirects.
+        """
+        location = headers.get("location")
+        if status not in REDIRECT_STATUSES or not location:
+            return
+        location = urljoin(self.url, location)
+        if location in self._seen:
+            raise RedirectError("Redirect loop at %s" % location)
+        if len(self.redirects) >= self.max_redirects:
+            raise RedirectError("More than %d redirects from %s" % (
+                self.max_redirects, self.redirects[0] if self.redirects else self.url))
+        self.redirects.append(location)
+        self._seen.add(location)
+        self.url = location
+        return location
+
+    def memento(self, status, headers):
+        """
+        :param status: (int) The status of the last response.
+        :param headers: (dict) The headers of the last response, with lower case names.
+        :return: (Memento) The result of the negotiation.
+        """
+        links = None
+        try:
+            links = parse_link_header(headers.get("link"))
+        except (ValueError, IndexError):
+            pass
+        memento_datetime = None
+        try:
+            memento_datetime = convert_to_datetime(headers.get("memento-datetime"))
+        except ValueError:
+            pass
+        uri_m = None
+        if memento_datetime is not None:
+            # a 200-style TimeGate is also the memento
+            uri_m = urljoin(self.url, headers.get("content-location") or self.url)
+        return Memento(self.uri_r, uri_m, memento_datetime, status, headers, links,
+                       self.redirects)
+
+
+class LinkFormatParser(object):
+    """
+    An incremental link-format parser: the text of a TimeMap is fed as it is
+    received, and the complete links are returned as TimeMapEntry tuples. Only
+    the text of an incomplete link is kept between feeds.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._scanned = 0
+        self._in_uri = False
+        self._in_quote = False
+
+    def _entry(self, text):
+        text = text.strip()
+        if not text:
+            return
+        links = parse_link_header(text)
+        for uri, params in links.items():
+            return TimeMapEntry(uri, params.get("rel", []), (params.get("datetime") or [None])[0])
+
+    def feed(self, text):
+        """
+        :param text: (str) The next part of the document.
+        :return: (list) The TimeMapEntry of the links completed by the text.
+        :raises: ValueError if a link cannot be parsed.
+        """
+        pending = self._pending + text
+        start = 0
+        entries = []
+        for match in _LINK_DELIMITERS.finditer(pending, self._scanned):
+            char = match.group()
+            if self._in_quote:
+                self._in_quote = char != '"'
+            elif self._in_uri:
+                self._in_uri = char != ">"
+            elif char == "<":
+                self._in_uri = True
+            elif char == '"':
+                self._in_quote = True
+            else:
+                entry = self._entry(pending[start:match.start()])
+                if entry is not None:
+                    entries.append(entry)
+                start = match.end()
+        self._pending = pending[start:]
+        self._scanned = len(self._pending)
+        return entries
+
+    def close(self):
+        """
+        :return: (list) The TimeMapEntry of the last link.
+        """
+        entry = self._entry(self._pending)
+        self._pending = ""
+        self._scanned = 0
+        return [entry] if entry is not None else []
+
+
+def json_timemap_entries(document):
+    """
+    :param document: (dict) A JSON TimeMap, see `memento_test.timemap.json_timemap`.
+    :return: (list, str) The TimeMapEntry of its mementos, with ISO 8601 datetimes,
+    and the URI of the next page or None.
+    """
+    mementos = document.get("mementos", {}).get("list", [])
+    entries = [TimeMapEntry(m["uri"], ["memento"], m.get("datetime")) for m in mementos]
+    return entries, document.get("pages", {}).get("next")
+
+
+class MementoSession(object):
+    """
+    A pooled, keep-alive Memento client session.
+    """
+
+    def __init__(self, timeout=10.0, max_redirects=MAX_REDIRECTS,
+                 max_idle=MAX_IDLE_CONNECTIONS, headers=None):
+        """
+        :param timeout: (float) The socket timeout in seconds.
+        :param max_redirects: (int) The largest number of redirects of a negotiation.
+        :param max_idle: (int) The largest number of idle connections kept per host.
+        :param headers: (dict) Headers sent with every request.
+        """
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.max_idle = max_idle
+        self.headers = {"User-Agent": USER_AGENT}
+        self.headers.update(headers or {})
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, netloc = key
+        cls = httplib.HTTPSConnection if scheme == "https" else httplib.HTTPConnection
+        return cls(netloc, timeout=self.timeout), False
+
+    def _release(self, key, conn, response):
+        if response.will_close:
+            conn.close()
+            return
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        """
+        Closes the idle connections.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _send(self, method, url, headers):
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            raise MementoClientError("Unsupported URL: %s" % url)
+        key = (parts.scheme, parts.netloc)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        while True:
+            conn, reused = self._acquire(key)
+            try:
+                conn.request(method, path, headers=headers)
+                return key, conn, conn.getresponse()
+            except (httplib.HTTPException, IOError, OSError):
+                conn.close()
+                # an idle connection closed by the server, retry on a new one
+                if not reused:
+                    raise
+
+    def request(self, method, url, headers=None):
+        """
+        Sends a request on a pooled connection and reads the response.
+        :param method: (str) The HTTP method.
+        :param url: (str) The absolute URL.
+        :param headers: (dict) The headers of the request, the session headers by default.
+        :return: (Response) The response, with lower case header names.
+        """
+        key, conn, response = self._send(method, url, headers or self.headers)
+        try:
+            body = response.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._release(key, conn, response)
+        return Response(url, response.status, lower_headers(response.getheaders()), body)
+
+    def negotiate(self, timegate, uri_r, accept_datetime=None, prefer=None, method="HEAD"):
+        """
+        Negotiates with a TimeGate, following its redirects to the memento.
+        :param timegate: (str) The base URL of the TimeGate, the URI-R is appended to it.
+        eg: http://localhost:4000/tg/
+        :param uri_r: (str) The URI-R.
+        :param accept_datetime: (datetime|str) The requested datetime, now by default.
+        :param prefer: (str) The Prefer header of the requests.
+        :param method: (str) The HTTP method of the requests.
+        :return: (Memento) The memento, or the last response if there is none.
+        :raises: RedirectError on a redirect loop or too many redirects.
+        """
+        headers = request_headers(self.headers, accept_datetime, prefer)
+        negotiation = Negotiation(uri_r, timegate + uri_r, self.max_redirects)
+        url = negotiation.url
+        while True:
+            response = self.request(method, url, headers)
+            url = negotiation.follow(response.status, response.headers)
+            if url is None:
+                return negotiation.memento(response.status, response.headers)
+
+    def _timemap_page(self, url):
+        key, conn, response = self._send("GET", url, self.headers)
+        try:
+            if response.status != 200:
+                response.read()
+                raise MementoClientError("TimeMap %s: HTTP %d" % (url, response.status))
+            content_type = response.getheader("Content-Type", "")
+            if content_type.startswith("application/json"):
+                entries, next_uri = json_timemap_entries(json.loads(response.read().decode("utf-8")))
+                for entry in entries:
+                    yield entry
+                if next_uri:
+                    yield TimeMapEntry(next_uri, ["next"], None)
+            else:
+                parser = LinkFormatParser()
+                decoder = codecs.getincrementaldecoder("utf-8")()
+                while True:
+                    chunk = response.read(READ_CHUNK)
+                    if not chunk:
+                        break
+                    for entry in parser.feed(decoder.decode(chunk)):
+                        yield entry
+                for entry in parser.feed(decoder.decode(b"", True)) + parser.close():
+                    yield entry
+        except BaseException:
+            conn.close()
+            raise
+        self._release(key, conn, response)
+
+    def timemap(self, timemap_uri, follow_pages=True):
+        """
+        Reads a TimeMap, link-format or JSON, page by page as it is received.
+        :param timemap_uri: (str) The URI of the TimeMap, or of its first page.
+        :param follow_pages: (bool) Also read the next pages of a paged TimeMap.
+        :return: generator of TimeMapEntry, the links of the TimeMap (the original,
+        the TimeGate, the pages and the mementos).
+        :raises: MementoClientError if a page is not found or the pages loop.
+        """
+        url = timemap_uri
+        seen = set()
+        while url is not None:
+            seen.add(url)
+            next_uri = None
+            for entry in self._timemap_page(url):
+                if "next" in entry.rel:
+                    next_uri = urljoin(url, entry.uri)
+                yield entry
+            if not follow_pages or next_uri is None:
+                return
+            if next_uri in seen:
+                raise MementoClientError("TimeMap page loop at %s" % next_uri)
+            url = next_uri
+
+    def mementos(self, timemap_uri, follow_pages=True):
+        """
+        :param timemap_uri: (str) The URI of the TimeMap, or of its first page.
+        :param follow_pages: (bool) Also read the next pages of a paged TimeMap.
+        :return: generator of the TimeMapEntry of the mementos of the TimeMap.
+        """
+        for entry in self.timemap(timemap_uri, follow_pages):
+            if "memento" in entry.rel:
+                yield entry
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+"""
+A golden corpus of the responses of the server, for testing clients without
+a server.
+
+Every endpoint is requested with each of its preferences and combinations of
+them, for sample URI-Rs and Accept-Datetimes. The requests run through the
+WSGI application in-process, in parallel worker processes, with a fixed
+`now` so that the corpus is reproducible. The status and the headers of the
+responses are written to a compact, indexed file:
+
+    header      magic, version, count, offsets of the sections below
+    records     one JSON array per response: the status, then the indexes of
+                the names and the values of its headers in the strings
+    strings     a JSON list of the distinct header names and values
+    index       a JSON list of [method, path, prefer, accept_datetime, offset, length]
+
+For example:
+ ```python
+ from memento_test.corpus import corpus_cases, export_corpus, Corpus
+
+ export_corpus(corpus_cases(["http://www.espn.com"]), "/tmp/golden.mtc", processes=4)
+ corpus = Corpus.open("/tmp/golden.mtc")
+ status, headers = corpus.get("GET", "/tg/http://www.espn.com", prefer="tg_303")
+ ```
+"""
+
+from collections import namedtuple
+from datetime import datetime
+from itertools import combinations
+import json
+import mmap
+import multiprocessing
+import struct
+
+from werkzeug.test import Client, EnvironBuilder
+
+from memento_test.archive import SyntheticArchive
+from memento_test.server import create_application, ORGINAL_PREFERENCES, \
+    TG_PREFERENCES, MEMENTO_PREFERENCES, TIMEMAP_PREFERENCES
+
+CORPUS_MAGIC = b"MTCORPUS"
+CORPUS_VERSION = 1
+
+HEADER = struct.Struct("<8sQQQQ")
+
+# the datetime of the responses of the corpus
+CORPUS_NOW = datetime(2017, 7, 13, 12, 12, 57)
+SAMPLE_URI_RS = ("http://www.espn.com", "http://www.cnn.com/", "http://www.test.com/a?b=c")
+SAMPLE_ACCEPT_DATETIMES = (None, "Thu, 01 Jan 2015 00:00:00 GMT")
+SAMPLE_MEMENTO_DATETIMES = ("2016", "20150101000000")
+
+ENDPOINT_PREFERENCES = {
+    "original": ORGINAL_PREFERENCES,
+    "timegate": TG_PREFERENCES,
+    "memento": MEMENTO_PREFERENCES,
+    "timemap": TIMEMAP_PREFERENCES,
+}
+
+CorpusCase = namedtuple("CorpusCase", "method path prefer accept_datetime")
+
+
+class CorpusFormatError(ValueError):
+    pass
+
+
+def _preference_values(preferences, max_combination):
+    values = [None]
+    preferences = sorted(preferences)
+    for size in range(1, max_combination + 1):
+        values.extend(", ".join(c) for c in combinations(preferences, size))
+    return values
+
+
+def _endpoint_paths(uri_rs):
+    yield "original", "/"
+    for uri_r in uri_rs:
+        yield "timegate", "/tg/" + uri_r
+        for mem_dt in SAMPLE_MEMENTO_DATETIMES:
+            yield "memento", "/%s/%s" % (mem_dt, uri_r)
+        for timemap_format in ("link", "json"):
+            yield "timemap", "/timemap/%s/%s" % (timemap_format, uri_r)
+
+
+def corpus_cases(uri_rs=SAMPLE_URI_RS, accept_datetimes=SAMPLE_ACCEPT_DATETIMES,
+                 max_combination=2, methods=("GET",)):
+    """
+    Enumerates the requests of a corpus: every endpoint, with each of its
+    preferences and combinations of up to `max_combination` of them, for each
+    URI-R and Accept-Datetime.
+    :param uri_rs: (iterable) The sample URI-Rs.
+    :param accept_datetimes: (iterable) The Accept-Datetime values, None for no header.
+    :param max_combination: (int) The largest number of preferences of a request.
+    :param methods: (iterable) The HTTP methods.
+    :return: generator of CorpusCase.
+    """
+    values = dict((endpoint, _preference_values(preferences, max_combination))
+                  for endpoint, preferences in ENDPOINT_PREFERENCES.items())
+    for endpoint, path in _endpoint_paths(uri_rs):
+        for prefer in values[endpoint]:
+            for accept_datetime in accept_datetimes:
+                for method in methods:
+                    yield CorpusCase(method, path, prefer, accept_datetime)
+
+
+# the application of a worker process, created once by _init_worker
+_application = None
+
+
+def _init_worker(now, seed, density):
+    global _application
+    archive = None
+    if seed is not None:
+        archive = SyntheticArchive(seed=seed, density=density, last_datetime=now)
+    _application = create_application(archive=archive, now=now)
+
+
+def _run_case(case):
+    headers = []
+    if case.prefer is not None:
+        headers.append(("Prefer", case.prefer))
+    if case.accept_datetime is not None:
+        headers.append(("Accept-Datetime", case.accept_datetime))
+    builder = EnvironBuilder(path=case.path, method=case.method, headers=headers)
+    app_iter, status, response_headers = Client(_application).run_wsgi_app(
+        builder.get_environ())
+    if hasattr(app_iter, "close"):
+        app_iter.close()
+    return case, int(status.split(None, 1)[0]), list(response_headers.items())
+
+
+def run_cases(cases, now=CORPUS_NOW, seed=None, density=50.0, processes=None, chunksize=64):
+    """
+    Runs the requests through the application, in parallel worker processes.
+    :param cases: (iterable) The CorpusCase requests.
+    :param now: (datetime) The current datetime of the server.
+    :param seed: (int) The seed of a synthetic archive, or None for the default
+    timelines.
+    :param density: (float) The density of the synthetic archive.
+    :param processes: (int) The number of worker processes, 0 to run in this process,
+    None for the number of CPUs.
+    :param chunksize: (int) The number of requests sent to a worker at once.
+    :return: iterator of (CorpusCase, status, headers) in the order of the cases.
+    """
+    if processes == 0:
+        _init_worker(now, seed, density)
+        return (_run_case(case) for case in cases)
+    pool = multiprocessing.Pool(processes, _init_worker, (now, seed, density))
+    return _pool_results(pool, cases, chunksize)
+
+
+def _pool_results(pool, cases, chunksize):
+    try:
+        for result in pool.imap(_run_case, cases, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def write_corpus(results, path):
+    """
+    Writes the responses to a corpus file.
+    :param results: (iterable) (CorpusCase, status, headers) tuples.
+    :param path: (str) The path of the corpus file.
+    :return: (int) The number of responses.
+    """
+    strings = {}
+    index = []
+    with open(path, "wb") as f:
+        f.write(b"\x00" * HEADER.size)
+        offset = HEADER.size
+        for case, status, headers in results:
+            record = [status]
+            for name, value in headers:
+                record.append(strings.setdefault(name, len(strings)))
+                record.append(strings.setdefault(value, len(strings)))
+            data = json.dumps(record, separators=(",", ":")).encode("ascii") + b"\n"
+            f.write(data)
+            index.append(list(case) + [offset, len(data)])
+            offset += len(data)
+
+        strings_offset = offset
+        table = sorted(strings, key=strings.get)
+        data = json.dumps(table, separators=(",", ":")).encode("utf-8") + b"\n"
+        f.write(data)
+        index_offset = strings_offset + len(data)
+        index.sort(key=lambda entry: [value or "" for value in entry[:4]])
+        f.write(json.dumps(index, separators=(",", ":")).encode("utf-8"))
+
+        f.seek(0)
+        f.write(HEADER.pack(CORPUS_MAGIC, CORPUS_VERSION, len(index), strings_offset,
+                            index_offset))
+    return len(index)
+
+
+def export_corpus(cases, path, **options):
+    """
+    Runs the requests and writes their responses to a corpus file.
+    :param cases: (iterable) The CorpusCase requests, eg: from `corpus_cases`.
+    :param path: (str) The path of the corpus file.
+    :param options: keyword arguments of `run_cases`.
+    :return: (int) The number of responses.
+    """
+    return write_corpus(run_cases(cases, **options), path)
+
+
+class Corpus(object):
+    """
+    A read-only corpus file. The index and the strings are loaded when opened,
+    the records are decoded when they are looked up.
+    """
+
+    def __init__(self, buf):
+        """
+        :param buf: (bytes|mmap) The content of a corpus file.
+        """
+        if len(buf) < HEADER.size:
+            raise CorpusFormatError("Truncated corpus header")
+        magic, version, count, strings_offset, index_offset = \
+            HEADER.unpack_from(buf, 0)
+        if magic != CORPUS_MAGIC:
+            raise CorpusFormatError("Not a corpus file")
+        if version != CORPUS_VERSION:
+            raise CorpusFormatError("Unsupported corpus version %d" % version)
+        if not HEADER.size <= strings_offset <= index_offset <= len(buf):
+            raise CorpusFormatError("Invalid corpus offsets")
+        self._buf = buf
+        self.strings = json.loads(buf[strings_offset:index_offset].decode("utf-8"))
+        self.index = {}
+        for method, path, prefer, accept_datetime, offset, length in \
+                json.loads(buf[index_offset:].decode("utf-8")):
+            self.index[CorpusCase(method, path, prefer, accept_datetime)] = (offset, length)
+        if len(self.index) != count:
+            raise CorpusFormatError("Expected %d responses, found %d" % (count, len(self.index)))
+
+    @classmethod
+    def open(cls, path):
+        """
+        :param path: (str) The path of a corpus file.
+        :return: (Corpus) The corpus, memory-mapped.
+        """
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buf)
+
+    def _record(self, offset, length):
+        record = json.loads(self._buf[offset:offset + length].decode("ascii"))
+        strings = self.strings
+        headers = [(strings[record[i]], strings[record[i + 1]])
+                   for i in range(1, len(record), 2)]
+        return record[0], headers
+
+    def get(self, method, path, prefer=None, accept_datetime=None):
+        """
+        :param method: (str) The HTTP method of the request.
+        :param path: (str) The path of the request, eg: "/tg/http://www.espn.com".
+        :param prefer: (str) The Prefer header of the request.
+        :param accept_datetime: (str) The Accept-Datetime header of the request.
+        :return: (int, list) The status and the (name, value) headers of the
+        response, or None if the request is not in the corpus.
+        """
+        entry = self.index.get(CorpusCase(method, path, prefer, accept_datetime))
+        if entry is None:
+            return
+        return self._record(*entry)
+
+    def cases(self):
+        """
+        :return: iterator of the CorpusCase requests of the corpus.
+        """
+        return iter(self.index)
+
+    def items(self):
+        """
+        :return: generator of (CorpusCase, status, headers).
+        """
+        for case, entry in self.index.items():
+            status, headers = self._record(*entry)
+            yield case, status, headers
+
+    def close(self):
+        if isinstance(self._buf, mmap.mmap):
+            self._buf.close()
+
+    def __contains__(self, case):
+        return case in self.index
+
+    def __len__(self):
+        return len(self.index)
@@ -0,0 +1,232 @@
+# -*- coding: utf-8 -*-
+"""
+An HTTP/1.1 WSGI server with persistent connections, for the Memento Test Server.
+
+The development server of Werkzeug answers `Connection: close` to every request,
+so that every TimeGate hop of a client pays a new TCP handshake. This server
+keeps the connections open:
+
+ * the requests of a connection are handled in turn, including the requests
+   that a client pipelines without waiting for the responses,
+ * the responses are framed with their `Content-Length`, or with the chunked
+   transfer coding when the application does not give it. HTTP/1.0 clients
+   get the connection closed instead, unless the length is known and they
+   asked for `Connection: keep-alive`,
+ * the unread rest of a request body is drained before the next request,
+ * a connection is closed after `idle_timeout` seconds without a request, or
+   after `max_requests` requests.
+
+Each connection has its own thread, so that idle connections do not block the
+other clients.
+
+For example:
+ ```python
+ from memento_test.keepalive import KeepAliveWSGIServer
+
+ server = KeepAliveWSGIServer("localhost", 4000, create_application(), idle_timeout=5)
+ server.serve_forever()
+ ```
+"""
+
+import logging
+import socket
+
+from werkzeug.exceptions import InternalServerError
+from werkzeug.serving import WSGIRequestHandler, ThreadedWSGIServer
+from werkzeug.wsgi import LimitedStream
+
+logger = logging.getLogger(__name__)
+
+# seconds without a request before an idle connection is closed
+DEFAULT_IDLE_TIMEOUT = 15.0
+DEFAULT_MAX_REQUESTS = 1000
+# the largest unread request body drained to keep a connection open
+MAX_DRAIN = 1 << 20
+# responses are written in buffers of this size, and flushed once done
+WRITE_BUFFER_SIZE = 1 << 16
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """
+    Handles the requests of a persistent HTTP/1.1 connection, see the module.
+    """
+
+    protocol_version = "HTTP/1.1"
+    wbufsize = WRITE_BUFFER_SIZE
+
+    def setup(self):
+        # the timeout of the socket, for the request lines of the idle connections too
+        self.timeout = self.server.idle_timeout
+        WSGIRequestHandler.setup(self)
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            # the last segment of a response is not delayed until the previous one is acked
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.requests = 0
+
+    def log_error(self, format, *args):
+        if format.startswith("Request timed out"):
+            # an idle connection reaching the idle timeout
+            logger.debug("Closing idle connection from %s", self.address_string())
+            return
+        WSGIRequestHandler.log_error(self, format, *args)
+
+    def _input_stream(self, environ):
+        """
+        :return: The body of the request, that cannot be read past its end.
+        """
+        if environ.get("wsgi.input_terminated"):
+            # chunked
+            return environ["wsgi.input"]
+        try:
+            length = max(int(environ.get("CONTENT_LENGTH") or 0), 0)
+        except ValueError:
+            # the end of the body is unknown
+            self.close_connection = True
+            length = 0
+        environ["wsgi.input_terminated"] = True
+        return LimitedStream(self.rfile, length)
+
+    def _drain(self, stream):
+        """
+        Reads the rest of the body of a request, so that the next request of the
+        connection starts at its request line.
+        :return: (bool) Whether the body was read to its end.
+        """
+        drained = 0
+        try:
+            while drained <= MAX_DRAIN:
+                data = stream.read(65536)
+                if not data:
+                    return True
+                drained += len(data)
+        except Exception:
+            # eg: the client disconnected, or a malformed chunk
+            pass
+        return False
+
+    def run_wsgi(self):
+        if self.headers.get("Expect", "").lower().strip(" \t") == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            self.wfile.flush()
+
+        self.requests += 1
+        if self.requests >= self.server.max_requests:
+            self.close_connection = True
+        self.environ = environ = self.make_environ()
+        environ["wsgi.input"] = stream = self._input_stream(environ)
+        http11 = self.request_version >= "HTTP/1.1"
+        no_body = environ["REQUEST_METHOD"] == "HEAD"
+        state = {"status": None, "headers": None, "sent": False, "chunked": False}
+
+        def send_headers():
+            status = state["status"]
+            code, _, message = status.partition(" ")
+            code = int(code)
+            self.send_response(code, message)
+            has_length = False
+            for key, value in state["headers"]:
+                if key.lower() == "connection":
+                    # hop-by-hop, managed by the server
+                    continue
+                if key.lower() == "content-length":
+                    has_length = True
+                self.send_header(key, value)
+            if no_body or 100 <= code < 200 or code in (204, 304):
+                state["no_body"] = True
+            elif not has_length:
+                if http11:
+                    state["chunked"] = True
+                    self.send_header("Transfer-Encoding", "chunked")
+                else:
+                    # the end of the body is the end of the connection
+                    self.close_connection = True
+            if self.close_connection:
+                self.send_header("Connection", "close")
+            elif not http11:
+                self.send_header("Connection", "keep-alive")
+            self.end_headers()
+            state["sent"] = True
+
+        def write(data):
+            if not state["sent"]:
+                send_headers()
+            if not data or state.get("no_body"):
+                return
+            if state["chunked"]:
+                self.wfile.write(b"%x\r\n" % len(data))
+                self.wfile.write(data)
+                self.wfile.write(b"\r\n")
+            else:
+                self.wfile.write(data)
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info:
+                try:
+                    if state["sent"]:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif state["status"] is not None:
+                raise AssertionError("Headers already set")
+            state["status"] = status
+            state["headers"] = headers
+            return write
+
+        def execute(app):
+            app_iter = app(environ, start_response)
+            try:
+                for data in app_iter:
+                    write(data)
+                if not state["sent"]:
+                    write(b"")
+                if state["chunked"]:
+                    self.wfile.write(b"0\r\n\r\n")
+            finally:
+                if hasattr(app_iter, "close"):
+                    app_iter.close()
+
+        try:
+            execute(self.server.app)
+        except (ConnectionError, socket.timeout) as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+            return
+        except Exception:
+            logger.exception("Error on request %s %s", self.command, self.path)
+            if state["sent"]:
+                # the framing of the response is broken
+                self.close_connection = True
+                return
+            state.update(status=None, headers=None)
+            self.close_connection = True
+            execute(InternalServerError())
+            return
+        if not self.close_connection and not self._drain(stream):
+            self.close_connection = True
+
+
+class KeepAliveWSGIServer(ThreadedWSGIServer):
+    """
+    A WSGI server keeping the HTTP/1.1 connections open, with a thread per connection.
+    """
+
+    def __init__(self, host, port, app, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 max_requests=DEFAULT_MAX_REQUESTS, handler=KeepAliveRequestHandler, fd=None):
+        """
+        :param host: (str) The host name or address to bind to, or `unix://<path>`.
+        :param port: (int) The port to bind to.
+        :param app: The WSGI application.
+        :param idle_timeout: (float) The seconds a connection may wait for its next
+        request, or for the rest of a request, before it is closed.
+        :param max_requests: (int) The number of requests of a connection before it
+        is closed, eg: so that the clients spread over the worker processes.
+        :param handler: (class) The request handler, a KeepAliveRequestHandler.
+        :param fd: (int) The file descriptor of an already bound socket to serve.
+        """
+        if idle_timeout <= 0:
+            raise ValueError("idle_timeout must be positive, got %s" % idle_timeout)
+        if max_requests <= 0:
+            raise ValueError("max_requests must be positive, got %s" % max_requests)
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        ThreadedWSGIServer.__init__(self, host, port, app, handler, fd=fd)
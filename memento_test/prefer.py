@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Parsing of the `Prefer` request header, as specified by RFC 7240.
+
+    Prefer     = 1#preference
+    preference = token [ BWS "=" BWS word ] *( OWS ";" [ OWS parameter ] )
+    parameter  = token [ BWS "=" BWS word ]
+    word       = token / quoted-string
+
+eg: 'return=minimal; foo="some parameter", wait=10, tg_302'
+
+Preference and parameter names are case insensitive and are folded to lower
+case. Empty values are equivalent to no value. When a preference is given
+more than once, the first occurrence is used. Malformed preferences are
+ignored, as unknown ones are.
+
+Clients send few distinct `Prefer` values, so parse results are memoized in
+a bounded LRU cache keyed by the raw header value.
+"""
+
+from collections import namedtuple
+import re
+
+try:
+    from functools import lru_cache
+except ImportError:
+    lru_cache = None
+
+PREFER_CACHE_SIZE = 1024
+
+_TOKEN = re.compile(r"[!#$%&'*+\-.^_`|~0-9A-Za-z]+")
+_QUOTED_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_QUOTED_PAIR = re.compile(r"\\(.)")
+_OWS = re.compile(r"[ \t]*")
+
+Preference = namedtuple("Preference", ["name", "value", "params"])
+Preference.__doc__ = """
+A parsed preference.
+name: (str) the lower case preference token.
+value: (str) the value of the preference, or None.
+params: (tuple) (name, value) pairs of the parameters, names in lower case.
+"""
+
+
+def _skip_element(header, pos):
+    """
+    Returns the position of the next comma outside of a quoted string.
+    """
+    n = len(header)
+    while pos < n:
+        c = header[pos]
+        if c == ",":
+            return pos
+        if c == '"':
+            m = _QUOTED_STRING.match(header, pos)
+            pos = m.end() if m else n
+        else:
+            pos += 1
+    return pos
+
+
+def _word(header, pos):
+    """
+    Parses a token or a quoted-string.
+    :return: (str, int) the value (None if empty or missing), and the new position.
+    """
+    m = _TOKEN.match(header, pos)
+    if m:
+        return m.group(0), m.end()
+    m = _QUOTED_STRING.match(header, pos)
+    if m:
+        return _QUOTED_PAIR.sub(r"\1", m.group(1)) or None, m.end()
+    return None, pos
+
+
+def _name_value(header, pos):
+    """
+    Parses `token [ BWS "=" BWS word ]`.
+    :return: (str, str, int) the lower case name (None if malformed), the value and
+    the new position.
+    """
+    m = _TOKEN.match(header, pos)
+    if not m:
+        return None, None, pos
+    name = m.group(0).lower()
+    pos = _OWS.match(header, m.end()).end()
+    value = None
+    if pos < len(header) and header[pos] == "=":
+        pos = _OWS.match(header, pos + 1).end()
+        value, pos = _word(header, pos)
+    return name, value, pos
+
+
+def _parse_prefer(header):
+    preferences = []
+    seen = set()
+    n = len(header)
+    pos = 0
+    while pos < n:
+        pos = _OWS.match(header, pos).end()
+        if pos < n and header[pos] == ",":
+            pos += 1
+            continue
+
+        name, value, pos = _name_value(header, pos)
+        params = []
+        while name:
+            pos = _OWS.match(header, pos).end()
+            if pos >= n or header[pos] != ";":
+                break
+            pos = _OWS.match(header, pos + 1).end()
+            param, param_value, pos = _name_value(header, pos)
+            if param:
+                params.append((param, param_value))
+
+        pos = _OWS.match(header, pos).end()
+        if not name or (pos < n and header[pos] != ","):
+            # malformed, ignore the whole preference
+            pos = _skip_element(header, pos)
+            continue
+        if name not in seen:
+            seen.add(name)
+            preferences.append(Preference(name, value, tuple(params)))
+    return tuple(preferences)
+
+
+if lru_cache is not None:
+    _parse_prefer_cached = lru_cache(maxsize=PREFER_CACHE_SIZE)(_parse_prefer)
+else:
+    _parse_prefer_cached = _parse_prefer
+
+
+def parse_prefer(header):
+    """
+    Parses the value of a `Prefer` header. Results are cached.
+    eg: 'return=minimal, Wait=5; x="y"' ->
+        (Preference("return", "minimal", ()), Preference("wait", "5", (("x", "y"),)))
+    :param header: (str) the value of the Prefer header, multiple headers joined
+    with commas.
+    :return: (tuple) Preference tuples, in the order of the header.
+    """
+    if not header:
+        return ()
+    return _parse_prefer_cached(header)
+
+
+def prefer_cache_info():
+    """
+    :return: the hits, misses, maxsize and currsize of the parse cache.
+    """
+    return _parse_prefer_cached.cache_info()
+
+
+def format_preference(name, value=None):
+    """
+    Formats a preference for the `Preference-Applied` header.
+    eg: ("return", "minimal") -> 'return=minimal'
+    :param name: (str) the preference token.
+    :param value: (str) the value of the preference, or None.
+    :return: (str) the applied-pref.
+    """
+    if value is None:
+        return name
+    if _TOKEN.match(value) and _TOKEN.match(value).end() == len(value):
+        return "%s=%s" % (name, value)
+    return '%s="%s"' % (name, value.replace("\\", "\\\\").replace('"', '\\"'))
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in per-request profiling.
+
+A request is profiled when it carries the `X-Memento-Profile` header, or when
+it is the N-th request with a sampling rate of 1 in N. The whole request is
+profiled: routing, the `on_*` handlers and the generation of the body. One
+file is written per profiled request, in a directory per endpoint and Prefer
+value:
+
+    <directory>/<endpoint>/<prefer>/<time>-<pid>-<n>.pstats
+    <directory>/<endpoint>/<prefer>/<time>-<pid>-<n>.collapsed
+
+`pstats` files can be read with the `pstats` module or snakeviz, `collapsed`
+files (one "frame;frame;frame microseconds" line per stack) with flamegraph.pl
+or speedscope.
+
+The server only checks `profiler is not None` when profiling is disabled.
+"""
+
+from collections import defaultdict
+import cProfile
+import itertools
+import os
+import re
+import sys
+import time
+
+PROFILE_HEADER = "X-Memento-Profile"
+
+PROFILE_FORMATS = ("pstats", "collapsed")
+
+_UNSAFE_PATH_CHARS = re.compile(r"[^A-Za-z0-9_.=-]+")
+
+
+def _path_part(value, default):
+    value = _UNSAFE_PATH_CHARS.sub("_", value or "").strip("_.")[:100]
+    return value or default
+
+
+def _frame_label(code):
+    return "%s:%s:%d" % (os.path.basename(code.co_filename), code.co_name,
+                         code.co_firstlineno)
+
+
+class StackProfiler(object):
+    """
+    A profiler that records the self time of every call stack, for flame graphs.
+    """
+
+    def __init__(self):
+        self.stacks = defaultdict(float)
+        self._stack = []
+        self._last = None
+
+    def _callback(self, frame, event, arg):
+        now = time.perf_counter()
+        if self._stack:
+            self.stacks[tuple(self._stack)] += now - self._last
+        if event == "call":
+            self._stack.append(_frame_label(frame.f_code))
+        elif event == "c_call":
+            self._stack.append(getattr(arg, "__qualname__", repr(arg)))
+        elif self._stack:
+            # return, c_return and c_exception
+            self._stack.pop()
+        self._last = time.perf_counter()
+
+    def enable(self):
+        self._last = time.perf_counter()
+        sys.setprofile(self._callback)
+
+    def disable(self):
+        sys.setprofile(None)
+
+    def dump_stats(self, path):
+        with open(path, "w") as f:
+            for stack, seconds in self.stacks.items():
+                f.write("%s %d\n" % (";".join(stack), round(seconds * 1000000)))
+
+
+class RequestProfiler(object):
+    """
+    Decides which requests are profiled, profiles them and writes the results.
+    """
+
+    def __init__(self, directory, sample_rate=0, header=PROFILE_HEADER,
+                 profile_format="pstats"):
+        """
+        :param directory: (str) The directory the profiles are written to.
+        :param sample_rate: (int) Profile 1 in `sample_rate` requests, 0 to only
+        profile the requests with the `header`.
+        :param header: (str) The request header that turns profiling on, None to
+        ignore headers.
+        :param profile_format: (str) `pstats` or `collapsed`.
+        """
+        if profile_format not in PROFILE_FORMATS:
+            raise ValueError("Unknown profile format: %s" % profile_format)
+        if sample_rate < 0:
+            raise ValueError("sample_rate must not be negative, got %s" % sample_rate)
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.header = header
+        self.profile_format = profile_format
+        self._requests = itertools.count(1)
+        self._written = itertools.count(1)
+
+    def should_profile(self, request):
+        """
+        :param request: the Werkzeug Request object.
+        :return: (bool) True if the request must be profiled.
+        """
+        if self.header and self.header in request.headers:
+            return True
+        return self.sample_rate > 0 and next(self._requests) % self.sample_rate == 0
+
+    def _new_profiler(self):
+        if self.profile_format == "pstats":
+            return cProfile.Profile()
+        return StackProfiler()
+
+    def run(self, request, func, *args):
+        """
+        Profiles `func(*args)`, and writes the profile.
+        :param request: the Werkzeug Request object.
+        :param func: the function to profile.
+        :return: the return value of `func`.
+        """
+        profiler = self._new_profiler()
+        profiler.enable()
+        try:
+            return func(*args)
+        finally:
+            profiler.disable()
+            self.write(profiler, getattr(request, "endpoint", None),
+                       request.headers.get("Prefer"))
+
+    def write(self, profiler, endpoint, prefer):
+        """
+        Writes a profile to the directory of its endpoint and Prefer header.
+        :param profiler: the cProfile.Profile or StackProfiler.
+        :param endpoint: (str) the matched endpoint of the request.
+        :param prefer: (str) the Prefer header of the request.
+        :return: (str) the path of the profile.
+        """
+        directory = os.path.join(self.directory, _path_part(endpoint, "unknown"),
+                                 _path_part(prefer, "default"))
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, "%d-%d-%d.%s" % (
+            time.time() * 1000, os.getpid(), next(self._written), self.profile_format))
+        profiler.dump_stats(path)
+        return path
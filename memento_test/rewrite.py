@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming replay URL rewriting of HTML memento payloads.
+
+The links of the tags of a page (`href`, `src`, `action`...) are rewritten
+to the archive, the way replay systems do, so that clients crawling a
+memento stay in the archive:
+    <a href="/about">  ->  <a href="http://localhost:4000/20170713121257/http://www.espn.com/about">
+
+The payload is rewritten one chunk at a time. Only the end of a chunk that
+may hold an incomplete tag is kept for the next chunk, so the memory used
+does not depend on the size of the page. Pages are handled as bytes, URLs as
+latin-1, so no decoding of the page is needed.
+"""
+
+import re
+
+try:
+    from urllib.parse import urljoin, urlsplit
+except ImportError:
+    from urlparse import urljoin, urlsplit
+
+REWRITTEN_ATTRIBUTES = (b"href", b"src", b"action", b"formaction", b"background",
+                        b"poster", b"cite", b"data", b"longdesc")
+
+# unterminated tags longer than this are not rewritten
+MAX_TAG = 65536
+
+_REWRITTEN = frozenset(REWRITTEN_ATTRIBUTES)
+# the attributes of a tag are tokenized from its name onward, so that the names
+# and the `>` inside quoted values are never taken for attributes or tag ends
+_VALUE = br"""(?:"[^"]*"|'[^']*'|[^\s"'>][^\s>]*)"""
+_TAG = re.compile(br"<[a-zA-Z][^\s/>]*(?:[\s/]+[^\s/>=]+(?:\s*=\s*" + _VALUE +
+                  br")?)*[\s/]*>")
+_TAG_NAME = re.compile(br"<[a-zA-Z][^\s/>]*")
+_ATTRIBUTE = re.compile(
+    br"""([\s/]+)([^\s/>=]+)(?:(\s*=\s*)(?:"([^"]*)"|'([^']*)'|([^\s"'>][^\s>]*)))?""")
+# most tags have no attribute to rewrite, and are not tokenized
+_MAY_REWRITE = re.compile(br"\s(?:" + b"|".join(REWRITTEN_ATTRIBUTES) + br")\s*=", re.I)
+_SKIPPED_SCHEMES = re.compile(r"^\s*(?:#|javascript:|mailto:|data:|tel:|about:|blob:)", re.I)
+
+
+class HtmlRewriter(object):
+    """
+    Rewrites the URLs of an HTML page to the URLs of its mementos.
+    """
+
+    def __init__(self, uri_r, archive_prefix):
+        """
+        :param uri_r: (str) The URI-R of the page, the base of its relative URLs.
+        :param archive_prefix: (str) The prefix of the memento URLs, the base URI of the
+        archive followed by the 14 digit timestamp of the memento.
+        eg: http://localhost:4000/20170713121257/
+        """
+        self.archive_prefix = archive_prefix
+        self._carry = b""
+        self.set_base(uri_r)
+
+    def set_base(self, base):
+        """
+        Sets the base of the relative URLs, and its scheme and origin used to join
+        protocol and host relative URLs without `urljoin`.
+        :param base: (str) The absolute base URL.
+        """
+        parts = urlsplit(base)
+        self.base = base
+        self._scheme = parts.scheme + ":"
+        self._origin = parts.scheme + "://" + parts.netloc
+
+    def rewrite_url(self, url):
+        """
+        :param url: (str) A URL of the page, relative or absolute.
+        :return: (str) The URL of its memento, or the URL when it cannot be archived.
+        """
+        if url.startswith(("http://", "https://")):
+            # absolute URLs, most of them, do not need to be joined
+            if url.startswith(self.archive_prefix):
+                return url
+            return self.archive_prefix + url
+        if not url or _SKIPPED_SCHEMES.match(url):
+            return url
+        if url.startswith("//"):
+            absolute = self._scheme + url
+        elif url.startswith("/") and "/." not in url:
+            absolute = self._origin + url
+        else:
+            absolute = urljoin(self.base, url.strip())
+        if not absolute.startswith(("http://", "https://")):
+            return url
+        return self.archive_prefix + absolute
+
+    def _rewrite_tag(self, match):
+        tag = match.group(0)
+        if not _MAY_REWRITE.search(tag):
+            return tag
+        pos = _TAG_NAME.match(tag).end()
+        is_base = tag[1:pos].lower() == b"base"
+        parts = [tag[:pos]]
+        attribute = _ATTRIBUTE.match(tag, pos)
+        while attribute is not None:
+            space, name, equals, double, single, bare = attribute.groups()
+            pos = attribute.end()
+            if equals is None or name.lower() not in _REWRITTEN:
+                parts.append(attribute.group(0))
+            else:
+                value = double if double is not None else single if single is not None \
+                    else bare
+                if is_base and name.lower() == b"href":
+                    # <base href> changes the base of the following relative URLs
+                    self.set_base(urljoin(self.base, value.decode("latin-1")))
+                url = self.rewrite_url(value.decode("latin-1")).encode("latin-1")
+                quote = b"'" if single is not None else b'"'
+                parts.append(space + name + equals + quote + url + quote)
+            attribute = _ATTRIBUTE.match(tag, pos)
+        parts.append(tag[pos:])
+        return b"".join(parts)
+
+    def _incomplete_tag(self, data, start):
+        """
+        :return: (bool) Whether the `<` at data[start] may start a tag that ends
+        in the next chunks.
+        """
+        if len(data) - start >= MAX_TAG:
+            return False
+        following = data[start + 1:start + 2]
+        return (not following or following.isalpha()) and _TAG.match(data, start) is None
+
+    def feed(self, chunk):
+        """
+        Rewrites a chunk of the page.
+        :param chunk: (bytes) The next chunk of the page.
+        :return: (bytes) The rewritten part of the page, up to the last complete tag.
+        """
+        data = self._carry + chunk if self._carry else chunk
+        start = data.rfind(b"<")
+        if start >= 0 and self._incomplete_tag(data, start):
+            # keep the incomplete tag for the next chunk
+            self._carry = data[start:]
+            data = data[:start]
+        else:
+            self._carry = b""
+        if b"<" not in data:
+            return data
+        return _TAG.sub(self._rewrite_tag, data)
+
+    def close(self):
+        """
+        :return: (bytes) The rest of the page.
+        """
+        data, self._carry = self._carry, b""
+        return _TAG.sub(self._rewrite_tag, data)
+
+
+def rewrite_html(chunks, uri_r, archive_prefix):
+    """
+    Rewrites the URLs of an HTML page, chunk by chunk.
+    :param chunks: iterable of bytes, the page.
+    :param uri_r: (str) The URI-R of the page.
+    :param archive_prefix: (str) The prefix of the memento URLs.
+    eg: http://localhost:4000/20170713121257/
+    :return: generator of bytes.
+    """
+    rewriter = HtmlRewriter(uri_r, archive_prefix)
+    for chunk in chunks:
+        out = rewriter.feed(chunk)
+        if out:
+            yield out
+    out = rewriter.close()
+    if out:
+        yield out
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+A fast path in front of the werkzeug URL map of the server.
+
+The URLs of the server have few shapes:
+    /
+    /tg/<path:uri_r>
+    /timemap/<any(link, json):timemap_format>/<path:uri_r>
+    /<int:mem_dt>/<path:uri_r>
+
+They are recognized with a prefix and a first segment check, which is much
+cheaper than binding the werkzeug map to the environ and matching it. The
+results are the same as werkzeug's: the leading slashes of the path are
+ignored, the `path` converter keeps the `//` of the URI-R, and `int` accepts
+any decimal digits. Anything else, eg: other methods, empty URI-Rs, merged
+slashes redirects or unknown paths, falls back to werkzeug, which also
+raises the HTTP exceptions.
+"""
+
+FAST_METHODS = {"GET", "HEAD"}
+TIMEMAP_FORMATS = {"link", "json"}
+
+
+def _path_info(environ):
+    # as werkzeug decodes it
+    path_info = environ.get("PATH_INFO")
+    if path_info is None:
+        return
+    return path_info.encode("latin1").decode("utf-8", "replace")
+
+
+def fast_match(path_info):
+    """
+    Matches a path against the URL shapes of the server.
+    :param path_info: (str) The decoded PATH_INFO.
+    :return: (str, dict) the endpoint and the values, or None if werkzeug must
+    match the path.
+    """
+    if not path_info.startswith("/") or "\n" in path_info:
+        return
+    path = path_info.lstrip("/")
+    if not path:
+        return "original", {}
+
+    first, sep, rest = path.partition("/")
+    # the path converter does not match an empty value or a leading slash
+    if not rest or rest[0] == "/":
+        return
+    if first == "tg":
+        return "timegate", {"uri_r": rest}
+    if first == "timemap":
+        timemap_format, sep, uri_r = rest.partition("/")
+        if timemap_format in TIMEMAP_FORMATS and uri_r and uri_r[0] != "/":
+            return "timemap", {"timemap_format": timemap_format, "uri_r": uri_r}
+        return
+    if first.isdecimal():
+        return "memento", {"mem_dt": int(first), "uri_r": rest}
+
+
+def match_request(url_map, environ):
+    """
+    Matches a request, with the fast path when possible.
+    :param url_map: (Map) The werkzeug URL map of the server, for the other requests.
+    :param environ: The WSGI environ of the request.
+    :return: (str, dict) the endpoint and the values.
+    :raises: werkzeug.exceptions.HTTPException when werkzeug does not match the request.
+    """
+    if environ.get("REQUEST_METHOD") in FAST_METHODS:
+        path_info = _path_info(environ)
+        if path_info is not None:
+            rv = fast_match(path_info)
+            if rv is not None:
+                return rv
+    return url_map.bind_to_environ(environ).match()
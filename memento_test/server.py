@@ -3,14 +3,30 @@
 
 from werkzeug.wrappers import Request, Response
 from werkzeug.routing import Map, Rule
-from werkzeug.utils import cached_property
 from werkzeug.exceptions import HTTPException
-
-from datetime import datetime, date
-
+from werkzeug.http import HTTP_STATUS_CODES
+from werkzeug.wsgi import ClosingIterator
+
+from datetime import datetime, date, timedelta
+from array import array
+
+from memento_test.archive import to_epoch, from_epoch, closest_memento, timeline_epochs, \
+    bisect_timeline
+from memento_test.timemap import link_format_timemap, json_timemap, \
+    link_format_timemap_length, json_timemap_length, LINK_FORMAT_MIMETYPE, JSON_MIMETYPE
+from memento_test.prefer import parse_prefer, format_preference
+from memento_test.rewrite import rewrite_html
+from memento_test.binary_timemap import binary_timemap, binary_timemap_length, \
+    BINARY_TIMEMAP_MIMETYPE
+from memento_test.routing import match_request
+from memento_test.singleflight import SingleFlight
+from memento_test.tracing import NOOP_SPAN, activate
+
+import hashlib
 import logging
+import time
 
-logging.getLogger(__name__)
+logger = logging.getLogger(__name__)
 #logging.basicConfig(level=logging.DEBUG)
 
 ARCHIVE_DATE_FORMAT = "%Y%m%d%H%M%S"
@@ -26,7 +42,7 @@ TG_PREFERENCES = {"all_headers", "required_headers", "no_headers",
                   "tg_200_no_memento_dt_header",
                   "tg_no_accept_dt_no_redirect_to_last_memento",
                   "tg_no_accept_dt_redirect_to_last_memento",
-                  "tg_302_memento_dt_header"
+                  "tg_302_memento_dt_header", "not_archived"
                   }
 
 MEMENTO_PREFERENCES = {"all_headers", "required_headers", "no_headers",
@@ -35,12 +51,34 @@ MEMENTO_PREFERENCES = {"all_headers", "required_headers", "no_headers",
                        "invalid_link_header", "invalid_datetime_in_link_header",
                        "valid_archived_redirect", "valid_internal_redirect",
                        "invalid_archived_redirect", "invalid_internal_redirect",
-                       }
+                       "not_archived"}
+
+TIMEMAP_PREFERENCES = {"all_headers", "no_original_link_header",
+                       "invalid_link_header", "invalid_datetime_in_link_header",
+                       "not_archived"}
+# the binary TimeMaps have no datetime strings to malform
+BINARY_TIMEMAP_PREFERENCES = TIMEMAP_PREFERENCES - {"invalid_datetime_in_link_header"}
+
+# RFC 7240 `return` preference, for all the endpoints. `minimal` suppresses the body.
+RETURN_PREFERENCE_VALUES = {"minimal", "representation"}
 
 HOST_NAME = "http://localhost:4000/"
 LINK_TMPL = '<%s>; rel="%s"'
 LINK_ADD_PARAM = '; %s="%s"'
 HTTP_DT_FORMAT = "%a, %d %b %Y %H:%M:%S GMT"
+# the largest TimeMaps whose chunks are shared by concurrent requests, and kept
+# until the slowest of them has read them. The others are streamed by each request
+COALESCE_MAX_BYTES = 16 * 1024 * 1024
+# the Content-Type of the responses without a body, as set by werkzeug
+DEFAULT_CONTENT_TYPE = "text/plain; charset=utf-8"
+
+URL_MAP = Map([
+    Rule("/", endpoint="original", methods=["GET", "HEAD"]),
+    Rule("/tg/<path:uri_r>", endpoint="timegate", methods=["GET", "HEAD"]),
+    Rule("/timemap/<any(link, json):timemap_format>/<path:uri_r>", endpoint="timemap",
+         methods=["GET", "HEAD"]),
+    Rule("/<int:mem_dt>/<path:uri_r>", endpoint="memento", methods=["GET", "HEAD"])
+])
 
 
 def convert_to_http_datetime(dt):
@@ -67,6 +105,65 @@ def convert_to_datetime(dt):
     return datetime.strptime(dt, HTTP_DT_FORMAT)
 
 
+# the scale and the padding of the 4 to 14 digit datetimes of memento URLs to
+# 14 digits, eg: 201607 -> 201607 * 10 ** 8 + 1000000 = 20160701000000
+ARCHIVE_DATE_PADDING = dict(
+    (length, (10 ** (14 - length), int("0101000000"[length - 4:] or 0)))
+    for length in range(4, 15))
+# the unit of the last digits of the datetimes of memento URLs, from days on
+ARCHIVE_DATE_UNITS = {8: "days", 10: "hours", 12: "minutes", 14: "seconds"}
+
+
+def convert_archive_datetime(mem_dt):
+    """
+    Converts the datetime of a memento URL, of 4 to 14 digits, to a datetime obj.
+    Missing digits are padded with the start of the period. The digits are
+    padded and sliced as an integer, which is much faster than `strptime`.
+    eg: 201607 -> datetime(2016, 7, 1)
+    :param mem_dt: (int|str) The datetime in the memento URL.
+    :return: (datetime) The datetime object.
+    :raises: ValueError if the digits are not a valid datetime.
+    """
+    digits = str(mem_dt)
+    try:
+        scale, padding = ARCHIVE_DATE_PADDING[len(digits)]
+    except KeyError:
+        raise ValueError("Invalid memento datetime: %s" % digits)
+    if not digits.isdecimal():
+        raise ValueError("Invalid memento datetime: %s" % digits)
+    value, second = divmod(int(digits) * scale + padding, 100)
+    value, minute = divmod(value, 100)
+    value, hour = divmod(value, 100)
+    value, day = divmod(value, 100)
+    year, month = divmod(value, 100)
+    return datetime(year, month, day, hour, minute, second)
+
+
+def convert_archive_datetime_end(mem_dt):
+    """
+    Converts the datetime of a memento URL, of 4 to 14 digits, to the last second of
+    the period it covers, eg: for an `until` bound.
+    eg: 201602 -> datetime(2016, 2, 29, 23, 59, 59)
+    :param mem_dt: (int|str) The datetime in the memento URL.
+    :return: (datetime) The datetime object.
+    :raises: ValueError if the digits are not a valid datetime.
+    """
+    start = convert_archive_datetime(mem_dt)
+    length = len(str(mem_dt))
+    try:
+        if length < 6:
+            end = start.replace(year=start.year + 1)
+        elif length < 8:
+            end = start.replace(year=start.year + start.month // 12,
+                                month=start.month % 12 + 1)
+        else:
+            end = start + timedelta(**{ARCHIVE_DATE_UNITS[length // 2 * 2]: 1})
+    except (ValueError, OverflowError):
+        # the end of year 9999
+        return datetime.max.replace(microsecond=0)
+    return end - timedelta(seconds=1)
+
+
 def get_uri_dt_for_rel(links, rel_types):
     """
     Returns the uri and the datetime (if available) for a rel type from the
@@ -196,6 +293,43 @@ def parse_link_header(link):
     return links
 
 
+def entity_tag(parts, weak=False):
+    """
+    Computes an ETag from the values identifying the body of a response.
+    eg: entity_tag(("/data/a.warc.gz", 1024, 512)) -> '"de56872d9aa07ead1028"'
+    :param parts: (tuple) The values, with a deterministic repr.
+    :param weak: (bool) A weak ETag, for bodies equivalent but not identical
+    for the same values.
+    :return: (str) The quoted ETag.
+    """
+    tag = '"%s"' % hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:20]
+    return "W/" + tag if weak else tag
+
+
+def _serialize(serializer, args, options):
+    return serializer(*args, **options)
+
+
+class HeadResponse(object):
+    """
+    The response to a HEAD request: a status and headers, without a body.
+    """
+    __slots__ = ("status", "headers")
+
+    def __init__(self, status, headers):
+        """
+        :param status: (int) The HTTP status.
+        :param headers: (list) The (name, value) headers.
+        """
+        self.status = status
+        self.headers = headers
+
+    def __call__(self, environ, start_response):
+        reason = HTTP_STATUS_CODES.get(self.status, "UNKNOWN").upper()
+        start_response("%d %s" % (self.status, reason), self.headers)
+        return []
+
+
 class MementoServer(object):
     """
     Memento Test Server that can be used by Memento clients for testing various scenarios
@@ -208,7 +342,7 @@ class MementoServer(object):
     add the value "required_headers" to the Prefer header of the request.
      ```bash
      $ curl -H "Prefer: required_headers" -I http://localhost:4000/tg/http://www.test.com
-       HTTP/1.0 302 FOUND
+       HTTP/1.1 302 FOUND
        Link: <http://www.test.com>; rel="original"
        Vary: accept-datetime
        Location: http://www.example.com/20170713121257/http://www.test.com
@@ -227,26 +361,156 @@ class MementoServer(object):
 
     """
 
-    def __init__(self):
-        self.now = datetime.now()
+    def __init__(self, archive=None, profiler=None, access_log=None, host_name=None,
+                 first_datetime=None, scenarios=None, now=None, timemap_page_size=None,
+                 single_flight=None, tracer=None):
+        """
+        :param archive: The archive of the timelines, eg: a `SyntheticArchive`, or None
+        for the default timeline of every URI-R.
+        :param profiler: (RequestProfiler) Profiles the requests, or None.
+        :param access_log: (AccessLog) Logs the requests, or None.
+        :param host_name: (str) The base URI of the archive, in the Location and Link
+        URIs. Defaults to `HOST_NAME`.
+        :param first_datetime: (date) The first memento datetime without an archive.
+        :param scenarios: (set) The preferences that are applied, or None for all of them.
+        :param now: (datetime) The current datetime, eg: for reproducible responses.
+        Defaults to the time of the request.
+        :param timemap_page_size: (int) The number of mementos per TimeMap page, the
+        `page` argument of the TimeMap URIs. None for TimeMaps of a single page.
+        :param single_flight: (SingleFlight) Streams the chunks of a TimeMap serialized
+        once to the concurrent requests of the same TimeMap, or None.
+        :param tracer: (Tracer) Traces the sampled requests, or None.
+        """
+        self.now = now or datetime.now()
         self.accept_datetime = self.now
+        self.memento_datetime = self.now
         self.uri_r = None
-        self.first_datetime = date(2001, 1, 1)
+        self.host_name = host_name or HOST_NAME
+        self.first_datetime = first_datetime or date(2001, 1, 1)
+        self.scenarios = scenarios
         self.last_datetime = self.now
+        self.archive = archive
+        self.profiler = profiler
+        self.access_log = access_log
+        self.timeline = None
+        self.timemap_format = "link"
+        self.timemap_binary = False
+        self.timemap_options = {}
+        self.timemap_page_size = timemap_page_size
+        self.timemap_page = 1
+        # the mementos between the `from` and `until` arguments, and the arguments
+        self.timemap_bounds = None
+        self.timemap_query = []
+        self.single_flight = single_flight
+        self.tracer = tracer
+        self.body = None
+        # HEAD requests only prepare the headers, see `MementoServer._response`
+        self.head = False
+        self.streamed = False
 
     def __call__(self, environ, start_response):
-        request = Request(environ)
+        if self.tracer is not None:
+            span = self.tracer.start_request(environ, method=environ.get("REQUEST_METHOD"))
+            if span is not None:
+                return self._traced(span, Request(environ), environ, start_response)
+        return self._call(Request(environ), environ, start_response)
+
+    def _call(self, request, environ, start_response):
+        if self.access_log is not None:
+            return self._logged(request, environ, start_response)
+        if self.profiler is not None and self.profiler.should_profile(request):
+            return self.profiler.run(request, self._respond, request, environ, start_response)
         response = self.dispatch_request(request)
         return response(environ, start_response)
 
-    @cached_property
-    def url_map(self):
-        rules = [
-            Rule("/", endpoint="original", methods=["GET", "HEAD"]),
-            Rule("/tg/<path:uri_r>", endpoint="timegate", methods=["GET", "HEAD"]),
-            Rule("/<int:mem_dt>/<path:uri_r>", endpoint="memento", methods=["GET", "HEAD"])
-        ]
-        return Map(rules)
+    def _logged(self, request, environ, start_response):
+        """
+        Handles the request, and queues its access log entry once the body is sent.
+        """
+        start = time.time()
+        request.endpoint = None
+        request.status = None
+
+        def _start_response(status, headers, exc_info=None):
+            request.status = int(status[:3])
+            return start_response(status, headers, exc_info)
+
+        if self.profiler is not None and self.profiler.should_profile(request):
+            app_iter = self.profiler.run(request, self._respond, request, environ,
+                                         _start_response)
+        else:
+            app_iter = self.dispatch_request(request)(environ, _start_response)
+
+        def _log():
+            self.access_log.log(start, request.method, request.endpoint, self.uri_r,
+                                request.headers.get("Prefer"), request.status,
+                                round((time.time() - start) * 1000, 3))
+        return ClosingIterator(app_iter, _log)
+
+    def _traced(self, span, request, environ, start_response):
+        """
+        Handles a sampled request in its `request` span, and streams its body in
+        a `stream_body` span. Both spans end once the body is sent.
+        """
+        request.endpoint = None
+        span.set_attribute("preference", request.headers.get("Prefer"))
+
+        def _start_response(status, headers, exc_info=None):
+            span.set_attribute("status", int(status[:3]))
+            return start_response(status, headers, exc_info)
+
+        with activate(span):
+            try:
+                app_iter = self._call(request, environ, _start_response)
+            except BaseException as e:
+                span.set_attribute("error", type(e).__name__)
+                span.end()
+                raise
+        span.set_attribute("endpoint", request.endpoint)
+        span.set_attribute("uri_r", self.uri_r)
+        stream = self.tracer.span("stream_body", parent=span, endpoint=request.endpoint)
+
+        def _stream():
+            size = 0
+            for chunk in app_iter:
+                size += len(chunk)
+                yield chunk
+            stream.set_attribute("bytes", size)
+
+        callbacks = [stream.end, span.end]
+        if hasattr(app_iter, "close"):
+            callbacks.insert(0, app_iter.close)
+        return ClosingIterator(_stream(), callbacks)
+
+    def _span(self, name, **attributes):
+        """
+        :return: A child span of the current span, or NOOP_SPAN when the request is
+        not traced.
+        """
+        if self.tracer is None:
+            return NOOP_SPAN
+        return self.tracer.span(name, **attributes)
+
+    def _handle(self, handler, request, headers, endpoint, preference=None, **kwargs):
+        """
+        Calls an `on_*` handler, in a span of the handler when the request is traced.
+        :return: (dict: int) (headers, HTTP status) of the handler.
+        """
+        if self.tracer is None:
+            return getattr(self, handler)(request, headers=headers, endpoint=endpoint, **kwargs)
+        with self.tracer.span(handler, endpoint=endpoint, preference=preference):
+            return getattr(self, handler)(request, headers=headers, endpoint=endpoint, **kwargs)
+
+    def _respond(self, request, environ, start_response):
+        """
+        Handles the request and generates the whole body, so that the body
+        generation is profiled along with the handlers.
+        """
+        response = self.dispatch_request(request)
+        return list(response(environ, start_response))
+
+    # shared by all the requests, see `memento_test.routing` for the fast path
+    url_map = URL_MAP
 
     def dispatch_request(self, request):
         """
@@ -256,20 +520,20 @@ class MementoServer(object):
         :param request:
         :return:
         """
-        request.adapter = adapter = self.url_map.bind_to_environ(
-            request.environ
-        )
-        try:
-            endpoint, values = adapter.match()
+        with self._span("dispatch_request") as span:
+            try:
+                endpoint, values = match_request(self.url_map, request.environ)
+                request.endpoint = endpoint
+                span.set_attribute("endpoint", endpoint)
 
-            logging.debug("endpoint: %s" % endpoint)
-            logging.debug("values: %s" % values)
+                logger.debug("endpoint: %s", endpoint)
+                logger.debug("values: %s", values)
 
-            return self.on_request(request, endpoint, **values)
-        except HTTPException as e:
-            return e
+                return self.on_request(request, endpoint, **values)
+            except HTTPException as e:
+                return e
 
-    def on_request(self, request, endpoint, uri_r=None, mem_dt=None):
+    def on_request(self, request, endpoint, uri_r=None, mem_dt=None, timemap_format=None):
         """
         Processes the request and prepares the response. Mainly checks the `Prefer` header
         and invokes the appropriate method.
@@ -277,57 +541,133 @@ class MementoServer(object):
         :param endpoint: the matched endpoint of the request
         :param uri_r: the uri_r in the request URL
         :param mem_dt: the memento datetime in the request URL
+        :param timemap_format: the format of the TimeMap in the request URL. `link`|`json`
         :return: the werkzeug Response object.
         """
 
         self.uri_r = uri_r
+        self.head = request.method == "HEAD"
+        if timemap_format:
+            self.timemap_format = timemap_format
         if request.headers.get("accept_datetime"):
             self.accept_datetime = convert_to_datetime(request.headers.get("accept_datetime"))
-        prefer = request.headers.get("prefer")
+        self.memento_datetime = self.accept_datetime
+        if endpoint == "memento":
+            try:
+                self.memento_datetime = convert_archive_datetime(mem_dt)
+            except ValueError:
+                return self._response(404, {})
+        requested_datetime = self.memento_datetime
+
+        if uri_r is not None and not self._resolve_timeline():
+            return self._response(404, {})
+        if endpoint == "memento" and (self.memento_datetime != requested_datetime or
+                                      len(str(mem_dt)) != 14):
+            # no memento at the datetime of the URL, or a partial datetime:
+            # redirect to the closest memento, at its canonical URL
+            return self._response(302, {"Location": self._memento_uri(self.memento_datetime)})
+        if endpoint == "timemap":
+            # the binary TimeMaps are only served to the clients asking for them
+            accept = request.headers.get("Accept")
+            self.timemap_binary = bool(accept) and BINARY_TIMEMAP_MIMETYPE in accept and \
+                request.accept_mimetypes[BINARY_TIMEMAP_MIMETYPE] > 0
+            if not self._timemap_slice(request.args):
+                return self._response(400, {})
+        if endpoint == "timemap" and self.timemap_page_size:
+            page = request.args.get("page", "1")
+            if not page.isdigit() or not 1 <= int(page) <= self._timemap_pages():
+                return self._response(404, {})
+            self.timemap_page = int(page)
+        # multiple Prefer headers are equivalent to a single comma separated one
+        prefer = ", ".join(request.headers.getlist("prefer"))
+        with self._span("parse_prefer", endpoint=endpoint, preference=prefer):
+            request.preferences = prefs = parse_prefer(prefer)
 
         headers = {}
         status = 302
 
-        logging.debug("prefer: %s" % prefer)
-        logging.debug("mem_dt: %s" % mem_dt)
+        logger.debug("prefer: %s", prefer)
+        logger.debug("mem_dt: %s", mem_dt)
 
-        if not prefer and endpoint == "original":
-            headers, status = self.on_native_tg_url(request, headers=headers, endpoint=endpoint)
-            return Response(status=status, headers=headers)
-        elif not prefer:
-            headers, status = self.on_all_headers(request, headers=headers, endpoint=endpoint)
-            return Response(status=status, headers=headers)
-
-        prefs = prefer.split(",")
+        if not prefs and endpoint == "original":
+            headers, status = self._handle("on_native_tg_url", request, headers, endpoint)
+            return self._response(status, headers)
+        elif not prefs:
+            headers, status = self._handle("on_all_headers", request, headers, endpoint)
+            if endpoint == "memento" and status == 200:
+                self._payload(headers)
+            return self._response(status, headers)
 
         pref_applied = []
-        for p in prefs:
-            p = p.strip()
+        scenarios = 0
+        minimal = False
+        for pref in prefs:
+            p = pref.name
+
+            if p == "return":
+                if pref.value in RETURN_PREFERENCE_VALUES:
+                    minimal = pref.value == "minimal"
+                    pref_applied.append(format_preference(p, pref.value))
+                continue
+            if self.scenarios is not None and p not in self.scenarios:
+                continue
 
             if endpoint == "memento" and p in MEMENTO_PREFERENCES:
-                headers, status = getattr(self, "on_" + p) \
-                    (request, headers=headers, endpoint="memento", mem_dt=mem_dt)
-                pref_applied.append(p)
+                headers, status = self._handle("on_" + p, request, headers, "memento",
+                                               preference=p, mem_dt=mem_dt)
             elif endpoint == "original" and p in ORGINAL_PREFERENCES:
-                headers, status = getattr(self, "on_" + p) \
-                    (request, headers=headers, endpoint="original", mem_dt=mem_dt)
-                pref_applied.append(p)
+                headers, status = self._handle("on_" + p, request, headers, "original",
+                                               preference=p, mem_dt=mem_dt)
+            elif endpoint == "timemap":
+                if p not in (BINARY_TIMEMAP_PREFERENCES if self.timemap_binary
+                             else TIMEMAP_PREFERENCES):
+                    continue
+                headers, status = self._handle("on_" + p, request, headers, "timemap",
+                                               preference=p)
             elif p in TG_PREFERENCES:
-                headers, status = getattr(self, "on_" + p) \
-                    (request, headers=headers, endpoint="timegate")
-                pref_applied.append(p)
-
-        logging.debug("Preference applied: %s" % pref_applied)
-        if len(pref_applied) > 0:
-            headers["Preference-Applied"] = ", ".join(pref_applied)
-        else:
-            if endpoint in ["memento", "timegate"]:
-                headers, status = self.on_all_headers(request, headers=headers, endpoint=endpoint)
+                headers, status = self._handle("on_" + p, request, headers, "timegate",
+                                               preference=p)
+            else:
+                continue
+            scenarios += 1
+            pref_applied.append(format_preference(p))
+
+        logger.debug("Preference applied: %s", pref_applied)
+        if not scenarios:
+            if endpoint in ["memento", "timegate", "timemap"]:
+                headers, status = self._handle("on_all_headers", request, headers, endpoint)
             elif endpoint == "original":
-                headers, status = self.on_native_tg_url(request, headers=headers,
-                                                      endpoint=endpoint, mem_dt=mem_dt)
+                headers, status = self._handle("on_native_tg_url", request, headers,
+                                               endpoint, mem_dt=mem_dt)
+        if pref_applied:
+            headers["Preference-Applied"] = ", ".join(pref_applied)
+        if endpoint == "memento" and status == 200:
+            self._payload(headers)
+        if minimal:
+            self.body = None
+            self.streamed = False
+            headers.pop("Content-Length", None)
+            headers.pop("ETag", None)
+
+        return self._response(status, headers)
 
-        return Response(status=status, headers=headers)
+    def _response(self, status, headers):
+        """
+        The response of the request. A HEAD request gets the headers of the GET
+        request, without a body or a werkzeug Response.
+        :param status: (int) The HTTP status.
+        :param headers: dict: the headers of the response.
+        :return: a WSGI application sending the response.
+        """
+        if not self.head:
+            return Response(self.body, status=status, headers=headers)
+        headers = list(headers.items())
+        names = set(name.lower() for name, value in headers)
+        if "content-type" not in names:
+            headers.append(("Content-Type", DEFAULT_CONTENT_TYPE))
+        if not self.streamed and "content-length" not in names:
+            headers.append(("Content-Length", "0"))
+        return HeadResponse(status, headers)
 
     def on_native_tg_url(self, request, headers=None, endpoint=None, mem_dt=None):
         """
@@ -339,8 +679,7 @@ class MementoServer(object):
         what IA provides. eg: 20150101243059
         :return: (dict: int) (headers, HTTP status)
         """
-        urls = self.url_map.bind(HOST_NAME[:-1], "/")
-        tg_url = urls.build("timegate", {"uri_r": HOST_NAME}, force_external=True)[7:]
+        tg_url = self.host_name + "tg/" + self.host_name
         headers["Link"] = LINK_TMPL % (tg_url, "timegate")
         return headers, 200
 
@@ -366,7 +705,7 @@ class MementoServer(object):
         what IA provides. eg: 20150101243059
         :return: (dict: int) (headers, HTTP status)
         """
-        headers["Location"] = HOST_NAME
+        headers["Location"] = self.host_name
         return headers, 302
 
     def on_all_headers(self, request, headers=None, endpoint=None,
@@ -381,15 +720,17 @@ class MementoServer(object):
         :return: (dict: int) (headers, HTTP status)
         """
 
+        if endpoint == "timemap":
+            return self._timemap(headers), 200
+
         headers["Link"] = self._create_link_header()
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         if endpoint == "memento":
             headers["Memento-Datetime"] = mem_http_dt
             return headers, 200
         elif endpoint == "timegate":
             headers["Vary"] = "accept-datetime"
-            mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                      "/" + self.uri_r
+            mem_uri = self._memento_uri(self.memento_datetime)
             headers["Location"] = mem_uri
             return headers, 302
 
@@ -406,14 +747,13 @@ class MementoServer(object):
         """
 
         headers["Link"] = self._create_link_header(original=True, memento=False, first=False, last=False)
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         if endpoint == "memento":
             headers["Memento-Datetime"] = mem_http_dt
             return headers, 200
         elif endpoint == "timegate":
             headers["Vary"] = "accept-datetime"
-            mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                      "/" + self.uri_r
+            mem_uri = self._memento_uri(self.memento_datetime)
             headers["Location"] = mem_uri
             return headers, 302
 
@@ -432,8 +772,7 @@ class MementoServer(object):
         if endpoint == "memento":
             return headers, 200
         elif endpoint == "timegate":
-            headers["Location"] = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
+            headers["Location"] = self._memento_uri(self.memento_datetime)
             return headers, 302
 
     def on_no_link_header(self, request, headers=None, endpoint=None,
@@ -448,14 +787,13 @@ class MementoServer(object):
         :return: (dict: int) (headers, HTTP status)
         """
 
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         if endpoint == "memento":
             headers["Memento-Datetime"] = mem_http_dt
             return headers, 200
         elif endpoint == "timegate":
             headers["Vary"] = "accept-datetime"
-            mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                      "/" + self.uri_r
+            mem_uri = self._memento_uri(self.memento_datetime)
             headers["Location"] = mem_uri
             return headers, 302
 
@@ -471,8 +809,7 @@ class MementoServer(object):
         :return: (dict: int) (headers, HTTP status)
         """
         headers["Link"] = self._create_link_header()
-        mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
+        mem_uri = self._memento_uri(self.memento_datetime)
         headers["Location"] = mem_uri
         return headers, 302
 
@@ -487,15 +824,16 @@ class MementoServer(object):
         what IA provides. eg: 20150101243059
         :return: (dict: int) (headers, HTTP status)
         """
+        if endpoint == "timemap":
+            return self._timemap(headers, original=False), 200
         headers["Link"] = self._create_link_header(original=False)
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         if endpoint == "memento":
             headers["Memento-Datetime"] = mem_http_dt
             return headers, 200
         elif endpoint == "timegate":
             headers["Vary"] = "accept-datetime"
-            mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                      "/" + self.uri_r
+            mem_uri = self._memento_uri(self.memento_datetime)
             headers["Location"] = mem_uri
             return headers, 302
 
@@ -512,8 +850,7 @@ class MementoServer(object):
         """
         headers["Link"] = self._create_link_header()
         headers["Vary"] = "accept-dt"
-        mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
+        mem_uri = self._memento_uri(self.memento_datetime)
         headers["Location"] = mem_uri
         return headers, 302
 
@@ -528,16 +865,17 @@ class MementoServer(object):
         what IA provides. eg: 20150101243059
         :return: (dict: int) (headers, HTTP status)
         """
+        if endpoint == "timemap":
+            return self._timemap(headers, invalid=True), 200
         #link_header = self._create_link_header()
         headers["Link"] = "<sfafafasfasfafafafafaf, rel='ssss'"
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         if endpoint == "memento":
             headers["Memento-Datetime"] = mem_http_dt
             return headers, 200
         elif endpoint == "timegate":
             headers["Vary"] = "accept-datetime"
-            mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                      "/" + self.uri_r
+            mem_uri = self._memento_uri(self.memento_datetime)
             headers["Location"] = mem_uri
             return headers, 302
 
@@ -552,22 +890,22 @@ class MementoServer(object):
         what IA provides. eg: 20150101243059
         :return: (dict: int) (headers, HTTP status)
         """
+        if endpoint == "timemap":
+            return self._timemap(headers, invalid_datetime=True), 200
 
-        mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
+        mem_uri = self._memento_uri(self.memento_datetime)
 
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         link_header = LINK_TMPL % (mem_uri, "memento") + \
             LINK_ADD_PARAM % ("datetime", mem_http_dt[:-2])
         headers["Link"] = link_header
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         if endpoint == "memento":
             headers["Memento-Datetime"] = mem_http_dt
             return headers, 200
         elif endpoint == "timegate":
             headers["Vary"] = "accept-datetime"
-            mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                      "/" + self.uri_r
+            mem_uri = self._memento_uri(self.memento_datetime)
             headers["Location"] = mem_uri
             return headers, 302
 
@@ -589,6 +927,22 @@ class MementoServer(object):
         else:
             return self.on_all_headers(request, headers, endpoint)
 
+    def on_not_archived(self, request, headers=None, endpoint=None,
+                        mem_dt=None):
+        """
+        A `404` response, as if the URI-R was not archived, without any Memento header.
+        :param request: The request object
+        :param headers: dict: the appropriate memento headers to be returned
+        :param endpoint: str: the memento endpoint the request was for. `memento`|`timegate`|`timemap`
+        :param mem_dt: str: The datetime string provided in the request url similar to
+        what IA provides. eg: 20150101243059
+        :return: (dict: int) (headers, HTTP status)
+        """
+        headers.clear()
+        self.body = None
+        self.streamed = False
+        return headers, 404
+
     def on_tg_no_redirect(self, request, headers=None, endpoint=None,
                           mem_dt=None):
         """
@@ -615,8 +969,7 @@ class MementoServer(object):
         """
         headers["Link"] = self._create_link_header()
         headers["Vary"] = "accept-datetime"
-        mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
+        mem_uri = self._memento_uri(self.memento_datetime)
         headers["Location"] = mem_uri
         return headers, 302
 
@@ -633,8 +986,7 @@ class MementoServer(object):
         """
         headers["Link"] = self._create_link_header()
         headers["Vary"] = "accept-datetime"
-        mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
+        mem_uri = self._memento_uri(self.memento_datetime)
         headers["Location"] = mem_uri
         return headers, 303
 
@@ -651,10 +1003,9 @@ class MementoServer(object):
         """
         headers["Link"] = self._create_link_header()
         headers["Vary"] = "accept-datetime"
-        mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
+        mem_uri = self._memento_uri(self.memento_datetime)
         headers["Content-Location"] = mem_uri
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         headers["Memento-Datetime"] = mem_http_dt
         return headers, 200
 
@@ -760,10 +1111,9 @@ is provided in the request.
         """
         headers["Link"] = self._create_link_header()
         headers["Vary"] = "accept-datetime"
-        mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
+        mem_uri = self._memento_uri(self.memento_datetime)
         headers["Location"] = mem_uri
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         headers["Vary"] = "accept-datetime"
         headers["Memento-Datetime"] = mem_http_dt
         return headers, 302
@@ -779,7 +1129,7 @@ is provided in the request.
         what IA provides. eg: 20150101243059
         :return: (dict: int) (headers, HTTP status)
         """
-        logging.debug("no_memenot_dt_hd")
+        logger.debug("no_memenot_dt_hd")
         headers["Link"] = self._create_link_header()
         return headers, 200
 
@@ -795,7 +1145,7 @@ is provided in the request.
         :return: (dict: int) (headers, HTTP status)
         """
         headers["Link"] = self._create_link_header(original=False)
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         headers["Memento-Datetime"] = mem_http_dt[:-2]
         return headers, 200
 
@@ -811,10 +1161,10 @@ is provided in the request.
         :return: (dict: int) (headers, HTTP status)
         """
         headers["Link"] = self._create_link_header()
-        mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+        mem_http_dt = convert_to_http_datetime(self.memento_datetime)
         headers["Memento-Datetime"] = mem_http_dt
-        headers["Location"] = HOST_NAME + \
-            self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT)[:-6] + \
+        headers["Location"] = self.host_name + \
+            self.memento_datetime.strftime(ARCHIVE_DATE_FORMAT)[:-6] + \
             "/" + self.uri_r
         return headers, 302
 
@@ -829,9 +1179,9 @@ is provided in the request.
         what IA provides. eg: 20150101243059
         :return: (dict: int) (headers, HTTP status)
         """
-        headers["Location"] = HOST_NAME + \
-                              self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT)[:-6] + \
-                              "/" + self.uri_r
+        headers["Location"] = self.host_name + \
+            self.memento_datetime.strftime(ARCHIVE_DATE_FORMAT)[:-6] + \
+            "/" + self.uri_r
         return headers, 302
 
     def on_invalid_archived_redirect(self, request, headers=None,
@@ -861,37 +1211,248 @@ is provided in the request.
         """
         return headers, 302
 
+    def _resolve_timeline(self):
+        """
+        Looks up the timeline of the URI-R in the archive, and sets the first, last
+        and memento datetimes from it. The memento datetime becomes the memento
+        closest to the requested one. Without an archive, the timeline is made of
+        the default first, memento and last datetimes.
+        :return: (bool) False if the URI-R is not archived.
+        """
+        if self.archive is None:
+            memento = to_epoch(self.memento_datetime)
+            self.timeline = sorted({to_epoch(self.first_datetime), memento,
+                                    to_epoch(self.last_datetime)})
+            # a memento URL may be out of the default bounds
+            if memento == self.timeline[0]:
+                self.first_datetime = self.memento_datetime
+            if memento == self.timeline[-1]:
+                self.last_datetime = self.memento_datetime
+            return True
+
+        timeline = self.archive.timeline(self.uri_r)
+        if timeline is None or not len(timeline):
+            return False
+        epochs = timeline_epochs(timeline)
+        self.timeline = timeline
+        self.first_datetime = from_epoch(epochs[0])
+        self.last_datetime = from_epoch(epochs[-1])
+        self.memento_datetime = from_epoch(
+            closest_memento(timeline, to_epoch(self.memento_datetime)))
+        return True
+
+    def _timemap(self, headers, **options):
+        """
+        Streams the TimeMap of the URI-R, in the format of the request URL or in the
+        binary format when the request accepts it, as the response body. Only the
+        mementos between the `from` and `until` arguments are listed, and the first
+        and last mementos are those of this slice. The options of the serializer
+        accumulate over the applied preferences. HEAD requests
+        only get the Content-Length and the ETag.
+        :param headers: dict: the headers of the response.
+        :param options: the malformation options of the serializer, see
+        `memento_test.timemap`.
+        :return: dict: the headers of the response.
+        """
+        self.timemap_options.update(options)
+        timegate_uri = self.host_name + "tg/" + self.uri_r
+        timemap_uri = self.host_name + "timemap/" + self.timemap_format + "/" + self.uri_r
+        link_format_uri = self.host_name + "timemap/link/" + self.uri_r
+        timeline = self._timemap_timeline()
+        page = self.timemap_page
+        page_options = {}
+        if self.timemap_page_size:
+            pages = {}
+            if page > 1:
+                pages["prev"] = self._timemap_page_uri(timemap_uri, page - 1)
+            if page < self._timemap_pages():
+                pages["next"] = self._timemap_page_uri(timemap_uri, page + 1)
+            page_options = {"start": (page - 1) * self.timemap_page_size,
+                            "stop": page * self.timemap_page_size, "pages": pages}
+        timemap_uri = self._timemap_page_uri(timemap_uri, page)
+        link_format_uri = self._timemap_page_uri(link_format_uri, page)
+        options = dict(self.timemap_options, **page_options)
+        headers["Vary"] = "accept"
+        if self.timemap_binary:
+            headers["Content-Type"] = BINARY_TIMEMAP_MIMETYPE
+            args = (self.uri_r, timeline, self.host_name, timemap_uri, timegate_uri)
+            serializer, length = binary_timemap, binary_timemap_length
+        elif self.timemap_format == "json":
+            headers["Content-Type"] = JSON_MIMETYPE
+            args = (self.uri_r, timeline, self.host_name,
+                    {"link_format": link_format_uri, "json_format": timemap_uri}, timegate_uri)
+            serializer, length = json_timemap, json_timemap_length
+        else:
+            headers["Content-Type"] = LINK_FORMAT_MIMETYPE
+            args = (self.uri_r, timeline, self.host_name, timemap_uri, timegate_uri)
+            serializer, length = link_format_timemap, link_format_timemap_length
+        # the length and the ETag are computed from the timeline, so that HEAD
+        # requests do not serialize the TimeMap
+        headers["Content-Length"] = str(length(*args, **options))
+        epochs = timeline_epochs(timeline)
+        bounds = [int(epochs[i]) for i in (0, -1)] if len(epochs) else []
+        headers["ETag"] = entity_tag((self.timemap_format, self.timemap_binary, self.uri_r,
+                                      self.host_name, len(epochs), bounds,
+                                      sorted(options.items())), weak=True)
+        self.streamed = True
+        if self.head:
+            return headers
+        if self.single_flight is not None and \
+                int(headers["Content-Length"]) <= COALESCE_MAX_BYTES:
+            # the concurrent requests of the same TimeMap share its chunks as it is
+            # streamed, a lone request does not keep them
+            key = ("timemap", self.host_name, self.uri_r, self.timemap_format,
+                   self.timemap_binary, self.timemap_bounds, self.timemap_page,
+                   tuple(sorted(self.timemap_options.items())))
+            self.body = self.single_flight.stream(key, _serialize, serializer, args, options)
+        else:
+            self.body = serializer(*args, **options)
+        return headers
+
+    def _timemap_slice(self, args):
+        """
+        Locates the mementos between the `from` and `until` arguments of the request,
+        by binary search in the timeline. The bounds are included, and are 4 to 14
+        digit datetimes like those of the memento URLs. `until` is the end of its
+        period. eg: ?from=20170101&until=2018 is up to 20181231235959
+        :param args: the arguments of the request.
+        :return: (bool) False if a bound is not a valid datetime.
+        """
+        start, stop = 0, len(timeline_epochs(self.timeline))
+        query = []
+        for name in ("from", "until"):
+            value = args.get(name)
+            if value is None:
+                continue
+            convert = convert_archive_datetime if name == "from" else \
+                convert_archive_datetime_end
+            try:
+                seconds = to_epoch(convert(value))
+            except ValueError:
+                return False
+            if name == "from":
+                start = bisect_timeline(self.timeline, seconds)
+            else:
+                stop = bisect_timeline(self.timeline, seconds, right=True)
+            query.append("%s=%s" % (name, value))
+        self.timemap_bounds = (start, max(start, stop))
+        self.timemap_query = query
+        return True
+
+    def _timemap_timeline(self):
+        """
+        :return: The mementos between the bounds of the request, a view of the
+        timeline that is not copied.
+        """
+        start, stop = self.timemap_bounds
+        if start == 0 and stop == len(timeline_epochs(self.timeline)):
+            return self.timeline
+        if isinstance(self.timeline, array):
+            return memoryview(self.timeline)[start:stop]
+        return self.timeline[start:stop]
+
+    def _timemap_pages(self):
+        start, stop = self.timemap_bounds
+        return max(1, (stop - start + self.timemap_page_size - 1) // self.timemap_page_size)
+
+    def _timemap_page_uri(self, timemap_uri, page):
+        """
+        :return: (str) The URI of a page of the TimeMap, with the bounds of the request.
+        """
+        query = self.timemap_query
+        if page > 1:
+            query = query + ["page=%d" % page]
+        return timemap_uri + "?" + "&".join(query) if query else timemap_uri
+
+    def _payload(self, headers):
+        """
+        Streams the payload of the memento as the response body, when the archive
+        has payloads, eg: `memento_test.warc.WarcArchive`. The URLs of HTML
+        payloads are rewritten to the archive, unless their content coding is not
+        decoded, see `WarcRecord.decode`. HEAD requests only get the headers.
+        :param headers: dict: the headers of the response.
+        :return: dict: the headers of the response.
+        """
+        if not hasattr(self.archive, "payload"):
+            return headers
+        record = self.archive.record(self.uri_r, to_epoch(self.memento_datetime))
+        if record is None:
+            return headers
+        headers["Content-Type"] = record.content_type
+        tag = (record.path, record.offset, record.payload_offset, record.payload_length)
+        self.streamed = True
+        if record.content_encoding:
+            # a coding that is not decoded, the payload is not rewritten
+            headers["Content-Encoding"] = record.content_encoding
+        if record.content_type.startswith("text/html") and not record.content_encoding:
+            # the links of the page lead to the mementos of the same datetime
+            prefix = self._archive_prefix(self.memento_datetime)
+            headers["ETag"] = entity_tag(tag + (self.uri_r, prefix))
+            if not self.head:
+                self.body = rewrite_html(self.archive.payload(record), self.uri_r, prefix)
+        else:
+            headers["Content-Length"] = str(record.body_length)
+            headers["ETag"] = entity_tag(tag)
+            if not self.head:
+                self.body = self.archive.payload(record)
+        return headers
+
+    def _archive_prefix(self, dt):
+        return self.host_name + dt.strftime(ARCHIVE_DATE_FORMAT) + "/"
+
+    def _memento_uri(self, dt):
+        return self._archive_prefix(dt) + self.uri_r
+
     def _create_link_header(self, original=True, memento=True, first=True, last=True):
+        if self.tracer is None:
+            return self._link_header(original, memento, first, last)
+        with self.tracer.span("create_link_header"):
+            return self._link_header(original, memento, first, last)
+
+    def _link_header(self, original, memento, first, last):
 
         lh = []
         if original:
             lh.append(LINK_TMPL % (self.uri_r, "original"))
         if first:
-            first_uri = HOST_NAME + self.first_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                    "/" + self.uri_r
+            first_uri = self._memento_uri(self.first_datetime)
             lh.append(LINK_TMPL % (first_uri, "first memento") +
                   LINK_ADD_PARAM % ("datetime", convert_to_http_datetime(self.first_datetime)))
 
         if last:
-            last_uri = HOST_NAME + self.last_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                   "/" + self.uri_r
+            last_uri = self._memento_uri(self.last_datetime)
             lh.append(LINK_TMPL % (last_uri, "last memento") +
                   LINK_ADD_PARAM % ("datetime", convert_to_http_datetime(self.last_datetime)))
         if memento:
-            mem_uri = HOST_NAME + self.accept_datetime.strftime(ARCHIVE_DATE_FORMAT) + \
-                  "/" + self.uri_r
-
-            mem_http_dt = convert_to_http_datetime(self.accept_datetime)
+            mem_uri = self._memento_uri(self.memento_datetime)
+            mem_http_dt = convert_to_http_datetime(self.memento_datetime)
             lh.append(LINK_TMPL % (mem_uri, "memento") +
                   LINK_ADD_PARAM % ("datetime", mem_http_dt))
 
         return ", ".join(lh)
 
 
+def create_application(**options):
+    """
+    Creates a WSGI application that serves every request with a new
+    MementoServer created with the options. The concurrent requests of the same
+    TimeMap are coalesced by a SingleFlight shared by the requests, unless the
+    `single_flight` option is given.
+    eg: create_application(archive=SyntheticArchive(seed=1))
+    :param options: keyword arguments of MementoServer.
+    :return: the WSGI application.
+    """
+    options.setdefault("single_flight", SingleFlight())
+    def _application(environ, start_response):
+        app = MementoServer(**options)
+        return app(environ, start_response)
+    return _application
+
+
 def application(environ, start_response):
     app = MementoServer()
     return app(environ, start_response)
 
 if __name__ == "__main__":
-    from werkzeug.serving import run_simple
-    run_simple("localhost", 4000, application)
+    from memento_test.serving import serve
+    serve(lambda: application, "localhost", 4000)
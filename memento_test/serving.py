@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Serving the Memento Test Server with one or more pre-forked worker processes.
+
+The master process binds the listening socket, and prepares anything that
+should be shared (eg: a memento index packed by `memento_test.shared_index`)
+before forking. Each worker then creates its application with `app_factory`
+and accepts connections on the inherited socket.
+
+The server listens on a TCP address, on a Unix domain socket with a
+`unix://<path>` host, or on a socket inherited from the parent process,
+eg: with systemd socket activation (`LISTEN_FDS`). Clients on the same host
+avoid the TCP loopback and the port management with a Unix domain socket:
+    $ memento_test_server --host unix:///tmp/memento.sock --workers 4
+    $ curl --unix-socket /tmp/memento.sock -I http://localhost/tg/http://www.espn.com
+
+The connections are kept open by default, over HTTP/1.1, see
+`memento_test.keepalive`, and closed after `idle_timeout` seconds without a request.
+"""
+
+import logging
+import os
+import signal
+import socket
+import stat
+import sys
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+from werkzeug.serving import make_server, run_simple, select_address_family, get_sockaddr
+
+from memento_test.keepalive import KeepAliveWSGIServer, DEFAULT_IDLE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+UNIX_PREFIX = "unix://"
+# the first file descriptor passed by systemd socket activation
+SD_LISTEN_FDS_START = 3
+
+
+def unix_socket_path(host):
+    """
+    :param host: (str) A host name, address or `unix://<path>`.
+    :return: (str) The absolute path of the Unix domain socket, or None for TCP hosts.
+    """
+    if not host.startswith(UNIX_PREFIX):
+        return
+    return os.path.abspath(host[len(UNIX_PREFIX):])
+
+
+def bind_socket(host, port, backlog=128):
+    """
+    Creates a listening socket. A stale Unix domain socket file left by a
+    previous server is removed.
+    :param host: (str) The host name or address to bind to, or `unix://<path>`.
+    :param port: (int) The port to bind to, 0 for any free port. Ignored for
+    Unix domain sockets.
+    :param backlog: (int) The size of the accept queue.
+    :return: (socket) The listening socket.
+    """
+    family = select_address_family(host, port)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        path = unix_socket_path(host)
+        if path is not None:
+            if os.path.exists(path) and stat.S_ISSOCK(os.stat(path).st_mode):
+                os.unlink(path)
+            sock.bind(path)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(get_sockaddr(host, int(port), family))
+        sock.listen(backlog)
+    except BaseException:
+        sock.close()
+        raise
+    return sock
+
+
+def listen_fds(unset_environment=True):
+    """
+    Returns the file descriptors passed by systemd socket activation, like
+    `sd_listen_fds`. They are only for this process when `LISTEN_PID` is its pid.
+    :param unset_environment: (bool) Remove the variables, so that child processes
+    do not use the file descriptors too.
+    :return: (list) The file descriptors, empty without socket activation.
+    """
+    try:
+        pid = int(os.environ.get("LISTEN_PID", ""))
+        count = int(os.environ.get("LISTEN_FDS", ""))
+    except ValueError:
+        return []
+    if unset_environment:
+        for name in ("LISTEN_PID", "LISTEN_FDS", "LISTEN_FDNAMES"):
+            os.environ.pop(name, None)
+    if pid != os.getpid() or count <= 0:
+        return []
+    return list(range(SD_LISTEN_FDS_START, SD_LISTEN_FDS_START + count))
+
+
+def inherited_socket(fd):
+    """
+    Wraps an inherited listening socket, eg: from systemd or a supervisor.
+    :param fd: (int) The file descriptor of the socket.
+    :return: (socket) The listening socket, of the family it was created with.
+    :raises: ValueError if the file descriptor is not a stream socket.
+    """
+    try:
+        sock = socket.socket(fileno=fd)
+    except OSError as e:
+        raise ValueError("File descriptor %d is not a socket: %s" % (fd, e))
+    if sock.type != socket.SOCK_STREAM:
+        sock.detach()
+        raise ValueError("File descriptor %d is not a stream socket" % fd)
+    return sock
+
+
+def socket_address(sock):
+    """
+    :param sock: (socket) A bound socket.
+    :return: (str, int) The host and the port of the socket, as `make_server`
+    expects them. eg: ("unix:///tmp/memento.sock", 0)
+    """
+    address = sock.getsockname()
+    if sock.family == getattr(socket, "AF_UNIX", None):
+        if isinstance(address, bytes):
+            address = address.decode("utf-8", "surrogateescape")
+        return UNIX_PREFIX + address, 0
+    return address[0], address[1]
+
+
+def make_worker_server(app, sock, threaded=False, keep_alive=False,
+                       idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Creates a server accepting connections on an already bound socket.
+    :param app: The WSGI application.
+    :param sock: (socket) The listening socket.
+    :param threaded: (bool) Handle each request in a new thread.
+    :param keep_alive: (bool) Keep the HTTP/1.1 connections open, with a thread per
+    connection whatever `threaded`, see `memento_test.keepalive`.
+    :param idle_timeout: (float) The seconds before an idle connection is closed,
+    with `keep_alive`.
+    :return: (BaseWSGIServer) The server, not started.
+    """
+    host, port = socket_address(sock)
+    if keep_alive:
+        return KeepAliveWSGIServer(host, port, app, idle_timeout=idle_timeout,
+                                   fd=sock.fileno())
+    return make_server(host, port, app, threaded=threaded, fd=sock.fileno())
+
+
+def run_worker(app_factory, sock, threaded=False, keep_alive=False,
+               idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Serves requests on an already bound socket until interrupted.
+    :param app_factory: A callable returning the WSGI application.
+    :param sock: (socket) The listening socket.
+    :param threaded: (bool) Handle each request in a new thread.
+    :param keep_alive: (bool) Keep the HTTP/1.1 connections open.
+    :param idle_timeout: (float) The seconds before an idle connection is closed.
+    """
+    make_worker_server(app_factory(), sock, threaded=threaded, keep_alive=keep_alive,
+                       idle_timeout=idle_timeout).serve_forever()
+
+
+class UnixHTTPConnection(HTTPConnection):
+    """
+    An `http.client` connection to a server listening on a Unix domain socket.
+    eg: UnixHTTPConnection("/tmp/memento.sock").request("HEAD", "/tg/http://www.espn.com")
+    """
+
+    def __init__(self, path, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+        HTTPConnection.__init__(self, "localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except BaseException:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def serve(app_factory, host="localhost", port=4000, workers=1, threaded=False, fd=None,
+          keep_alive=True, idle_timeout=DEFAULT_IDLE_TIMEOUT):
+    """
+    Runs the server, forking `workers` worker processes if more than one.
+    :param app_factory: A callable returning the WSGI application, called once in
+    each worker.
+    :param host: (str) The host name or address to bind to, or `unix://<path>`.
+    :param port: (int) The port to bind to.
+    :param workers: (int) The number of worker processes.
+    :param threaded: (bool) Handle each request in a new thread.
+    :param fd: (int) The file descriptor of an inherited listening socket to serve
+    instead of binding `host` and `port`.
+    :param keep_alive: (bool) Keep the HTTP/1.1 connections open, with a thread per
+    connection. Otherwise every connection is closed after its response.
+    :param idle_timeout: (float) The seconds before an idle connection is closed,
+    with `keep_alive`.
+    """
+    if fd is not None:
+        sock = inherited_socket(fd)
+        path = None
+    elif workers <= 1 and not keep_alive:
+        run_simple(host, port, app_factory(), threaded=threaded)
+        return
+    else:
+        sock = bind_socket(host, port)
+        path = unix_socket_path(host)
+    options = {"threaded": threaded, "keep_alive": keep_alive, "idle_timeout": idle_timeout}
+
+    if workers <= 1:
+        host, port = socket_address(sock)
+        logger.info("Serving on %s:%s", host, port)
+        try:
+            run_worker(app_factory, sock, **options)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sock.close()
+            if path is not None and os.path.exists(path):
+                os.unlink(path)
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                run_worker(app_factory, sock, **options)
+            except BaseException:
+                logger.exception("Worker %d failed", os.getpid())
+                status = 1
+            finally:
+                os._exit(status)
+        children.append(pid)
+
+    host, port = socket_address(sock)
+    logger.info("Started %d workers on %s:%s", workers, host, port)
+    # let the caller clean up what it shared with the workers on SIGTERM too
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    except (KeyboardInterrupt, SystemExit):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+    finally:
+        sock.close()
+        if path is not None and os.path.exists(path):
+            # only the socket files bound by this process
+            os.unlink(path)
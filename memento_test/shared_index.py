@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+A read-only memento index that pre-forked workers share without copying it.
+
+The index is packed once, by the master process, into a flat buffer: a file
+that workers memory-map, or a `multiprocessing.shared_memory` block that
+workers attach to by name. Attaching only reads a fixed size header, so a
+worker starts in milliseconds whatever the size of the index, and every
+timeline it serves is a `memoryview` of the shared pages.
+
+Layout (little endian, 8 byte aligned):
+
+    header          magic, version, count, offsets of the sections below, the
+                    number of bits and of hashes of the Bloom filter (0 for none)
+    key offsets     (count + 1) int64, into the keys section
+    entry offsets   (count + 1) int64, into the epochs section
+    epochs          int64 epoch seconds, the timelines one after the other
+    keys            the utf-8 SURTs of the URI-Rs, sorted bytewise
+    bloom           the bits of a Bloom filter of the SURTs, 8 byte aligned
+
+The Bloom filter answers the lookups of the URI-Rs that are not archived in
+constant time, without searching the keys, see `memento_test.bloom`.
+
+For example, in the master:
+ ```python
+ write_index(archive.materialize(uri_rs), "/tmp/index.mti")
+ ```
+and in each worker:
+ ```python
+ application = create_application(archive=SharedMementoIndex.open("/tmp/index.mti"))
+ ```
+"""
+
+import mmap
+import struct
+
+from memento_test.archive import timeline_nbytes, numpy
+from memento_test.bloom import BloomFilter, DEFAULT_ERROR_RATE
+from memento_test.surt import surt
+
+INDEX_MAGIC = b"MTINDEX\x00"
+INDEX_VERSION = 3
+
+HEADER = struct.Struct("<8sQQQQQQQQ")
+# the magic and the version, the same in every version of the header
+PREAMBLE = struct.Struct("<8sQ")
+ENTRY = struct.Struct("<q")
+
+
+class IndexFormatError(ValueError):
+    pass
+
+
+class _BufferWriter(object):
+    """
+    A file-like object writing sequentially into a writable buffer.
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+    def write(self, data):
+        data = memoryview(data).cast("B")
+        self.buf[self.pos:self.pos + len(data)] = data
+        self.pos += len(data)
+
+
+def _timeline_bytes(timeline):
+    if numpy is not None and isinstance(timeline, numpy.ndarray):
+        return timeline.view(numpy.int64).astype("<i8", copy=False).tobytes()
+    return timeline
+
+
+class _Layout(object):
+    """
+    The sizes and offsets of the sections of an index, computed before writing.
+    """
+
+    def __init__(self, index, error_rate=DEFAULT_ERROR_RATE):
+        self.keys = sorted((surt(uri_r).encode("utf-8"), uri_r) for uri_r in index.uris())
+        self.index = index
+        self.count = len(self.keys)
+        self.mementos = sum(len(index.timeline(uri_r)) for _, uri_r in self.keys)
+
+        offsets_size = (self.count + 1) * ENTRY.size
+        self.key_offsets = HEADER.size
+        self.entry_offsets = self.key_offsets + offsets_size
+        self.epochs = self.entry_offsets + offsets_size
+        self.keys_offset = self.epochs + self.mementos * ENTRY.size
+        keys_end = self.keys_offset + sum(len(key) for key, _ in self.keys)
+        self.bloom = None
+        self.bloom_offset = self.size = keys_end
+        if error_rate:
+            self.bloom = BloomFilter.for_capacity(self.count, error_rate)
+            for key, _ in self.keys:
+                self.bloom.add(key.decode("utf-8"))
+            self.bloom_offset = (keys_end + 7) // 8 * 8
+            self.size = self.bloom_offset + self.bloom.bits // 8
+
+    def write(self, out):
+        bloom = self.bloom
+        out.write(HEADER.pack(INDEX_MAGIC, INDEX_VERSION, self.count,
+                              self.entry_offsets, self.epochs, self.keys_offset,
+                              self.bloom_offset, bloom.bits if bloom else 0,
+                              bloom.hashes if bloom else 0))
+        position = 0
+        out.write(ENTRY.pack(position))
+        for key, _ in self.keys:
+            position += len(key)
+            out.write(ENTRY.pack(position))
+
+        position = 0
+        out.write(ENTRY.pack(position))
+        for _, uri_r in self.keys:
+            position += len(self.index.timeline(uri_r))
+            out.write(ENTRY.pack(position))
+
+        for _, uri_r in self.keys:
+            out.write(_timeline_bytes(self.index.timeline(uri_r)))
+        for key, _ in self.keys:
+            out.write(key)
+        if bloom:
+            out.write(b"\x00" * (self.bloom_offset - self.keys_offset -
+                                 sum(len(key) for key, _ in self.keys)))
+            out.write(bloom.tobytes())
+
+
+def write_index(index, path, error_rate=DEFAULT_ERROR_RATE):
+    """
+    Packs a memento index into a file that can be shared with SharedMementoIndex.open.
+    :param index: A MementoIndex, or any object with `uris()` and `timeline(uri_r)`.
+    :param path: (str) The path of the index file.
+    :param error_rate: (float) The false positive rate of the Bloom filter of the
+    URI-Rs, or None for no filter.
+    :return: (int) The size of the file in bytes.
+    """
+    with open(path, "wb") as f:
+        return pack_index(index, f, error_rate)
+
+
+def pack_index(index, out, error_rate=DEFAULT_ERROR_RATE):
+    """
+    Packs a memento index into a file-like object, eg: after the header of a snapshot.
+    :param index: A MementoIndex, or any object with `uris()` and `timeline(uri_r)`.
+    :param out: A file-like object, written sequentially from its current position.
+    :param error_rate: (float) The false positive rate of the Bloom filter of the
+    URI-Rs, or None for no filter.
+    :return: (int) The size of the packed index in bytes.
+    """
+    layout = _Layout(index, error_rate)
+    layout.write(out)
+    return layout.size
+
+
+def share_index(index, name=None, error_rate=DEFAULT_ERROR_RATE):
+    """
+    Packs a memento index into a new shared memory block.
+    The caller owns the block and must `close()` and `unlink()` it when done.
+    :param index: A MementoIndex, or any object with `uris()` and `timeline(uri_r)`.
+    :param name: (str) The name of the block, a random name if None.
+    :param error_rate: (float) The false positive rate of the Bloom filter of the
+    URI-Rs, or None for no filter.
+    :return: (SharedMemory) The shared memory block.
+    """
+    from multiprocessing import shared_memory
+
+    layout = _Layout(index, error_rate)
+    block = shared_memory.SharedMemory(name=name, create=True, size=max(layout.size, 1))
+    layout.write(_BufferWriter(block.buf))
+    return block
+
+
+class SharedMementoIndex(object):
+    """
+    A read-only URI-R -> timeline index over a packed buffer.
+
+    Timelines are returned as `memoryview`s of int64 epoch seconds, or as
+    NumPy `datetime64[s]` views when `use_numpy` is set, both without copying.
+    The URI-Rs rejected by the Bloom filter of the index are counted in
+    `bloom_rejections`.
+    """
+
+    def __init__(self, buf, use_numpy=False, owner=None, offset=0):
+        """
+        :param buf: A buffer holding a packed index.
+        :param use_numpy: (bool) Return timelines as NumPy arrays.
+        :param owner: The object owning the buffer, closed by `close()`.
+        :param offset: (int) The offset of the index in the buffer, eg: in a snapshot.
+        """
+        self._buf = memoryview(buf).cast("B")
+        self._view = self._buf[offset:]
+        self.use_numpy = use_numpy and numpy is not None
+        self._owner = owner
+
+        if len(self._view) < PREAMBLE.size:
+            raise IndexFormatError("Memento index too small")
+        magic, version = PREAMBLE.unpack_from(self._view)
+        if magic != INDEX_MAGIC:
+            raise IndexFormatError("Not a memento index")
+        if version != INDEX_VERSION:
+            raise IndexFormatError("Unsupported memento index version: %s" % version)
+        if len(self._view) < HEADER.size:
+            raise IndexFormatError("Memento index too small")
+        self.count, entry_offsets, epochs, keys, bloom, bloom_bits, bloom_hashes = \
+            HEADER.unpack_from(self._view)[2:]
+
+        offsets_size = (self.count + 1) * ENTRY.size
+        self._key_offsets = self._view[HEADER.size:HEADER.size + offsets_size].cast("q")
+        self._entry_offsets = self._view[entry_offsets:entry_offsets + offsets_size].cast("q")
+        self._epochs = self._view[epochs:keys].cast("q")
+        self._keys = self._view[keys:bloom]
+        self.bloom = None
+        self.bloom_rejections = 0
+        if bloom_bits:
+            self.bloom = BloomFilter(bloom_bits, bloom_hashes,
+                                     self._view[bloom:bloom + bloom_bits // 8])
+
+    @classmethod
+    def open(cls, path, use_numpy=False):
+        """
+        Memory-maps an index file, read-only.
+        :param path: (str) The path of the index file.
+        :param use_numpy: (bool) Return timelines as NumPy arrays.
+        :return: (SharedMementoIndex) The index.
+        """
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped, use_numpy=use_numpy, owner=mapped)
+
+    @classmethod
+    def attach(cls, name, use_numpy=False):
+        """
+        Attaches to an index packed into a shared memory block by share_index.
+        :param name: (str) The name of the shared memory block.
+        :param use_numpy: (bool) Return timelines as NumPy arrays.
+        :return: (SharedMementoIndex) The index.
+        """
+        from multiprocessing import shared_memory, resource_tracker
+
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            # the block belongs to the process that created it, it must not be
+            # unlinked when this process exits
+            resource_tracker.unregister(block._name, "shared_memory")
+        except Exception:
+            pass
+        return cls(block.buf, use_numpy=use_numpy, owner=block)
+
+    def _key(self, i):
+        return self._keys[self._key_offsets[i]:self._key_offsets[i + 1]].tobytes()
+
+    def _find(self, uri_r):
+        key = surt(uri_r)
+        if self.bloom is not None and key not in self.bloom:
+            self.bloom_rejections += 1
+            return -1
+        key = key.encode("utf-8")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.count and self._key(lo) == key:
+            return lo
+        return -1
+
+    def timeline(self, uri_r):
+        """
+        :param uri_r: (str) The URI-R, or its SURT.
+        :return: The timeline of the URI-R, or None if it is not archived.
+        """
+        i = self._find(uri_r)
+        if i < 0:
+            return
+        timeline = self._epochs[self._entry_offsets[i]:self._entry_offsets[i + 1]]
+        if self.use_numpy:
+            return numpy.frombuffer(timeline, dtype="<i8").view("datetime64[s]")
+        return timeline
+
+    def uris(self):
+        """
+        :return: generator of the SURTs of the archived URI-Rs.
+        """
+        for i in range(self.count):
+            yield self._key(i).decode("utf-8")
+
+    def nbytes(self):
+        return timeline_nbytes(self._epochs)
+
+    def memento_count(self):
+        return len(self._epochs)
+
+    def close(self):
+        """
+        Releases the views of the buffer and closes its owner.
+        """
+        if self.bloom is not None:
+            self.bloom.release()
+        for view in (self._key_offsets, self._entry_offsets, self._epochs,
+                     self._keys, self._view, self._buf):
+            view.release()
+        if self._owner is not None:
+            self._owner.close()
+            self._owner = None
+
+    def __contains__(self, uri_r):
+        return self._find(uri_r) >= 0
+
+    def __len__(self):
+        return self.count
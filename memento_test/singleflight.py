@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+Single-flight coalescing of identical in-flight computations.
+
+When several requests need the same expensive result at the same time, eg:
+the TimeMap of a popular URI-R or the timeline of a synthetic archive, only
+the first one computes it, and the others wait for its result. Results are
+not cached: a computation started after the previous one finished runs again.
+
+A computation returning chunks, eg: a serialized TimeMap, can be streamed with
+`SingleFlight.stream`: the chunks are read by the first caller as they are
+produced, and kept only for the callers that joined before the first chunk
+was dropped, until they have read them. A lone caller streams in constant memory.
+
+`SingleFlight` is for threads, see `memento_test.aiosingleflight` for the tasks
+of an asyncio event loop. Both count their calls and the computations they ran,
+so that the coalescing ratio can be monitored:
+ ```python
+ from memento_test.singleflight import SingleFlight
+
+ flight = SingleFlight()
+ timeline = flight.do(("timeline", uri_r), archive.timeline, uri_r)
+ body = flight.stream(("timemap", uri_r), link_format_timemap, uri_r, timeline, ...)
+ flight.stats()  # {"calls": 120, "executions": 4, "coalesced": 116, ...}
+ ```
+"""
+
+import threading
+
+# the end of a stream
+_END = object()
+
+
+class _Call(object):
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _Stream(object):
+    """
+    The chunks of a streamed computation, from `offset` on, that a reader has not
+    read yet, and the positions of its readers.
+    """
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+        self.source = None
+        self.chunks = []
+        self.offset = 0
+        self.positions = {}
+        self.done = False
+        self.error = None
+        # guards the chunks and the positions
+        self.lock = threading.Lock()
+        # a single reader produces the next chunk
+        self.producing = threading.Lock()
+
+    def trim(self):
+        """
+        Drops the chunks read by all the readers. Called with the lock held.
+        """
+        end = self.offset + len(self.chunks)
+        low = min(self.positions.values()) if self.positions else end
+        del self.chunks[:low - self.offset]
+        self.offset = low
+
+
+class _StreamReader(object):
+    """
+    Reads the chunks of a stream, from the first one.
+    """
+
+    def __init__(self, flight, key):
+        self.flight = flight
+        self.key = key
+        self.stream = None
+        self.index = 0
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.closed:
+            raise StopIteration
+        stream = self.stream
+        try:
+            chunk = self.flight._next_chunk(self.key, stream, self.index)
+        except BaseException:
+            self.close()
+            raise
+        if chunk is _END:
+            self.close()
+            raise StopIteration
+        self.index += 1
+        with stream.lock:
+            stream.positions[self] = self.index
+            stream.trim()
+        return chunk
+
+    next = __next__
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        stream, self.stream = self.stream, None
+        with stream.lock:
+            del stream.positions[self]
+            stream.trim()
+            abandoned = not stream.positions and not stream.done
+        if abandoned:
+            # no reader left to read the rest
+            with self.flight._lock:
+                if self.flight._calls.get(self.key) is stream:
+                    del self.flight._calls[self.key]
+            close = getattr(stream.source, "close", None)
+            if close is not None:
+                close()
+
+
+class _FlightStats(object):
+    """
+    The counters of a single-flight group.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.executions = 0
+        self.errors = 0
+
+    def stats(self):
+        """
+        :return: (dict) The number of calls, of computations and of calls served by
+        another call's computation, and their ratio to the calls.
+        """
+        calls, executions = self.calls, self.executions
+        coalesced = calls - executions
+        return {"calls": calls, "executions": executions, "coalesced": coalesced,
+                "errors": self.errors, "in_flight": len(self._calls),
+                "coalescing_ratio": round(coalesced / float(calls), 4) if calls else 0.0}
+
+
+class SingleFlight(_FlightStats):
+    """
+    Coalesces the identical computations of concurrent threads.
+    """
+
+    def __init__(self):
+        _FlightStats.__init__(self)
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, *args):
+        """
+        Calls `fn(*args)`, unless a call with the same key is in flight, in which
+        case its result is returned when it is ready.
+        :param key: (hashable) The identity of the computation.
+        :param fn: The function computing the result.
+        :param args: The arguments of `fn`.
+        :return: The result of `fn`.
+        :raises: the exception of `fn`, in every waiting thread.
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is not None:
+                    self.errors += 1
+            call.done.set()
+        return call.result
+
+    def stream(self, key, fn, *args):
+        """
+        Iterates over the chunks of `fn(*args)`, unless a call with the same key is in
+        flight and none of its chunks was dropped yet, in which case its chunks are
+        shared. The reader must be closed, eg: by the WSGI server.
+        :param key: (hashable) The identity of the computation, not used with `do`.
+        :param fn: The function returning an iterable of chunks.
+        :param args: The arguments of `fn`.
+        :return: (iterator) The chunks, with a `close` method.
+        :raises: the exception of `fn` or its iterable, in every reader.
+        """
+        reader = _StreamReader(self, key)
+        reader.stream = self._join(key, fn, args, reader)
+        return reader
+
+    def _join(self, key, fn, args, reader):
+        with self._lock:
+            self.calls += 1
+            stream = self._calls.get(key)
+            if stream is not None:
+                with stream.lock:
+                    if stream.offset == 0 and stream.positions and not stream.done:
+                        stream.positions[reader] = 0
+                        return stream
+            stream = self._calls[key] = _Stream(fn, args)
+            stream.positions[reader] = 0
+            self.executions += 1
+            return stream
+
+    def _next_chunk(self, key, stream, index):
+        """
+        :return: The chunk at `index` of the stream, produced if no reader did yet,
+        or _END.
+        """
+        while True:
+            with stream.lock:
+                if index < stream.offset + len(stream.chunks):
+                    return stream.chunks[index - stream.offset]
+                if stream.done:
+                    if stream.error is not None:
+                        raise stream.error
+                    return _END
+            with stream.producing:
+                with stream.lock:
+                    if index < stream.offset + len(stream.chunks) or stream.done:
+                        # produced by another reader meanwhile
+                        continue
+                try:
+                    if stream.source is None:
+                        stream.source = iter(stream.fn(*stream.args))
+                    chunk = next(stream.source)
+                except StopIteration:
+                    self._finish(key, stream, None)
+                    continue
+                except BaseException as e:
+                    self._finish(key, stream, e)
+                    raise
+                with stream.lock:
+                    stream.chunks.append(chunk)
+                return chunk
+
+    def _finish(self, key, stream, error):
+        with stream.lock:
+            stream.done = True
+            stream.error = error
+        with self._lock:
+            if self._calls.get(key) is stream:
+                del self._calls[key]
+            if error is not None:
+                self.errors += 1
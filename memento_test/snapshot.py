@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Startup snapshots of the memento index, for an instant warm start.
+
+Building the index of a synthetic archive takes seconds to minutes, on every
+start of the server, CI job or worker. A snapshot file holds the packed index
+(see `memento_test.shared_index`) after a header recording the settings it was
+built from. The next start with the same settings memory-maps it instead of
+building it again, in milliseconds whatever its size; a start with other
+settings, or a snapshot of another version, builds and replaces it.
+
+Layout (little endian):
+
+    header      magic, version, the SHA-1 of the settings, the offset and the
+                size of the index, the seconds it took to build it
+    settings    the JSON settings, for humans
+    index       the packed index, 8 byte aligned
+
+For example:
+ ```python
+ from memento_test.snapshot import load_snapshot
+
+ settings = {"seed": 1, "density": 120, "uris": 100000}
+ index, loaded = load_snapshot("/tmp/memento.snapshot", settings,
+                               lambda: archive.materialize(archive.uris(100000)))
+ ```
+
+The preference dispatch of the server is code, compiled when its module is
+imported, and is not part of the snapshot.
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+from memento_test.shared_index import SharedMementoIndex, IndexFormatError, pack_index, \
+    INDEX_VERSION
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"MTSNAP\x00\x00"
+SNAPSHOT_VERSION = 1
+
+HEADER = struct.Struct("<8sQ20s4xQQd")
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def snapshot_fingerprint(settings):
+    """
+    :param settings: (dict) The JSON serializable settings the index is built from.
+    :return: (bytes) The SHA-1 of the settings and of the format of the index.
+    """
+    data = json.dumps([INDEX_VERSION, settings], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).digest()
+
+
+def write_snapshot(path, index, settings, build_seconds=0.0):
+    """
+    Writes a snapshot of an index, atomically: a partly written snapshot is
+    never read, eg: by concurrent CI jobs.
+    :param path: (str) The path of the snapshot file.
+    :param index: A MementoIndex, or any object with `uris()` and `timeline(uri_r)`.
+    :param settings: (dict) The JSON serializable settings the index was built from.
+    :param build_seconds: (float) The time it took to build the index.
+    :return: (int) The size of the snapshot in bytes.
+    """
+    data = json.dumps(settings, sort_keys=True).encode("utf-8")
+    offset = (HEADER.size + len(data) + 7) // 8 * 8
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    try:
+        with open(tmp, "wb") as f:
+            f.write(b"\x00" * HEADER.size + data + b"\x00" * (offset - HEADER.size - len(data)))
+            size = pack_index(index, f)
+            f.seek(0)
+            f.write(HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION,
+                                snapshot_fingerprint(settings), offset, size, build_seconds))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return offset + size
+
+
+def open_snapshot(path, settings, use_numpy=False):
+    """
+    Memory-maps the index of a snapshot, read-only.
+    :param path: (str) The path of the snapshot file.
+    :param settings: (dict) The settings the index must have been built from.
+    :param use_numpy: (bool) Return timelines as NumPy arrays.
+    :return: (SharedMementoIndex) The index.
+    :raises: SnapshotError if the snapshot is not a snapshot of this version, or
+    was built from other settings.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        if len(mapped) < HEADER.size:
+            raise SnapshotError("Snapshot too small")
+        magic, version, fingerprint, offset, size, build_seconds = \
+            HEADER.unpack_from(mapped)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError("Not a snapshot")
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError("Unsupported snapshot version: %s" % version)
+        if fingerprint != snapshot_fingerprint(settings):
+            raise SnapshotError("Snapshot of other settings")
+        if offset + size != len(mapped):
+            raise SnapshotError("Truncated snapshot")
+        try:
+            return SharedMementoIndex(mapped, use_numpy=use_numpy, owner=mapped, offset=offset)
+        except IndexFormatError as e:
+            raise SnapshotError(str(e))
+    except BaseException:
+        mapped.close()
+        raise
+
+
+def load_snapshot(path, settings, build, use_numpy=False):
+    """
+    Opens the snapshot of an index, or builds the index and writes its snapshot
+    when there is no snapshot of these settings.
+    :param path: (str) The path of the snapshot file.
+    :param settings: (dict) The JSON serializable settings the index is built from.
+    :param build: A function building the index, eg: a `MementoIndex`.
+    :param use_numpy: (bool) Return timelines as NumPy arrays.
+    :return: (SharedMementoIndex, bool) The index of the snapshot, and whether
+    the snapshot was loaded rather than built.
+    """
+    try:
+        return open_snapshot(path, settings, use_numpy), True
+    except (IOError, OSError, SnapshotError) as e:
+        logger.info("Building the index, no snapshot to load: %s", e)
+    start = time.time()
+    index = build()
+    write_snapshot(path, index, settings, build_seconds=time.time() - start)
+    return open_snapshot(path, settings, use_numpy), False
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+SURT canonicalization of URI-Rs, the keys of the memento indexes.
+
+URI-Rs arrive in whatever form the clients send them, eg: `http://www.espn.com`,
+`https://ESPN.com/` or `http://espn.com:80/#top`, which are all the same
+resource to an archive. Their Sort-friendly URI Reordering Transform (SURT) is
+the same key:
+
+    http://www.espn.com/nba/?b=2&a=1  ->  com,espn)/nba/?a=1&b=2
+
+ * the `http` and `https` schemes, `www` prefixes, user info, default ports and
+ fragments are dropped,
+ * the labels of the host are reversed, so that the keys of a domain sort together,
+ * the query arguments are sorted, and the whole key is case folded.
+
+A SURT is its own SURT, so that the keys of an index can be looked up again.
+The SURTs are memoized in an LRU of `SURT_CACHE_SIZE` URI-Rs, since the same
+URI-Rs are requested again and again:
+ ```python
+ from memento_test.surt import surt
+
+ surt("https://ESPN.com") == surt("http://www.espn.com/")  # True
+ surt.cache_info()  # CacheInfo(hits=..., misses=..., maxsize=65536, currsize=...)
+ ```
+"""
+
+from functools import lru_cache
+import re
+
+SURT_CACHE_SIZE = 65536
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+_WWW = re.compile(r"www\d*\.")
+_IPV4 = re.compile(r"\d+\.\d+\.\d+\.\d+$")
+
+
+def _host_key(host, scheme):
+    """
+    :return: (str) The reversed host of a URI, with its port when not the default.
+    eg: www.espn.com:8080 -> com,espn:8080
+    """
+    host = host.rpartition("@")[2]
+    if host.startswith("["):
+        # an IPv6 address
+        end = host.find("]") + 1
+        host, port = host[:end], host[end + 1:]
+    else:
+        host, sep, port = host.partition(":")
+    if port == DEFAULT_PORTS.get(scheme):
+        port = ""
+    host = host.rstrip(".")
+    match = _WWW.match(host)
+    if match is not None and "." in host[match.end():]:
+        host = host[match.end():]
+    if not _IPV4.match(host) and not host.startswith("["):
+        host = ",".join(reversed(host.split(".")))
+    return host + ":" + port if port else host
+
+
+def canonicalize(uri):
+    """
+    The SURT of a URI, without memoization, see `surt`.
+    :param uri: (str) The URI, eg: a URI-R.
+    :return: (str) The SURT of the URI.
+    """
+    uri = uri.strip()
+    scheme, sep, rest = uri.partition("://")
+    if sep and rest.startswith("("):
+        # already the SURT of a URI of another scheme
+        return uri.lower()
+    if not sep:
+        host = uri.partition("/")[0]
+        if host.endswith(")"):
+            # already a SURT
+            return uri.lower()
+        # a URI-R without a scheme, or whose double slash was merged, eg: http:/a.com
+        scheme, sep, rest = uri.partition(":/")
+        if not sep or "." in scheme:
+            scheme, rest = "http", uri
+    scheme = scheme.lower()
+    rest = rest.partition("#")[0]
+    rest, sep, query = rest.partition("?")
+    host, sep, path = rest.partition("/")
+    key = _host_key(host.lower(), scheme) + ")/" + path
+    if query:
+        key += "?" + "&".join(sorted(query.split("&")))
+    if scheme not in DEFAULT_PORTS:
+        key = scheme + "://(" + key
+    return key.lower()
+
+
+@lru_cache(maxsize=SURT_CACHE_SIZE)
+def surt(uri):
+    """
+    The SURT of a URI, memoized.
+    eg: "https://www.ESPN.com/nba?b=2&a=1" -> "com,espn)/nba?a=1&b=2"
+    :param uri: (str) The URI, eg: a URI-R.
+    :return: (str) The SURT of the URI.
+    """
+    return canonicalize(uri)
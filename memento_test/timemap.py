@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming TimeMap serializers.
+
+The serializers are generators over a timeline (see `memento_test.archive`)
+that yield encoded chunks of `CHUNK_ENTRIES` mementos at a time, so the memory
+used to serve a TimeMap does not depend on the number of mementos in it.
+
+Both serializers can produce the malformed TimeMaps of the Prefer scenarios:
+ * original=False: no original URI.
+ * invalid=True: a TimeMap that cannot be parsed.
+ * invalid_datetime=True: truncated memento datetimes.
+
+Large TimeMaps can be paged: a page only holds the mementos between `start`
+and `stop`, and links to the previous and next pages (rel="prev" and
+rel="next"). The first and last mementos are those of the whole timeline.
+
+The timestamps and datetimes of the mementos have a fixed width, so the length
+of a TimeMap is computed from the length of a single memento entry, eg: for
+the `Content-Length` of a HEAD request, see `link_format_timemap_length` and
+`json_timemap_length`.
+"""
+
+import json
+
+from memento_test.archive import timeline_epochs, http_date, archive_timestamp, iso_date
+
+LINK_FORMAT_MIMETYPE = "application/link-format"
+JSON_MIMETYPE = "application/json"
+
+CHUNK_ENTRIES = 512
+
+LINK_ENTRY_TMPL = '<%s>; rel="%s"'
+LINK_DT_TMPL = '<%s%s/%s>; rel="%s"; datetime="%s"'
+INVALID_LINK_ENTRY_TMPL = "<%s, rel='%s'"
+INVALID_LINK_DT_TMPL = "<%s%s/%s, rel='%s', datetime=%s"
+
+JSON_DT_TMPL = '{"datetime":"%s","uri":%s%s%s}'
+
+
+def memento_rel(i, count):
+    """
+    The rel type of the i-th memento of a timeline with `count` mementos.
+    """
+    if count == 1:
+        return "first last memento"
+    if i == 0:
+        return "first memento"
+    if i == count - 1:
+        return "last memento"
+    return "memento"
+
+
+def _chunked(head, entries, separator, tail):
+    """
+    Encodes `head`, the entries joined with `separator` and `tail`, in chunks
+    of CHUNK_ENTRIES entries.
+    """
+    prefix = head
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= CHUNK_ENTRIES:
+            yield (prefix + separator.join(chunk)).encode("utf-8")
+            prefix = separator
+            chunk = []
+    if not chunk and prefix is not head:
+        # the last chunk was full, no separator before the tail
+        prefix = ""
+    yield (prefix + separator.join(chunk) + tail).encode("utf-8")
+
+
+def link_format_timemap(uri_r, timeline, host_name, timemap_uri, timegate_uri,
+                        original=True, invalid=False, invalid_datetime=False,
+                        start=0, stop=None, pages=None):
+    """
+    Serializes a timeline as a link-format TimeMap.
+    :param uri_r: (str) The URI-R.
+    :param timeline: The timeline of the URI-R.
+    :param host_name: (str) The base URI of the archive, with a trailing slash.
+    :param timemap_uri: (str) The URI of this TimeMap.
+    :param timegate_uri: (str) The URI of the TimeGate for the URI-R.
+    :param original: (bool) Include the rel="original" link.
+    :param invalid: (bool) Produce links that cannot be parsed.
+    :param invalid_datetime: (bool) Truncate the datetimes of the links.
+    :param start: (int) The index of the first memento of the page.
+    :param stop: (int) The index after the last memento of the page, None for the end.
+    :param pages: (dict) The URIs of the "prev" and "next" pages, if any.
+    :return: generator of bytes.
+    """
+    epochs, start, stop, head, entry = _link_format_parts(
+        uri_r, timeline, host_name, timemap_uri, timegate_uri, original, invalid,
+        invalid_datetime, start, stop, pages)
+    count = len(epochs)
+
+    def _entries():
+        for line in head:
+            yield line
+        for i in range(start, stop):
+            yield entry(int(epochs[i]), memento_rel(i, count))
+
+    for chunk in _chunked("", _entries(), ",\n", "\n"):
+        yield chunk
+
+
+def link_format_timemap_length(uri_r, timeline, host_name, timemap_uri, timegate_uri,
+                               original=True, invalid=False, invalid_datetime=False,
+                               start=0, stop=None, pages=None):
+    """
+    The length in bytes of the link-format TimeMap of `link_format_timemap`
+    with the same arguments, computed without serializing the mementos.
+    :return: (int) The length of the TimeMap.
+    """
+    epochs, start, stop, head, entry = _link_format_parts(
+        uri_r, timeline, host_name, timemap_uri, timegate_uri, original, invalid,
+        invalid_datetime, start, stop, pages)
+    count = len(epochs)
+    length = sum(len(line.encode("utf-8")) for line in head)
+    # the separators between the lines and the final newline
+    length += 2 * (len(head) + stop - start - 1) + 1
+    if start < stop:
+        # the entries only differ by their rel type
+        length += (stop - start) * len(entry(int(epochs[start]), "").encode("utf-8"))
+        length += _rels_length(start, stop, count)
+    return length
+
+
+def _link_format_parts(uri_r, timeline, host_name, timemap_uri, timegate_uri, original,
+                       invalid, invalid_datetime, start, stop, pages):
+    """
+    :return: the epochs of the timeline, the bounds of the page, the lines before
+    the mementos and a function formatting the entry of a memento from its
+    epoch and rel type.
+    """
+    epochs = timeline_epochs(timeline)
+    start, stop, step = slice(start, stop).indices(len(epochs))
+    entry_tmpl = INVALID_LINK_ENTRY_TMPL if invalid else LINK_ENTRY_TMPL
+    dt_tmpl = INVALID_LINK_DT_TMPL if invalid else LINK_DT_TMPL
+    cut = -2 if invalid_datetime else None
+
+    head = []
+    if original:
+        head.append(entry_tmpl % (uri_r, "original"))
+    self_link = entry_tmpl % (timemap_uri, "self") + '; type="%s"' % LINK_FORMAT_MIMETYPE
+    if start < stop:
+        self_link += '; from="%s"; until="%s"' % (
+            http_date(int(epochs[start]))[:cut], http_date(int(epochs[stop - 1]))[:cut])
+    head.append(self_link)
+    for rel in ("prev", "next"):
+        if pages and pages.get(rel):
+            head.append(entry_tmpl % (pages[rel], rel) + '; type="%s"' % LINK_FORMAT_MIMETYPE)
+    head.append(entry_tmpl % (timegate_uri, "timegate"))
+
+    def entry(seconds, rel):
+        return dt_tmpl % (host_name, archive_timestamp(seconds), uri_r, rel,
+                          http_date(seconds)[:cut])
+    return epochs, start, stop, head, entry
+
+
+def _rels_length(start, stop, count):
+    """
+    The total length of the rel types of the mementos between start and stop.
+    """
+    if count == 1:
+        return len(memento_rel(0, 1))
+    length = (stop - start) * len(memento_rel(1, 3))
+    if start == 0:
+        length += len(memento_rel(0, count)) - len(memento_rel(1, 3))
+    if stop == count:
+        length += len(memento_rel(count - 1, count)) - len(memento_rel(1, 3))
+    return length
+
+
+def json_timemap(uri_r, timeline, host_name, timemap_uri, timegate_uri,
+                 original=True, invalid=False, invalid_datetime=False,
+                 start=0, stop=None, pages=None):
+    """
+    Serializes a timeline as a JSON TimeMap, in the format of the Memento
+    aggregators:
+    {"original_uri": "", "timegate_uri": "",
+     "timemap_uri": {"link_format": "", "json_format": ""},
+     "pages": {"prev": "", "next": ""},
+     "mementos": {"first": {"datetime": "", "uri": ""}, "last": {...}, "list": [...]}}
+    with "pages" only in paged TimeMaps.
+    :param uri_r: (str) The URI-R.
+    :param timeline: The timeline of the URI-R.
+    :param host_name: (str) The base URI of the archive, with a trailing slash.
+    :param timemap_uri: (dict) The URIs of the TimeMaps, by format.
+    :param timegate_uri: (str) The URI of the TimeGate for the URI-R.
+    :param original: (bool) Include the original URI.
+    :param invalid: (bool) Produce a document that cannot be parsed.
+    :param invalid_datetime: (bool) Truncate the datetimes of the mementos.
+    :param start: (int) The index of the first memento of the page.
+    :param stop: (int) The index after the last memento of the page, None for the end.
+    :param pages: (dict) The URIs of the "prev" and "next" pages, if any.
+    :return: generator of bytes.
+    """
+    epochs, start, stop, head, memento = _json_parts(
+        uri_r, timeline, host_name, timemap_uri, timegate_uri, original,
+        invalid_datetime, start, stop, pages)
+
+    def _entries():
+        for i in range(start, stop):
+            yield memento(int(epochs[i]))
+
+    for chunk in _chunked(head, _entries(), ",\n", _json_tail(invalid, start, stop)):
+        yield chunk
+
+
+def json_timemap_length(uri_r, timeline, host_name, timemap_uri, timegate_uri,
+                        original=True, invalid=False, invalid_datetime=False,
+                        start=0, stop=None, pages=None):
+    """
+    The length in bytes of the JSON TimeMap of `json_timemap` with the same
+    arguments, computed without serializing the mementos.
+    :return: (int) The length of the TimeMap.
+    """
+    epochs, start, stop, head, memento = _json_parts(
+        uri_r, timeline, host_name, timemap_uri, timegate_uri, original,
+        invalid_datetime, start, stop, pages)
+    length = len(head.encode("utf-8")) + len(_json_tail(invalid, start, stop))
+    if start < stop:
+        # the entries have the same length, and are separated by ",\n"
+        length += (stop - start) * len(memento(int(epochs[start])).encode("utf-8"))
+        length += 2 * (stop - start - 1)
+    return length
+
+
+def _json_parts(uri_r, timeline, host_name, timemap_uri, timegate_uri, original,
+                invalid_datetime, start, stop, pages):
+    """
+    :return: the epochs of the timeline, the bounds of the page, the document
+    before the mementos and a function formatting a memento from its epoch.
+    """
+    epochs = timeline_epochs(timeline)
+    count = len(epochs)
+    start, stop, step = slice(start, stop).indices(count)
+    cut = -2 if invalid_datetime else None
+    # the URIs of the mementos only differ by their timestamp
+    uri_prefix = json.dumps(host_name)[:-1]
+    uri_suffix = json.dumps("/" + uri_r)[1:]
+
+    def _memento(seconds):
+        return JSON_DT_TMPL % (iso_date(seconds)[:cut], uri_prefix,
+                               archive_timestamp(seconds), uri_suffix)
+
+    head = []
+    if original:
+        head.append('"original_uri":%s' % json.dumps(uri_r))
+    head.append('"timegate_uri":%s' % json.dumps(timegate_uri))
+    head.append('"timemap_uri":%s' % json.dumps(timemap_uri, sort_keys=True,
+                                                 separators=(",", ":")))
+    if pages:
+        head.append('"pages":%s' % json.dumps(pages, sort_keys=True, separators=(",", ":")))
+    mementos = []
+    if count:
+        mementos.append('"first":%s' % _memento(int(epochs[0])))
+        mementos.append('"last":%s' % _memento(int(epochs[-1])))
+    mementos.append('"list":[\n')
+    head.append('"mementos":{' + ",".join(mementos))
+    return epochs, start, stop, "{" + ",".join(head), _memento
+
+
+def _json_tail(invalid, start, stop):
+    if invalid:
+        # every entry followed by a comma, and the document is never closed
+        return ",\n" if start < stop else ""
+    return "\n]}}\n"
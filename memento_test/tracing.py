@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight request tracing, with the spans exported to a local file.
+
+A sampled request is traced with a root `request` span, and child spans
+around the routing (`dispatch_request`), the parsing of the preferences
+(`parse_prefer`), each `on_*` handler, the construction of the Link headers
+(`create_link_header`) and the streaming of the body (`stream_body`). The
+spans carry the endpoint and the preference of the request.
+
+The incoming W3C `traceparent` headers are propagated: the spans of a request
+belong to the trace of its client, and are children of its span. A request
+with a `traceparent` is sampled when its client sampled it, the others with
+the probability `sample_rate`, so that tracing can run with a low rate
+without distorting the throughput. The spans of the requests that are not
+sampled are a shared object doing nothing.
+
+The spans are written in batches by a background thread, see
+`memento_test.access_log.BatchWriter`, as JSON lines of one span:
+ {"name": "on_tg_303", "trace_id": "4bf92f3577b34da6a3ce929d0e0e4736",
+  "span_id": "00f067aa0ba902b7", "parent_id": "53995c3f42cd8ad8",
+  "start_time_unix_nano": 1500000000123000000, "end_time_unix_nano": ...,
+  "duration_ms": 0.052, "attributes": {"endpoint": "timegate", "preference": "tg_303"}}
+or as the lines of the OTLP JSON file exporter, one `ExportTraceServiceRequest`
+per batch, eg: for the OpenTelemetry collector `otlpjsonfile` receiver.
+
+For example:
+ ```python
+ from memento_test.tracing import Tracer, SpanExporter
+
+ tracer = Tracer(SpanExporter("/tmp/spans.jsonl", span_format="otlp"), sample_rate=0.01)
+ application = create_application(tracer=tracer)
+ ```
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import os
+import random
+import re
+import time
+
+from memento_test.access_log import BatchWriter
+
+SPAN_FORMATS = ("json", "otlp")
+SERVICE_NAME = "memento_test"
+
+TRACEPARENT_HEADER = "traceparent"
+# version, trace id, parent span id and flags, see https://www.w3.org/TR/trace-context/
+_TRACEPARENT = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+FLAG_SAMPLED = 1
+
+# OTLP SpanKind
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+
+_current_span = ContextVar("memento_test_span", default=None)
+
+
+def parse_traceparent(value):
+    """
+    Parses a W3C `traceparent` header.
+    eg: "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01" ->
+        ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    :param value: (str) The value of the header, or None.
+    :return: (str, str, bool) The trace id, the parent span id, and whether the
+    parent is sampled, or None if the header is missing or invalid.
+    """
+    if not value:
+        return
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None:
+        return
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == _INVALID_TRACE_ID or parent_id == _INVALID_SPAN_ID:
+        return
+    return trace_id, parent_id, bool(int(flags, 16) & FLAG_SAMPLED)
+
+
+class Span(object):
+    """
+    A timed operation of a trace.
+    """
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "kind", "start",
+                 "end_time", "attributes", "_token")
+
+    def __init__(self, tracer, name, trace_id, parent_id, kind=SPAN_KIND_INTERNAL,
+                 attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = tracer.new_id(64)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start = time.time_ns()
+        self.end_time = None
+        self.attributes = attributes or {}
+        self._token = None
+
+    @property
+    def traceparent(self):
+        """
+        :return: (str) The `traceparent` header of the children of this span.
+        """
+        return "00-%s-%s-%02x" % (self.trace_id, self.span_id, FLAG_SAMPLED)
+
+    def set_attribute(self, name, value):
+        self.attributes[name] = value
+
+    def end(self):
+        """
+        Ends the span and queues it for export. Ending it again does nothing.
+        """
+        if self.end_time is None:
+            self.end_time = time.time_ns()
+            self.tracer.exporter.export(self)
+
+    def __enter__(self):
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.end()
+        return False
+
+
+class _NoopSpan(object):
+    """
+    The span of the requests that are not sampled, doing nothing.
+    """
+
+    __slots__ = ()
+    traceparent = None
+
+    def set_attribute(self, name, value):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Tracer(object):
+    """
+    Starts the traces of the sampled requests, and their spans.
+    """
+
+    def __init__(self, exporter, sample_rate=1.0, respect_parent=True):
+        """
+        :param exporter: (SpanExporter) Writes the ended spans.
+        :param sample_rate: (float) The probability that a request without a
+        `traceparent` header is traced, between 0 and 1.
+        :param respect_parent: (bool) Trace the requests with a `traceparent` header
+        when their parent is sampled, and only them, whatever the `sample_rate`.
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("sample_rate must be between 0 and 1, got %s" % sample_rate)
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+        self.respect_parent = respect_parent
+        self._random = random.Random(os.urandom(16))
+
+    def new_id(self, bits):
+        """
+        :return: (str) A random, non zero, hexadecimal id of `bits` bits.
+        """
+        return "%0*x" % (bits // 4, self._random.getrandbits(bits) or 1)
+
+    def start_request(self, environ, **attributes):
+        """
+        Starts the root span of a request, if it is sampled. The span is not
+        the current span until it is entered.
+        :param environ: The WSGI environment of the request.
+        :param attributes: The attributes of the span.
+        :return: (Span) The span of the request, or None if it is not sampled.
+        """
+        parent = parse_traceparent(environ.get("HTTP_TRACEPARENT"))
+        if parent is not None and self.respect_parent:
+            sampled = parent[2]
+        else:
+            sampled = self.sample_rate >= 1 or self._random.random() < self.sample_rate
+        if not sampled:
+            return
+        trace_id, parent_id = parent[:2] if parent is not None else (self.new_id(128), None)
+        return Span(self, "request", trace_id, parent_id, SPAN_KIND_SERVER, attributes)
+
+    def span(self, name, parent=None, **attributes):
+        """
+        Starts a child span of `parent`, or of the current span, eg:
+            with tracer.span("on_tg_303", endpoint="timegate"):
+        :param name: (str) The name of the operation.
+        :param parent: (Span) The parent span, or None for the current span.
+        :param attributes: The attributes of the span.
+        :return: (Span) The span, or NOOP_SPAN if the request is not traced.
+        """
+        parent = parent or _current_span.get()
+        if parent is None or parent is NOOP_SPAN:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attributes=attributes)
+
+
+@contextmanager
+def activate(span):
+    """
+    Makes a span the current span, without ending it, eg: a span that ends once
+    the body of the response is sent.
+    :param span: (Span) The span.
+    """
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+def current_span():
+    """
+    :return: (Span) The current span, or None.
+    """
+    return _current_span.get()
+
+
+class SpanExporter(BatchWriter):
+    """
+    Appends the ended spans to a file in batches, from a background thread, as
+    JSON lines or OTLP JSON lines, see `SPAN_FORMATS`.
+    """
+
+    thread_name = "memento-span-exporter"
+
+    def __init__(self, path, span_format="json", service_name=SERVICE_NAME, **options):
+        """
+        :param path: (str) The path of the file, appended to.
+        :param span_format: (str) `json` for a line per span, `otlp` for a line per
+        batch of spans.
+        :param service_name: (str) The `service.name` of the OTLP resource.
+        :param options: other keyword arguments of BatchWriter, eg: `batch_size`.
+        """
+        if span_format not in SPAN_FORMATS:
+            raise ValueError("Unknown span format: %s" % span_format)
+        self.span_format = span_format
+        self.service_name = service_name
+        self.pid = os.getpid()
+        BatchWriter.__init__(self, path, **options)
+
+    def export(self, span):
+        """
+        Queues an ended span, without blocking.
+        """
+        self.put(span)
+
+    def format_entry(self, span):
+        return {"name": span.name, "trace_id": span.trace_id, "span_id": span.span_id,
+                "parent_id": span.parent_id, "start_time_unix_nano": span.start,
+                "end_time_unix_nano": span.end_time,
+                "duration_ms": round((span.end_time - span.start) / 1e6, 3),
+                "attributes": span.attributes, "pid": self.pid}
+
+    def format_batch(self, batch):
+        if self.span_format == "otlp":
+            return [json.dumps(self._otlp(batch), separators=(",", ":"))]
+        return BatchWriter.format_batch(self, batch)
+
+    def _otlp(self, batch):
+        spans = []
+        for span in batch:
+            otlp_span = {
+                "traceId": span.trace_id, "spanId": span.span_id, "name": span.name,
+                "kind": span.kind, "startTimeUnixNano": str(span.start),
+                "endTimeUnixNano": str(span.end_time),
+                "attributes": [_otlp_attribute(name, value)
+                               for name, value in sorted(span.attributes.items())
+                               if value is not None]}
+            if span.parent_id:
+                otlp_span["parentSpanId"] = span.parent_id
+            spans.append(otlp_span)
+        resource = {"attributes": [_otlp_attribute("service.name", self.service_name),
+                                   _otlp_attribute("process.pid", self.pid)]}
+        return {"resourceSpans": [{"resource": resource, "scopeSpans": [
+            {"scope": {"name": "memento_test.tracing"}, "spans": spans}]}]}
+
+
+def _otlp_attribute(name, value):
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        # int64 are strings in the JSON encoding of OTLP
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": name, "value": typed}
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Several virtual archives served by a single process.
+
+Each virtual archive has its own base URI, first memento datetime, index and
+enabled scenarios. It is served under `/archive/<name>/`, and by the `Host`
+header of the requests when its base URI is the root of a host:
+
+    http://localhost:4000/archive/ia/tg/http://www.espn.com  -> the `ia` archive
+    Host: wayback.test, /tg/http://www.espn.com             -> the archive based at
+                                                               http://wayback.test/
+
+The base URIs are computed and interned once per archive, not per request.
+
+For example, with a JSON configuration file:
+ ```json
+ {"default": "ia",
+  "archives": [
+    {"name": "ia", "synthetic": {"seed": 1, "density": 120}, "first_datetime": "1996-01-01"},
+    {"name": "ukwa", "host_name": "http://wayback.test/", "index": "/data/ukwa.mti",
+     "scenarios": ["all_headers", "tg_302", "tg_303"]},
+    {"name": "warcs", "warc": "/data/warcs"}]}
+ ```
+ ```python
+ from memento_test.virtual import load_archives, create_virtual_application
+
+ archives, default = load_archives("archives.json")
+ application = create_virtual_application(archives, default=default)
+ ```
+"""
+
+from datetime import datetime
+import json
+import sys
+
+try:
+    from urllib.parse import urlsplit
+except ImportError:
+    from urlparse import urlsplit
+
+from werkzeug.exceptions import NotFound
+
+from memento_test.archive import SyntheticArchive
+from memento_test.server import create_application, HOST_NAME
+from memento_test.shared_index import SharedMementoIndex
+from memento_test.warc import WarcArchive
+
+try:
+    intern = sys.intern
+except AttributeError:
+    pass
+
+ARCHIVE_PATH_PREFIX = "/archive/"
+CONFIG_DATE_FORMAT = "%Y-%m-%d"
+
+
+class VirtualArchive(object):
+    """
+    The configuration of a virtual archive.
+    """
+
+    def __init__(self, name, host_name=None, archive=None, first_datetime=None,
+                 scenarios=None):
+        """
+        :param name: (str) The name of the archive, in its `/archive/<name>/` URIs.
+        :param host_name: (str) The base URI of the archive. Defaults to
+        `HOST_NAME` followed by `archive/<name>/`.
+        :param archive: The archive of the timelines, eg: a `SyntheticArchive`, or None
+        for the default timeline of every URI-R.
+        :param first_datetime: (date) The first memento datetime without an archive.
+        :param scenarios: (iterable) The preferences that are applied, or None for
+        all of them.
+        """
+        if not name or "/" in name:
+            raise ValueError("Invalid archive name: %r" % name)
+        self.name = intern(str(name))
+        host_name = host_name or HOST_NAME + "archive/" + name + "/"
+        if not host_name.endswith("/"):
+            host_name += "/"
+        self.host_name = intern(str(host_name))
+        self.archive = archive
+        self.first_datetime = first_datetime
+        self.scenarios = frozenset(scenarios) if scenarios is not None else None
+
+    @property
+    def host(self):
+        """
+        :return: (str) The host of the base URI when it is the root of the host, to
+        route the requests by their `Host` header, or None.
+        """
+        parts = urlsplit(self.host_name)
+        if parts.path == "/":
+            return parts.netloc
+
+    def create_application(self, **options):
+        """
+        :param options: other keyword arguments of MementoServer, eg: `access_log`.
+        :return: the WSGI application of the archive.
+        """
+        return create_application(archive=self.archive, host_name=self.host_name,
+                                  first_datetime=self.first_datetime,
+                                  scenarios=self.scenarios, **options)
+
+
+class VirtualArchives(object):
+    """
+    A WSGI application dispatching the requests to the virtual archives, by path
+    or by `Host` header.
+    """
+
+    def __init__(self, applications, hosts=None, default=None):
+        """
+        :param applications: (dict) The WSGI applications by archive name.
+        :param hosts: (dict) The WSGI applications by host.
+        :param default: The WSGI application of the other requests, or None for 404.
+        """
+        self.applications = applications
+        self.hosts = hosts or {}
+        self.default = default
+
+    def __call__(self, environ, start_response):
+        path_info = environ.get("PATH_INFO", "")
+        if path_info.startswith(ARCHIVE_PATH_PREFIX):
+            name, sep, rest = path_info[len(ARCHIVE_PATH_PREFIX):].partition("/")
+            application = self.applications.get(name)
+            if application is not None:
+                environ["SCRIPT_NAME"] = environ.get("SCRIPT_NAME", "") + \
+                    ARCHIVE_PATH_PREFIX + name
+                environ["PATH_INFO"] = "/" + rest
+                return application(environ, start_response)
+        application = self.hosts.get(environ.get("HTTP_HOST"), self.default)
+        if application is None:
+            return NotFound()(environ, start_response)
+        return application(environ, start_response)
+
+
+def create_virtual_application(archives, default=None, **options):
+    """
+    Creates a WSGI application serving several virtual archives.
+    :param archives: (list) The VirtualArchive objects.
+    :param default: (str) The name of the archive serving the requests of no other
+    archive, or None for 404.
+    :param options: other keyword arguments of MementoServer, eg: `access_log`.
+    :return: the WSGI application.
+    """
+    applications = {}
+    hosts = {}
+    for archive in archives:
+        if archive.name in applications:
+            raise ValueError("Duplicate archive name: %s" % archive.name)
+        applications[archive.name] = application = archive.create_application(**options)
+        if archive.host is not None:
+            hosts[archive.host] = application
+    if default is not None and default not in applications:
+        raise ValueError("Unknown default archive: %s" % default)
+    return VirtualArchives(applications, hosts, applications.get(default))
+
+
+def _load_archive(config, first_datetime):
+    if "synthetic" in config:
+        options = dict(config["synthetic"])
+        if first_datetime is not None:
+            options.setdefault("first_datetime", first_datetime)
+        return SyntheticArchive(**options)
+    if "index" in config:
+        return SharedMementoIndex.open(config["index"])
+    if "warc" in config:
+        return WarcArchive(config["warc"])
+
+
+def load_archives(path):
+    """
+    Loads the virtual archives of a JSON configuration file. Every archive has a
+    `name`, and optionally a `host_name`, a `first_datetime` (YYYY-MM-DD), the
+    `scenarios` it applies, and one of `synthetic` (the arguments of a
+    `SyntheticArchive`, eg: `seed` and `density`), `index` (a memento index file) or
+    `warc` (a directory).
+    :param path: (str) The path of the configuration file.
+    :return: (list, str) The VirtualArchive objects, and the name of the default
+    archive or None.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    archives = []
+    for spec in config.get("archives", []):
+        first_datetime = spec.get("first_datetime")
+        if first_datetime is not None:
+            first_datetime = datetime.strptime(first_datetime, CONFIG_DATE_FORMAT).date()
+        archives.append(VirtualArchive(spec["name"], host_name=spec.get("host_name"),
+                                       archive=_load_archive(spec, first_datetime),
+                                       first_datetime=first_datetime,
+                                       scenarios=spec.get("scenarios")))
+    return archives, config.get("default")
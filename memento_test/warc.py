@@ -0,0 +1,461 @@
+# -*- coding: utf-8 -*-
+"""
+Memento payloads served from local WARC files.
+
+A directory of WARC files (`.warc`, or `.warc.gz` with a gzip member per
+record) is scanned once to build a (URI-R, datetime) -> record index. The
+`response` and `resource` records are indexed, by `WARC-Target-URI` and
+`WARC-Date`.
+
+The files are memory-mapped. The payload of an uncompressed record is served
+as slices of the map, `PAYLOAD_CHUNK` bytes at a time. The gzip member of a
+compressed record is decompressed while it is served, and the WARC and HTTP
+headers are skipped. Records are never copied in full.
+
+The archived HTTP responses keep their framing and encoding: a payload with a
+`Transfer-Encoding: chunked` is de-chunked, and a payload with a `gzip` or
+`deflate` `Content-Encoding` is decoded, while it is served, so that HTML
+payloads can be rewritten. Their decoded length is computed once, when the
+files are scanned. The payloads of other content codings are served as they
+are, with their `Content-Encoding`.
+
+For example:
+ ```python
+ from memento_test.warc import WarcArchive
+ from memento_test.server import create_application
+
+ application = create_application(archive=WarcArchive("/data/warcs"))
+ ```
+"""
+
+from array import array
+from collections import namedtuple
+import calendar
+import logging
+import mmap
+import os
+import time
+import zlib
+
+from memento_test.archive import MementoIndex
+from memento_test.surt import surt
+
+logger = logging.getLogger(__name__)
+
+WARC_EXTENSIONS = (".warc", ".warc.gz")
+WARC_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+INDEXED_TYPES = {b"response", b"resource"}
+
+PAYLOAD_CHUNK = 65536
+# the WARC and HTTP headers of a record must fit in this many bytes
+MAX_HEADERS = 1024 * 1024
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+
+# the content codings decoded while served, and their zlib window bits
+DECODED_CODINGS = {"gzip": 16 + zlib.MAX_WBITS, "x-gzip": 16 + zlib.MAX_WBITS,
+                   "deflate": zlib.MAX_WBITS}
+
+WarcRecord = namedtuple("WarcRecord", ["path", "offset", "length", "compressed",
+                                       "payload_offset", "payload_length",
+                                       "content_type", "decode", "content_encoding",
+                                       "body_length"])
+WarcRecord.__doc__ = """
+The location of a record in a WARC file.
+offset, length: the record, or the gzip member of the record, in the file.
+payload_offset, payload_length: the payload in the (decompressed) record.
+decode: the codings undone while the payload is served, eg: ("chunked", "gzip").
+content_encoding: the content coding of the served payload, "" for none.
+body_length: the length of the served payload.
+"""
+
+
+class WarcFormatError(ValueError):
+    pass
+
+
+def warc_datetime(value):
+    """
+    Converts a WARC-Date to epoch seconds. Fractions of seconds are dropped.
+    eg: "2017-07-13T12:12:57Z" -> 1499947977
+    :param value: (str) The WARC-Date.
+    :return: (int) seconds since 1970-01-01T00:00:00.
+    """
+    return calendar.timegm(time.strptime(value.rstrip("Z")[:19], WARC_DATE_FORMAT))
+
+
+def _parse_headers(buf, start, end):
+    """
+    Parses the `Name: value` lines of buf[start:end].
+    :return: (dict) lower case names -> values, as bytes.
+    """
+    headers = {}
+    for line in buf[start:end].split(b"\r\n"):
+        name, sep, value = line.partition(b":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+def _payload_codings(http_headers):
+    """
+    :param http_headers: (dict) The archived HTTP headers of a payload.
+    :return: (tuple, str) The codings undone while the payload is served, in
+    order, and the content coding of the served payload.
+    """
+    decode = []
+    if b"chunked" in http_headers.get(b"transfer-encoding", b"").lower():
+        decode.append("chunked")
+    content_encoding = http_headers.get(b"content-encoding", b"").strip().lower() \
+        .decode("latin-1")
+    if content_encoding in DECODED_CODINGS:
+        decode.append(content_encoding)
+        content_encoding = ""
+    elif content_encoding == "identity":
+        content_encoding = ""
+    return tuple(decode), content_encoding
+
+
+def _parse_record(buf, start):
+    """
+    Parses the headers of the record that starts at buf[start].
+    :return: (dict, int, int, int, str, dict) the WARC headers, the offset and
+    length of the block, and the offset and length of the payload in the block,
+    the content type of the payload and its archived HTTP headers. None if the
+    headers are not in buf.
+    """
+    if len(buf) < start + 5:
+        return
+    if buf[start:start + 5] != b"WARC/":
+        raise WarcFormatError("Not a WARC record at %d" % start)
+    header_end = buf.find(b"\r\n\r\n", start)
+    if header_end < 0:
+        return
+    line_end = buf.find(b"\r\n", start)
+    headers = _parse_headers(buf, line_end + 2, header_end)
+    try:
+        block_length = int(headers[b"content-length"])
+    except (KeyError, ValueError):
+        raise WarcFormatError("Invalid Content-Length in the record at %d" % start)
+    block_offset = header_end + 4 - start
+
+    payload_offset = 0
+    http_headers = {}
+    content_type = headers.get(b"content-type", b"")
+    if headers.get(b"warc-type") == b"response" and \
+            content_type.startswith(b"application/http"):
+        # the payload follows the HTTP headers
+        block_start = start + block_offset
+        http_end = buf.find(b"\r\n\r\n", block_start, block_start + block_length)
+        if http_end < 0:
+            if len(buf) < block_start + block_length:
+                return
+            raise WarcFormatError("No HTTP headers in the record at %d" % start)
+        http_headers = _parse_headers(buf, buf.find(b"\r\n", block_start) + 2, http_end)
+        content_type = http_headers.get(b"content-type", b"")
+        payload_offset = http_end + 4 - block_start
+
+    return (headers, block_offset, block_length, payload_offset,
+            content_type.decode("latin-1") or DEFAULT_CONTENT_TYPE, http_headers)
+
+
+def _warc_record(path, offset, length, compressed, parsed):
+    """
+    :return: (WarcRecord) The record of the headers parsed by `_parse_record`.
+    """
+    headers, block_offset, block_length, payload_offset, content_type, http_headers = parsed
+    decode, content_encoding = _payload_codings(http_headers)
+    return WarcRecord(path, offset, length, compressed, block_offset + payload_offset,
+                      block_length - payload_offset, content_type, decode,
+                      content_encoding, block_length - payload_offset)
+
+
+def _dechunk(chunks):
+    """
+    Removes the chunked transfer coding of a payload.
+    :param chunks: The chunks of the payload, bytes.
+    :return: generator of bytes.
+    :raises: WarcFormatError if the chunked coding is invalid.
+    """
+    chunks = iter(chunks)
+    buf = bytearray()
+
+    def _fill():
+        data = next(chunks, None)
+        if data is None:
+            raise WarcFormatError("Truncated chunked payload")
+        buf.extend(data)
+
+    while True:
+        line_end = buf.find(b"\r\n")
+        while line_end < 0:
+            _fill()
+            line_end = buf.find(b"\r\n")
+        try:
+            size = int(bytes(buf[:line_end]).split(b";")[0].strip(), 16)
+        except ValueError:
+            raise WarcFormatError("Invalid chunk size")
+        del buf[:line_end + 2]
+        if not size:
+            # the trailers are dropped
+            return
+        while size:
+            if not buf:
+                _fill()
+            data = bytes(buf[:size])
+            del buf[:len(data)]
+            size -= len(data)
+            yield data
+        while len(buf) < 2:
+            _fill()
+        del buf[:2]
+
+
+def _decode(chunks, wbits):
+    """
+    Removes the gzip or deflate content coding of a payload.
+    :param chunks: The chunks of the payload, bytes.
+    :param wbits: (int) The zlib window bits of the coding, see DECODED_CODINGS.
+    :return: generator of bytes.
+    :raises: zlib.error if the payload is not of the coding.
+    """
+    d = zlib.decompressobj(wbits)
+    for data in chunks:
+        while data and not d.eof:
+            out = d.decompress(data, PAYLOAD_CHUNK)
+            data = d.unconsumed_tail
+            if out:
+                yield out
+        if d.eof:
+            return
+    out = d.flush()
+    if out:
+        yield out
+
+
+def _scan_warc(path, mm):
+    """
+    Yields the records of an uncompressed WARC file.
+    """
+    pos = 0
+    size = len(mm)
+    while pos < size:
+        parsed = _parse_record(mm, pos)
+        if parsed is None:
+            raise WarcFormatError("Truncated record at %d in %s" % (pos, path))
+        length = parsed[1] + parsed[2] + 4
+        yield parsed[0], _warc_record(path, pos, length, False, parsed)
+        pos += length
+        # tolerate extra blank lines between records
+        while mm[pos:pos + 2] == b"\r\n":
+            pos += 2
+
+
+def _scan_warc_gz(path, mm):
+    """
+    Yields the records of a WARC file with a gzip member per record. Every member
+    is decompressed once to find where it ends, only its start is kept.
+    """
+    view = memoryview(mm)
+    try:
+        pos = 0
+        size = len(mm)
+        while pos < size:
+            d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            head = b""
+            parsed = None
+            end = pos
+            while not d.eof:
+                data = view[end:end + PAYLOAD_CHUNK]
+                if not len(data):
+                    raise WarcFormatError("Truncated gzip member at %d in %s" % (pos, path))
+                end += len(data)
+                while len(data):
+                    out = d.decompress(data, PAYLOAD_CHUNK)
+                    data = d.unconsumed_tail
+                    if parsed is None and len(head) < MAX_HEADERS:
+                        head += out
+                        parsed = _parse_record(head, 0)
+                    if d.eof:
+                        break
+            end -= len(d.unused_data)
+            if parsed is None:
+                raise WarcFormatError("Invalid record at %d in %s" % (pos, path))
+            yield parsed[0], _warc_record(path, pos, end - pos, True, parsed)
+            pos = end
+    finally:
+        view.release()
+
+
+class WarcArchive(object):
+    """
+    An archive of the records of the WARC files of a directory, with their
+    payloads.
+    """
+
+    def __init__(self, directory, use_numpy=False):
+        """
+        :param directory: (str) The directory of the WARC files, searched recursively.
+        :param use_numpy: (bool) Store the timelines as NumPy arrays.
+        """
+        self.directory = directory
+        self.records = {}
+        self._maps = {}
+        self.index = MementoIndex(use_numpy=use_numpy)
+        try:
+            self.scan()
+        except Exception:
+            self.close()
+            raise
+
+    def scan(self):
+        """
+        Indexes the WARC files of the directory.
+        """
+        datetimes = {}
+        for root, dirs, files in os.walk(self.directory):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith(WARC_EXTENSIONS):
+                    continue
+                path = os.path.join(root, name)
+                mm = self._map(path)
+                if mm is None:
+                    continue
+                scan = _scan_warc_gz if name.endswith(".gz") else _scan_warc
+                for headers, record in scan(path, mm):
+                    if headers.get(b"warc-type") not in INDEXED_TYPES:
+                        continue
+                    uri_r = surt(headers.get(b"warc-target-uri", b"").decode("utf-8"))
+                    try:
+                        seconds = warc_datetime(headers.get(b"warc-date", b"").decode("ascii"))
+                    except ValueError:
+                        logger.warning("Invalid WARC-Date at %d in %s", record.offset, path)
+                        continue
+                    # the first record of a datetime wins
+                    if (uri_r, seconds) not in self.records:
+                        if record.decode:
+                            record = self._decoded_record(record)
+                        self.records[(uri_r, seconds)] = record
+                        datetimes.setdefault(uri_r, []).append(seconds)
+
+        for uri_r, seconds in datetimes.items():
+            self.index.add_timeline(uri_r, array("q", sorted(seconds)))
+        logger.info("Indexed %d records of %d URI-Rs in %s",
+                    len(self.records), len(self.index), self.directory)
+
+    def _decoded_record(self, record):
+        """
+        Decodes the payload of a record once, for its decoded length. A content
+        coding that cannot be decoded is served as it is.
+        :return: (WarcRecord) The record, with its `body_length`.
+        """
+        try:
+            length = sum(len(data) for data in self.payload(record))
+        except (WarcFormatError, zlib.error) as e:
+            content_codings = [c for c in record.decode if c != "chunked"]
+            if not content_codings:
+                logger.warning("Invalid chunked payload at %d in %s: %s", record.offset,
+                               record.path, e)
+                return record._replace(decode=())
+            logger.warning("Invalid %s payload at %d in %s, served encoded: %s",
+                           content_codings[0], record.offset, record.path, e)
+            return self._decoded_record(record._replace(
+                decode=tuple(c for c in record.decode if c == "chunked"),
+                content_encoding=content_codings[0]))
+        return record._replace(body_length=length)
+
+    def _map(self, path):
+        with open(path, "rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return
+            mm = self._maps[path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mm
+
+    def timeline(self, uri_r):
+        """
+        :param uri_r: (str) The URI-R.
+        :return: The timeline of the URI-R, or None if it is not archived.
+        """
+        return self.index.timeline(uri_r)
+
+    def record(self, uri_r, seconds):
+        """
+        :param uri_r: (str) The URI-R, or its SURT.
+        :param seconds: (int) The datetime of the memento, in epoch seconds.
+        :return: (WarcRecord) The record of the memento, or None.
+        """
+        return self.records.get((surt(uri_r), seconds))
+
+    def payload(self, record):
+        """
+        Streams the payload of a record, de-chunked and decoded, see `WarcRecord.decode`.
+        :param record: (WarcRecord) The record.
+        :return: generator of bytes.
+        """
+        mm = self._maps[record.path]
+        if record.compressed:
+            payload = self._gzip_payload(mm, record)
+        else:
+            payload = self._payload(mm, record)
+        for coding in record.decode:
+            if coding == "chunked":
+                payload = _dechunk(payload)
+            else:
+                payload = _decode(payload, DECODED_CODINGS[coding])
+        return payload
+
+    def _payload(self, mm, record):
+        pos = record.offset + record.payload_offset
+        end = pos + record.payload_length
+        while pos < end:
+            yield mm[pos:min(pos + PAYLOAD_CHUNK, end)]
+            pos += PAYLOAD_CHUNK
+
+    def _gzip_payload(self, mm, record):
+        # compressed slices of the map are read, so that no buffer of the map is
+        # held by an unfinished response
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        skip = record.payload_offset
+        remaining = record.payload_length
+        pos = record.offset
+        end = record.offset + record.length
+        while remaining > 0 and pos < end:
+            data = mm[pos:min(pos + PAYLOAD_CHUNK, end)]
+            pos += PAYLOAD_CHUNK
+            while data and remaining > 0:
+                out = d.decompress(data, PAYLOAD_CHUNK)
+                data = d.unconsumed_tail
+                if skip:
+                    if len(out) <= skip:
+                        skip -= len(out)
+                        continue
+                    out = out[skip:]
+                    skip = 0
+                out = out[:remaining]
+                remaining -= len(out)
+                if out:
+                    yield out
+
+    def uris(self):
+        return self.index.uris()
+
+    def nbytes(self):
+        return self.index.nbytes()
+
+    def memento_count(self):
+        return len(self.records)
+
+    def close(self):
+        """
+        Unmaps the WARC files.
+        """
+        for mm in self._maps.values():
+            mm.close()
+        self._maps.clear()
+
+    def __contains__(self, uri_r):
+        return uri_r in self.index
+
+    def __len__(self):
+        return len(self.index)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Warm-up and readiness of the Memento Test Server.
+
+A server that builds or loads its index can accept connections at once, and
+warm up in the background: `Warmup` runs the warm-up in a thread, and
+`ReadinessApplication` answers `503 Service Unavailable` with a `Retry-After`
+header until it is done, then creates the application. The readiness is
+served as JSON at `/_ready`, with a `200` status once the server is ready,
+eg: for the readiness probes of CI jobs and orchestrators:
+ {"ready": true, "warmup_seconds": 0.012, "snapshot": "loaded", "error": null}
+
+For example:
+ ```python
+ from memento_test.warmup import Warmup, ReadinessApplication
+
+ warmup = Warmup(lambda: load_snapshot(path, settings, build))
+ warmup.start()
+ application = ReadinessApplication(warmup, lambda: create_application(archive=warmup.result[0]))
+ ```
+"""
+
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+READY_PATH = "/_ready"
+
+
+class Warmup(object):
+    """
+    A warm-up, run once, in the background or not. `details` are added to its stats.
+    """
+
+    def __init__(self, load, details=None):
+        """
+        :param load: The function warming up, eg: loading the index. Its result
+        is `result`.
+        :param details: (dict) JSON serializable details of the warm-up, eg: whether
+        a snapshot was loaded, that `load` may update.
+        """
+        self.load = load
+        self.details = details if details is not None else {}
+        self.result = None
+        self.error = None
+        self.seconds = None
+        self.done = threading.Event()
+
+    @property
+    def ready(self):
+        return self.done.is_set() and self.error is None
+
+    def run(self):
+        start = time.time()
+        try:
+            self.result = self.load()
+        except Exception as e:
+            logger.exception("Warm-up failed")
+            self.error = e
+        finally:
+            self.seconds = time.time() - start
+            self.done.set()
+
+    def start(self, background=True):
+        """
+        :param background: (bool) Warm up in a daemon thread, instead of before
+        returning, eg: not before forking workers, since threads do not survive a fork.
+        """
+        if not background:
+            self.run()
+            return
+        thread = threading.Thread(target=self.run, name="warmup")
+        thread.daemon = True
+        thread.start()
+
+    def stats(self):
+        """
+        :return: (dict) Whether the server is ready, the duration of the warm-up
+        once done, its error if it failed, and its details.
+        """
+        stats = dict(self.details)
+        stats.update({"ready": self.ready,
+                      "warmup_seconds": round(self.seconds, 6) if self.done.is_set() else None,
+                      "error": str(self.error) if self.error is not None else None})
+        return stats
+
+
+class ReadinessApplication(object):
+    """
+    A WSGI application serving `/_ready`, and the application created by
+    `app_factory` once the warm-up is done.
+    """
+
+    def __init__(self, warmup, app_factory, retry_after=1):
+        """
+        :param warmup: (Warmup) The warm-up of the server.
+        :param app_factory: A function creating the WSGI application, called once
+        after the warm-up.
+        :param retry_after: (int) The Retry-After of the requests during the warm-up.
+        """
+        self.warmup = warmup
+        self.app_factory = app_factory
+        self.retry_after = str(retry_after)
+        self.application = None
+        self._lock = threading.Lock()
+
+    def _application(self):
+        if self.application is None:
+            with self._lock:
+                if self.application is None:
+                    self.application = self.app_factory()
+        return self.application
+
+    def __call__(self, environ, start_response):
+        ready = self.warmup.ready
+        if environ.get("PATH_INFO") == READY_PATH:
+            body = json.dumps(self.warmup.stats(), sort_keys=True).encode("utf-8")
+            headers = [("Content-Type", "application/json"),
+                       ("Content-Length", str(len(body))), ("Cache-Control", "no-store")]
+            if not ready:
+                headers.append(("Retry-After", self.retry_after))
+            start_response("200 OK" if ready else "503 Service Unavailable", headers)
+            return [] if environ.get("REQUEST_METHOD") == "HEAD" else [body]
+        if not ready:
+            start_response("503 Service Unavailable", [
+                ("Retry-After", self.retry_after), ("Content-Type", "text/plain; charset=utf-8"),
+                ("Content-Length", "0")])
+            return []
+        return self._application()(environ, start_response)
@@ -81,8 +81,11 @@ setup(
     #license=license,
     zip_safe=False,
     packages=find_packages(exclude=("tests", "docs")),
-    scripts=["bin/memento_test_server"],
+    scripts=["bin/memento_test_server", "bin/memento_test_check",
+             "bin/memento_test_corpus"],
     include_package_data=True,
+    # the request tracer uses contextvars and time.time_ns
+    python_requires=">=3.7",
     install_requires=["werkzeug>=0.12"],
     test_requires=["pytest"],
     classifiers=[
@@ -98,7 +101,12 @@ setup(
         'Topic :: Software Development :: Libraries :: Python Modules',
         'Topic :: Utilities',
 
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.4'
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11'
     ]
 )
\ No newline at end of file
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application
+from memento_test.access_log import AccessLog, BatchWriter
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from werkzeug.test import Client, EnvironBuilder
+
+
+class AccessLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "access.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _entries(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_requests_are_logged(self):
+        access_log = AccessLog(self.path)
+        client = Client(create_application(access_log=access_log))
+
+        builder = EnvironBuilder(path="/tg/http://www.espn.com",
+                                 headers=[("Prefer", "tg_303")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "303" in status
+        b"".join(app_iter)
+        app_iter.close()
+
+        builder = EnvironBuilder(path="/timemap/link/http://www.espn.com", method="HEAD")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        app_iter.close()
+
+        builder = EnvironBuilder(path="/tg/")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        app_iter.close()
+        access_log.close()
+
+        entries = self._entries()
+        assert len(entries) == 3
+        assert entries[0]["endpoint"] == "timegate"
+        assert entries[0]["uri_r"] == "http://www.espn.com"
+        assert entries[0]["prefer"] == "tg_303"
+        assert entries[0]["status"] == 303
+        assert entries[0]["method"] == "GET"
+        assert entries[0]["latency_ms"] >= 0
+        assert entries[1]["endpoint"] == "timemap"
+        assert entries[1]["method"] == "HEAD"
+        assert entries[1]["status"] == 200
+        assert entries[2]["endpoint"] is None
+        assert entries[2]["status"] == 404
+
+    def test_batched_writes(self):
+        access_log = AccessLog(self.path, batch_size=100)
+        writes = []
+        write = access_log._write
+        access_log._write = lambda batch: (writes.append(len(batch)), write(batch))
+
+        for i in range(1000):
+            access_log.log(i, "GET", "memento", "http://www.espn.com/%d" % i, None, 200, 0.1)
+        access_log.close()
+
+        entries = self._entries()
+        assert [e["time"] for e in entries] == list(range(1000))
+        assert sum(writes) == 1000
+        assert max(writes) <= 100
+        assert len(writes) < 1000
+
+    def test_batch_writer_json_lines(self):
+        writer = BatchWriter(self.path)
+        writer.put({"uri_r": "http://www.espn.com", "status": 302})
+        writer.put([1, None])
+        writer.close()
+        assert self._entries() == [{"uri_r": "http://www.espn.com", "status": 302}, [1, None]]
+
+    def test_full_queue_drops_entries(self):
+        access_log = AccessLog(self.path, max_queue=1)
+        writing = threading.Event()
+        release = threading.Event()
+        write = access_log._write
+
+        def _blocked_write(batch):
+            writing.set()
+            release.wait(10)
+            write(batch)
+
+        access_log._write = _blocked_write
+        access_log.log(0, "GET", "memento", None, None, 200, 0.1)
+        assert writing.wait(10)
+        for i in range(1, 11):
+            access_log.log(i, "GET", "memento", None, None, 200, 0.1)
+        assert access_log.dropped == 9
+
+        release.set()
+        access_log.close()
+        access_log.close()
+        assert [e["time"] for e in self._entries()] == [0, 1]
+
+    def test_debug_logging_is_lazy(self):
+        client = Client(create_application())
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
+                                 headers=[("Prefer", "all_headers")])
+        with mock.patch("memento_test.server.logger") as logger:
+            app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+
+        assert "200" in status
+        assert logger.debug.call_count >= 4
+        for call in logger.debug.call_args_list:
+            args = call[0]
+            # the message is formatted by logging, only if DEBUG is enabled
+            assert args[0].count("%s") == len(args) - 1
+        assert any(len(call[0]) == 2 for call in logger.debug.call_args_list)
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.admission import AdmissionControl, TokenBucket, parse_rate_limit, \
+    format_rate
+from memento_test.server import create_application
+import json
+import threading
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+
+class RateLimitTest(unittest.TestCase):
+
+    def test_parse_rate_limit(self):
+        assert parse_rate_limit("rate_limit=10/s") == 10.0
+        assert parse_rate_limit("tg_303, Rate_Limit=2.5/s; x=y") == 2.5
+        assert parse_rate_limit('rate_limit="10/s", tg_303') == 10.0
+        assert parse_rate_limit("rate_limit=5") == 5.0
+        assert parse_rate_limit("rate_limit=0/s") is None
+        assert parse_rate_limit("rate_limit=fast") is None
+        assert parse_rate_limit("no_rate_limit=10/s") is None
+        assert parse_rate_limit("tg_303") is None
+        assert parse_rate_limit(None) is None
+        assert format_rate(10.0) == "10/s"
+        assert format_rate(0.5) == "0.5/s"
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(2.0, 2.0, now=0)
+        assert bucket.take(0) == 0
+        assert bucket.take(0) == 0
+        assert bucket.take(0) == 0.5
+        assert bucket.take(0.25) == 0.25
+        assert bucket.take(0.5) == 0
+        # never more than the capacity
+        assert [bucket.take(100) for _ in range(3)] == [0, 0, 0.5]
+
+    def test_throttled_requests(self):
+        admission = AdmissionControl(create_application())
+        client = Client(admission)
+
+        def get(addr, prefer="tg_303, rate_limit=2/s"):
+            builder = EnvironBuilder(path="/tg/http://www.espn.com",
+                                     headers=[("Prefer", prefer)],
+                                     environ_base={"REMOTE_ADDR": addr})
+            app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+            return int(status[:3]), headers
+
+        status, headers = get("10.0.0.1")
+        assert status == 303
+        assert headers["Preference-Applied"] == "tg_303, rate_limit=2/s"
+        assert get("10.0.0.1")[0] == 303
+        status, headers = get("10.0.0.1")
+        assert status == 429
+        assert headers["Retry-After"] == "1"
+        assert headers["Preference-Applied"] == "rate_limit=2/s"
+        # the buckets are per client and per rate
+        assert get("10.0.0.2")[0] == 303
+        assert get("10.0.0.1", "rate_limit=100/s")[0] == 302
+        assert admission.stats()["throttled"] == 1
+        assert admission.stats()["active"] == 0
+        assert admission.stats()["clients"] == 3
+
+
+class AdmissionControlTest(unittest.TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+
+        def blocking(environ, start_response):
+            self.started.release()
+            self.release.wait(10)
+            start_response("200 OK", [("Content-Type", "text/plain")])
+            return [b"done"]
+        self.admission = AdmissionControl(blocking, max_concurrent=2, max_queue=1,
+                                          queue_timeout=10, retry_after=3)
+        self.client = Client(self.admission)
+
+    def _get(self, results):
+        app_iter, status, headers = self.client.run_wsgi_app(
+            EnvironBuilder(path="/").get_environ())
+        body = b"".join(app_iter)
+        if hasattr(app_iter, "close"):
+            # frees the slot, as the WSGI servers do
+            app_iter.close()
+        results.append((int(status[:3]), headers.get("Retry-After"), body))
+
+    def test_limits(self):
+        results = []
+        threads = [threading.Thread(target=self._get, args=(results,)) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        # two requests are running, one is queued
+        self.started.acquire()
+        self.started.acquire()
+        for _ in range(100):
+            if self.admission.queued:
+                break
+            threading.Event().wait(0.01)
+        assert self.admission.stats()["queued"] == 1
+
+        rejected = []
+        self._get(rejected)
+        assert rejected == [(503, "3", b"")]
+
+        stats = json.loads(self.client.get("/_stats").data.decode("utf-8"))
+        assert stats["active"] == 2 and stats["queued"] == 1 and stats["rejected"] == 1
+
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        assert sorted(results) == [(200, None, b"done")] * 3
+        stats = self.admission.stats()
+        assert stats["active"] == 0 and stats["admitted"] == 3
+        assert stats["peak_active"] == 2 and stats["peak_queued"] == 1
+
+    def test_queue_timeout(self):
+        self.admission.queue_timeout = 0.05
+        self.admission.max_queue = 2
+        results = []
+        threads = [threading.Thread(target=self._get, args=(results,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        self.started.acquire()
+        self.started.acquire()
+        timed_out = []
+        self._get(timed_out)
+        assert timed_out == [(503, "3", b"")]
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        assert self.admission.stats()["timed_out"] == 1
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            AdmissionControl(None, max_concurrent=0)
+        with self.assertRaises(ValueError):
+            AdmissionControl(None, max_queue=-1)
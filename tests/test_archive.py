@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application, \
+    convert_to_datetime, parse_link_header, get_uri_dt_for_rel
+from memento_test.archive import SyntheticArchive, MementoIndex, \
+    closest_memento, to_epoch, from_epoch, http_date, archive_timestamp, numpy
+from datetime import datetime, date
+from array import array
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+
+class SyntheticArchiveTest(unittest.TestCase):
+
+    def test_deterministic(self):
+        a1 = SyntheticArchive(seed=7, last_datetime=datetime(2017, 1, 1))
+        a2 = SyntheticArchive(seed=7, last_datetime=datetime(2017, 1, 1))
+        a3 = SyntheticArchive(seed=8, last_datetime=datetime(2017, 1, 1))
+
+        uri_r = "http://www.espn.com"
+        assert a1.timeline(uri_r) == a2.timeline(uri_r)
+        assert a1.timeline(uri_r) != a3.timeline(uri_r)
+        assert list(a1.uris(10)) == list(a2.uris(10))
+
+    def test_timeline_bounds_and_order(self):
+        archive = SyntheticArchive(seed=1, density=500,
+                                   first_datetime=date(2005, 1, 1),
+                                   last_datetime=datetime(2015, 1, 1))
+        for uri_r in archive.uris(20):
+            timeline = archive.timeline(uri_r)
+            assert isinstance(timeline, array)
+            assert len(timeline) > 0
+            assert timeline[0] >= to_epoch(date(2005, 1, 1))
+            assert timeline[-1] < to_epoch(datetime(2015, 1, 1))
+            assert all(timeline[i] < timeline[i + 1] for i in range(len(timeline) - 1))
+
+    def test_bursts_and_gaps(self):
+        bursty = SyntheticArchive(seed=3, density=10, density_spread=0,
+                                  burst_probability=1.0, burst_size=50,
+                                  gap_probability=0)
+        calm = SyntheticArchive(seed=3, density=10, density_spread=0,
+                                burst_probability=0, gap_probability=0)
+        gappy = SyntheticArchive(seed=3, density=10, density_spread=0,
+                                 burst_probability=0, gap_probability=0.5)
+
+        uri_r = "http://www.espn.com"
+        assert len(bursty.timeline(uri_r)) > 5 * len(calm.timeline(uri_r))
+        assert len(gappy.timeline(uri_r)) < len(calm.timeline(uri_r))
+
+    def test_memory_per_memento(self):
+        archive = SyntheticArchive(seed=1, density=300)
+        index = archive.materialize(archive.uris(50))
+
+        assert len(index) == 50
+        assert index.memento_count() > 1000
+        assert index.nbytes() / float(index.memento_count()) < 10
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            SyntheticArchive(density=0)
+        with self.assertRaises(ValueError):
+            SyntheticArchive(burst_probability=0.5, burst_spacing=0)
+        with self.assertRaises(ValueError):
+            SyntheticArchive(gap_probability=0.5, gap_length=0)
+        # unused settings are not validated
+        SyntheticArchive(burst_probability=0, burst_spacing=0)
+
+    def test_last_datetime_is_utc(self):
+        archive = SyntheticArchive(seed=2, density=5000)
+        timeline = archive.timeline("http://www.espn.com")
+
+        assert abs(archive.last_datetime - datetime.utcnow()).total_seconds() < 60
+        assert timeline[-1] <= to_epoch(datetime.utcnow())
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_storage(self):
+        archive = SyntheticArchive(seed=1, use_numpy=True)
+        timeline = archive.timeline("http://www.espn.com")
+
+        assert timeline.dtype == numpy.dtype("datetime64[s]")
+        plain = SyntheticArchive(seed=1).timeline("http://www.espn.com")
+        assert list(timeline.view(numpy.int64)) == list(plain)
+        assert closest_memento(timeline, plain[1]) == plain[1]
+
+
+class MementoIndexTest(unittest.TestCase):
+
+    def test_closest_memento(self):
+        index = MementoIndex()
+        index.add("http://www.espn.com", [datetime(2010, 1, 1), date(2005, 1, 1), 0])
+        timeline = index.timeline("http://www.espn.com")
+
+        assert list(timeline) == [0, to_epoch(date(2005, 1, 1)), to_epoch(datetime(2010, 1, 1))]
+        assert closest_memento(timeline, -100) == 0
+        assert closest_memento(timeline, to_epoch(datetime(2006, 1, 1))) == to_epoch(date(2005, 1, 1))
+        assert closest_memento(timeline, to_epoch(datetime(2009, 1, 1))) == to_epoch(datetime(2010, 1, 1))
+        assert closest_memento(timeline, to_epoch(datetime(2020, 1, 1))) == to_epoch(datetime(2010, 1, 1))
+        assert index.timeline("http://www.cnn.com") is None
+
+    def test_add_timeline(self):
+        index = MementoIndex()
+        index.add_timeline("http://www.espn.com", array("q", [1, 2, 3]))
+
+        assert list(index.timeline("http://www.espn.com")) == [1, 2, 3]
+        assert index.memento_count() == 3
+
+    def test_date_formats(self):
+        seconds = to_epoch(datetime(2001, 1, 1, 12, 30, 5))
+
+        assert from_epoch(seconds) == datetime(2001, 1, 1, 12, 30, 5)
+        assert http_date(seconds) == "Mon, 01 Jan 2001 12:30:05 GMT"
+        assert archive_timestamp(seconds) == "20010101123005"
+
+
+class ArchiveServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = MementoIndex()
+        self.index.add("http://www.espn.com", [datetime(2005, 1, 1), datetime(2010, 6, 1),
+                                               datetime(2015, 1, 1)])
+
+    def test_timegate_from_index(self):
+        client = Client(create_application(archive=self.index))
+        builder = EnvironBuilder(path="/tg/http://www.espn.com",
+                                 headers=[("Accept-Datetime", "Mon, 01 Mar 2010 00:00:00 GMT")])
+        env = builder.get_environ()
+        app_iter, status, headers = client.run_wsgi_app(env)
+
+        assert "302" in status
+        assert headers.get("Location") == "http://localhost:4000/20100601000000/http://www.espn.com"
+        lh = parse_link_header(headers.get("Link"))
+        f_dt = get_uri_dt_for_rel(lh, ["first"]).get("first")
+        assert convert_to_datetime(f_dt["datetime"][0]) == datetime(2005, 1, 1)
+        l_dt = get_uri_dt_for_rel(lh, ["last"]).get("last")
+        assert convert_to_datetime(l_dt["datetime"][0]) == datetime(2015, 1, 1)
+
+    def test_not_archived(self):
+        client = Client(create_application(archive=self.index))
+        builder = EnvironBuilder(path="/tg/http://www.cnn.com")
+        env = builder.get_environ()
+        app_iter, status, headers = client.run_wsgi_app(env)
+
+        assert "404" in status
+
+    def test_timemap_from_index(self):
+        client = Client(create_application(archive=self.index))
+        builder = EnvironBuilder(path="/timemap/link/http://www.espn.com")
+        env = builder.get_environ()
+        app_iter, status, headers = client.run_wsgi_app(env)
+
+        assert "200" in status
+        assert headers.get("Content-Type") == "application/link-format"
+        lh = parse_link_header(b"".join(app_iter).decode("utf-8"))
+        mementos = [uri for uri in lh if "memento" in lh[uri]["rel"]]
+        assert len(mementos) == 3
+        assert get_uri_dt_for_rel(lh, ["original"]).get("original").get("uri") == "http://www.espn.com"
+        assert get_uri_dt_for_rel(lh, ["timegate"])
+        assert get_uri_dt_for_rel(lh, ["self"])
+        first = get_uri_dt_for_rel(lh, ["first"]).get("first")
+        assert first["uri"] == "http://localhost:4000/20050101000000/http://www.espn.com"
+
+    def test_synthetic_timemap(self):
+        archive = SyntheticArchive(seed=5, density=40, density_spread=0,
+                                   first_datetime=date(2012, 1, 1))
+        client = Client(create_application(archive=archive))
+        builder = EnvironBuilder(path="/timemap/link/http://www.espn.com")
+        env = builder.get_environ()
+        app_iter, status, headers = client.run_wsgi_app(env)
+
+        assert "200" in status
+        lh = parse_link_header(b"".join(app_iter).decode("utf-8"))
+        mementos = [uri for uri in lh if "memento" in lh[uri]["rel"]]
+        assert len(mementos) == len(archive.timeline("http://www.espn.com"))
+
+    def test_default_timemap(self):
+        client = Client(create_application())
+        builder = EnvironBuilder(path="/timemap/link/http://www.espn.com",
+                                 headers=[("Prefer", "all_headers")])
+        env = builder.get_environ()
+        app_iter, status, headers = client.run_wsgi_app(env)
+
+        assert "200" in status
+        assert headers.get("Preference-Applied") == "all_headers"
+        lh = parse_link_header(b"".join(app_iter).decode("utf-8"))
+        assert get_uri_dt_for_rel(lh, ["first"])
+        assert get_uri_dt_for_rel(lh, ["last"])
+
+    def test_memento_from_index(self):
+        client = Client(create_application(archive=self.index))
+        builder = EnvironBuilder(path="/20050101000000/http://www.espn.com")
+        env = builder.get_environ()
+        app_iter, status, headers = client.run_wsgi_app(env)
+
+        assert "200" in status
+        assert convert_to_datetime(headers.get("Memento-Datetime")) == datetime(2005, 1, 1)
+        lh = parse_link_header(headers.get("Link"))
+        rels = lh["http://localhost:4000/20050101000000/http://www.espn.com"]["rel"]
+        assert "memento" in rels and "first" in rels
+        assert lh["http://localhost:4000/20150101000000/http://www.espn.com"]["rel"] == ["last", "memento"]
+
+        # a partial datetime is redirected to the canonical URL of the memento
+        builder = EnvironBuilder(path="/201006/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "302" in status
+        assert headers.get("Location") == \
+            "http://localhost:4000/20100601000000/http://www.espn.com"
+        builder = EnvironBuilder(path="/20100601000000/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "200" in status
+        assert convert_to_datetime(headers.get("Memento-Datetime")) == datetime(2010, 6, 1)
+
+    def test_memento_redirects_to_closest(self):
+        client = Client(create_application(archive=self.index))
+        for path in ["/20100530000000/http://www.espn.com", "/2010/http://www.espn.com",
+                     "/201005/http://www.espn.com"]:
+            builder = EnvironBuilder(path=path)
+            env = builder.get_environ()
+            app_iter, status, headers = client.run_wsgi_app(env)
+
+            assert "302" in status
+            assert headers.get("Location") == \
+                "http://localhost:4000/20100601000000/http://www.espn.com"
+
+    def test_memento_invalid_datetime(self):
+        client = Client(create_application(archive=self.index))
+        builder = EnvironBuilder(path="/20101399000000/http://www.espn.com")
+        env = builder.get_environ()
+        app_iter, status, headers = client.run_wsgi_app(env)
+
+        assert "404" in status
+
+    def test_head_timemap(self):
+        client = Client(create_application(archive=self.index))
+        builder = EnvironBuilder(path="/timemap/link/http://www.espn.com", method="HEAD")
+        env = builder.get_environ()
+        app_iter, status, headers = client.run_wsgi_app(env)
+
+        assert "200" in status
+        assert headers.get("Content-Type") == "application/link-format"
+        assert b"".join(app_iter) == b""
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_archive(self):
+        index = MementoIndex(use_numpy=True)
+        index.add("http://www.espn.com", [datetime(2005, 1, 1), datetime(2010, 6, 1),
+                                          datetime(2015, 1, 1)])
+        assert index.timeline("http://www.espn.com").dtype == numpy.dtype("datetime64[s]")
+        client = Client(create_application(archive=index))
+
+        builder = EnvironBuilder(path="/tg/http://www.espn.com",
+                                 headers=[("Accept-Datetime", "Mon, 01 Mar 2010 00:00:00 GMT")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "302" in status
+        assert headers.get("Location") == "http://localhost:4000/20100601000000/http://www.espn.com"
+
+        builder = EnvironBuilder(path="/20150101000000/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "200" in status
+        assert convert_to_datetime(headers.get("Memento-Datetime")) == datetime(2015, 1, 1)
+
+        archive = SyntheticArchive(seed=5, density=40, density_spread=0, use_numpy=True,
+                                   first_datetime=date(2012, 1, 1))
+        client = Client(create_application(archive=archive))
+        builder = EnvironBuilder(path="/timemap/link/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "200" in status
+        lh = parse_link_header(b"".join(app_iter).decode("utf-8"))
+        mementos = [uri for uri in lh if "memento" in lh[uri]["rel"]]
+        assert len(mementos) == len(archive.timeline("http://www.espn.com"))
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.archive import SyntheticArchive, http_date, timeline_epochs
+from memento_test.binary_timemap import binary_timemap, binary_timemap_length, \
+    decode_binary_timemap, BinaryTimeMapError, BINARY_TIMEMAP_MIMETYPE, BINARY_CHUNK_ENTRIES
+from memento_test.client import LinkFormatParser
+from memento_test.server import create_application
+from array import array
+import unittest
+from werkzeug.test import Client
+
+URI_R = u"http://www.espn.com/é"
+
+
+class BinaryTimeMapTest(unittest.TestCase):
+
+    def _round_trip(self, timeline, **options):
+        chunks = list(binary_timemap(URI_R, timeline, "http://a/", "http://a/tm",
+                                     "http://a/tg", **options))
+        data = b"".join(chunks)
+        assert binary_timemap_length(URI_R, timeline, "http://a/", "http://a/tm",
+                                     "http://a/tg", **options) == len(data)
+        return decode_binary_timemap(data), chunks
+
+    def test_round_trip(self):
+        timelines = [array("q"), array("q", [0]), array("q", [-86400 * 365, -1, 0, 0, 5]),
+                     array("q", [1, 2 ** 40, 2 ** 40 + 127, 2 ** 40 + 128 + 127]),
+                     array("q", range(0, 86400 * 200, 86400))]
+        for timeline in timelines:
+            timemap, chunks = self._round_trip(timeline)
+            assert list(timemap.epochs) == list(timeline)
+            assert timemap.uri_r == URI_R
+            assert timemap.host_name == "http://a/"
+            assert (timemap.timemap_uri, timemap.timegate_uri) == ("http://a/tm", "http://a/tg")
+            assert timemap.original and timemap.pages == {}
+            assert timemap.total == len(timeline) and timemap.start == 0
+            if len(timeline):
+                assert (timemap.first, timemap.last) == (timeline[0], timeline[-1])
+            else:
+                assert timemap.first is None
+
+        timeline = array("q", range(0, 86400 * 200, 86400))
+        pages = {"prev": "http://a/tm", "next": "http://a/tm?page=3"}
+        timemap, chunks = self._round_trip(timeline, start=50, stop=100, pages=pages,
+                                           original=False)
+        assert list(timemap.epochs) == list(timeline[50:100])
+        assert (timemap.start, timemap.total) == (50, 200)
+        assert (timemap.first, timemap.last) == (0, timeline[-1])
+        assert timemap.pages == pages and not timemap.original
+        assert timemap.memento_uri(86400) == u"http://a/19700102000000/" + URI_R
+
+    def test_chunks(self):
+        timeline = array("q", range(2 * BINARY_CHUNK_ENTRIES + 10))
+        timemap, chunks = self._round_trip(timeline)
+        # the header, then the mementos
+        assert len(chunks) == 4
+        assert list(timemap.epochs) == list(timeline)
+
+    def test_invalid(self):
+        for timeline in (array("q"), array("q", [0, 60])):
+            data = b"".join(binary_timemap(URI_R, timeline, "http://a/", "tm", "tg",
+                                           invalid=True))
+            assert binary_timemap_length(URI_R, timeline, "http://a/", "tm", "tg",
+                                         invalid=True) == len(data)
+            with self.assertRaises(BinaryTimeMapError):
+                decode_binary_timemap(data)
+
+        data = b"".join(binary_timemap(URI_R, array("q", [0, 60]), "http://a/", "tm", "tg"))
+        for invalid in (b"", b"MTTM", b"XXXX" + data[4:], data[:4] + b"\x09" + data[5:],
+                        data[:-1], data + b"\x00"):
+            with self.assertRaises(BinaryTimeMapError):
+                decode_binary_timemap(invalid)
+        with self.assertRaises(ValueError):
+            b"".join(binary_timemap(URI_R, array("q", [60, 0]), "http://a/", "tm", "tg"))
+
+
+class BinaryTimeMapServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.archive = SyntheticArchive(seed=1, density=20)
+        self.client = Client(create_application(archive=self.archive, timemap_page_size=100))
+
+    def _link_format(self, path, **headers):
+        parser = LinkFormatParser()
+        entries = parser.feed(self.client.get(path, headers=headers).data.decode("utf-8"))
+        return entries + parser.close()
+
+    def test_matches_link_format(self):
+        path = "/timemap/link/" + URI_R
+        epochs = timeline_epochs(self.archive.timeline(URI_R))
+        assert len(epochs) > 200
+        for page in (1, 2):
+            page_path = path + ("?page=%d" % page if page > 1 else "")
+            response = self.client.get(page_path, headers={"Accept": BINARY_TIMEMAP_MIMETYPE})
+            assert response.headers["Content-Type"] == BINARY_TIMEMAP_MIMETYPE
+            assert response.headers["Vary"] == "accept"
+            assert int(response.headers["Content-Length"]) == len(response.data)
+            timemap = decode_binary_timemap(response.data)
+
+            entries = self._link_format(page_path)
+            mementos = [e for e in entries if "memento" in e.rel]
+            assert [(timemap.memento_uri(s), http_date(s)) for s in timemap.epochs] == \
+                [(e.uri, e.datetime) for e in mementos]
+            links = dict((rel, e.uri) for e in entries for rel in e.rel)
+            assert timemap.timemap_uri == links["self"]
+            assert timemap.timegate_uri == links["timegate"]
+            assert timemap.uri_r == links["original"]
+            assert timemap.pages.get("next") == links.get("next")
+            assert timemap.pages.get("prev") == links.get("prev")
+            assert (timemap.first, timemap.last) == (epochs[0], epochs[-1])
+
+        head = self.client.head(path, headers={"Accept": BINARY_TIMEMAP_MIMETYPE})
+        get = self.client.get(path, headers={"Accept": BINARY_TIMEMAP_MIMETYPE})
+        assert list(head.headers.items()) == list(get.headers.items())
+        assert get.headers["ETag"] != self.client.get(path).headers["ETag"]
+
+    def test_negotiation(self):
+        path = "/timemap/json/" + URI_R
+        for accept in ("*/*", "application/*", BINARY_TIMEMAP_MIMETYPE + ";q=0", ""):
+            response = self.client.get(path, headers={"Accept": accept})
+            assert response.headers["Content-Type"].startswith("application/json"), accept
+        response = self.client.get(path, headers={
+            "Accept": "application/json;q=0.5, %s" % BINARY_TIMEMAP_MIMETYPE})
+        assert response.headers["Content-Type"] == BINARY_TIMEMAP_MIMETYPE
+
+    def test_scenarios(self):
+        path = "/timemap/link/" + URI_R
+        headers = {"Accept": BINARY_TIMEMAP_MIMETYPE}
+        response = self.client.get(path, headers=dict(
+            headers, Prefer="no_original_link_header, invalid_datetime_in_link_header"))
+        assert response.headers["Preference-Applied"] == "no_original_link_header"
+        assert not decode_binary_timemap(response.data).original
+
+        response = self.client.get(path, headers=dict(headers, Prefer="invalid_link_header"))
+        with self.assertRaises(BinaryTimeMapError):
+            decode_binary_timemap(response.data)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.archive import SyntheticArchive, archive_timestamp
+from memento_test.bloom import BloomFilter
+from memento_test.surt import surt
+from memento_test.server import create_application
+from memento_test.shared_index import SharedMementoIndex, IndexFormatError, write_index, \
+    HEADER, PREAMBLE, INDEX_MAGIC
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from werkzeug.test import Client
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_membership(self):
+        keys = ["http://www.site%d.example.com/" % i for i in range(5000)]
+        bloom = BloomFilter.for_capacity(len(keys), error_rate=0.01)
+        assert bloom.bits % 64 == 0 and bloom.hashes == 7
+        for key in keys:
+            bloom.add(key)
+        assert all(key in bloom for key in keys)
+        others = ["http://www.other%d.example.com/" % i for i in range(20000)]
+        false_positives = sum(key in bloom for key in others)
+        assert false_positives < 20000 * 0.02
+        assert u"http://www.例え.jp/" not in bloom
+
+        copy = BloomFilter(bloom.bits, bloom.hashes, bloom.tobytes())
+        assert all(key in copy for key in keys)
+        assert sum(key in copy for key in others) == false_positives
+
+    def test_invalid(self):
+        for bits, hashes, buf in ((0, 1, None), (65, 1, None), (64, 0, None),
+                                  (128, 2, b"\x00" * 8)):
+            with self.assertRaises(ValueError):
+                BloomFilter(bits, hashes, buf)
+        with self.assertRaises(ValueError):
+            BloomFilter.for_capacity(10, error_rate=0)
+        bloom = BloomFilter.for_capacity(0)
+        assert bloom.bits == 64 and "http://a.com" not in bloom
+
+
+class NotArchivedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "index.mti")
+        self.archive = SyntheticArchive(seed=3, density=20, coverage=0.5)
+        self.uris = list(self.archive.uris(400))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_coverage(self):
+        archived = [uri_r for uri_r in self.uris if uri_r in self.archive]
+        assert 100 < len(archived) < 300
+        for uri_r in self.uris:
+            assert (self.archive.timeline(uri_r) is not None) == (uri_r in self.archive)
+        assert sorted(self.archive.materialize(self.uris).uris()) == sorted(surt(u) for u in archived)
+        assert all(uri_r in SyntheticArchive(seed=3) for uri_r in self.uris)
+        with self.assertRaises(ValueError):
+            SyntheticArchive(coverage=1.5)
+
+    def test_shared_index(self):
+        index = self.archive.materialize(self.uris)
+        write_index(index, self.path)
+        shared = SharedMementoIndex.open(self.path)
+        assert shared.bloom is not None
+        for uri_r in self.uris:
+            timeline = shared.timeline(uri_r)
+            if uri_r in index:
+                assert list(timeline) == list(index.timeline(uri_r))
+            else:
+                assert timeline is None
+        # the misses rarely search the keys
+        rejections = shared.bloom_rejections
+        assert rejections > (len(self.uris) - len(index)) * 0.9
+        with mock.patch.object(shared, "_key", side_effect=AssertionError):
+            for i in range(100):
+                if "http://www.cnn.com/%d" % i in shared.bloom:
+                    continue
+                assert shared.timeline("http://www.cnn.com/%d" % i) is None
+        shared.close()
+
+        size = write_index(index, self.path, error_rate=None)
+        shared = SharedMementoIndex.open(self.path)
+        assert shared.bloom is None and size == os.path.getsize(self.path)
+        assert sorted(shared.uris()) == sorted(index.uris())
+        assert shared.timeline("http://www.cnn.com") is None
+        shared.close()
+
+    def test_older_index_version(self):
+        with open(self.path, "wb") as f:
+            f.write(PREAMBLE.pack(INDEX_MAGIC, 1) + b"\x00" * 32)
+        with self.assertRaises(IndexFormatError):
+            SharedMementoIndex.open(self.path)
+        with open(self.path, "wb") as f:
+            f.write(b"\x00" * HEADER.size)
+        with self.assertRaises(IndexFormatError):
+            SharedMementoIndex.open(self.path)
+
+    def test_server(self):
+        client = Client(create_application(archive=self.archive))
+        archived = [uri_r for uri_r in self.uris if uri_r in self.archive]
+        missing = [uri_r for uri_r in self.uris if uri_r not in self.archive]
+        assert client.get("/tg/" + archived[0]).status_code == 302
+        for path in ("/tg/", "/timemap/link/", "/2010/"):
+            assert client.get(path + missing[0]).status_code == 404
+
+    def test_not_archived_preference(self):
+        client = Client(create_application(archive=self.archive))
+        uri_r = [uri_r for uri_r in self.uris if uri_r in self.archive][0]
+        memento = "/%s/" % archive_timestamp(self.archive.timeline(uri_r)[0])
+        for path in ("/tg/", "/timemap/link/", "/timemap/json/", memento):
+            for prefer in ("not_archived", "no_original_link_header, not_archived"):
+                response = client.get(path + uri_r, headers={"Prefer": prefer})
+                assert response.status_code == 404, path
+                assert response.data == b""
+                assert "Link" not in response.headers and "Vary" not in response.headers
+                assert response.headers["Preference-Applied"] == prefer
+                head = client.head(path + uri_r, headers={"Prefer": prefer})
+                assert head.status_code == 404
+                assert head.headers["Content-Length"] == "0"
+        # a scenario restricted server ignores it
+        client = Client(create_application(archive=self.archive, scenarios=["tg_303"]))
+        assert client.get("/tg/" + uri_r, headers={"Prefer": "not_archived"}).status_code \
+            == 302
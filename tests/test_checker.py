@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import application
+from memento_test.checker import ConformanceChecker, check_timegate_response, \
+    check_memento_response
+import io
+import json
+import threading
+import unittest
+from unittest import mock
+from werkzeug.serving import make_server
+
+
+class CheckerRulesTest(unittest.TestCase):
+
+    def test_timegate_rules(self):
+        headers = {"vary": "accept-encoding, Accept-Datetime",
+                   "link": '<http://a.com>; rel="original"',
+                   "location": "http://archive/2010/http://a.com"}
+        assert check_timegate_response(302, headers) == []
+        assert check_timegate_response(404, headers) == ["unexpected_status"]
+        assert check_timegate_response(302, {}) == \
+            ["no_vary_header", "no_link_header", "no_location_header"]
+        assert check_timegate_response(200, dict(headers, **{"memento-datetime": "x"})) == \
+            ["no_content_location_header", "invalid_memento_dt_header"]
+        assert "unexpected_memento_dt_header" in check_timegate_response(
+            302, dict(headers, **{"memento-datetime": "Sun, 01 Apr 2010 12:00:00 GMT"}))
+
+    def test_memento_rules(self):
+        headers = {"memento-datetime": "Sun, 01 Apr 2010 12:00:00 GMT",
+                   "link": '<http://a.com>; rel="original", '
+                           '<http://archive/2010/http://a.com>; rel="memento"; '
+                           'datetime="Sun, 01 Apr 2010 12:00:00"'}
+        assert check_memento_response(200, headers) == ["invalid_datetime_in_link_header"]
+        assert check_memento_response(302, {"location": "http://archive/"}) == []
+        assert check_memento_response(302, {}) == ["no_location_header"]
+
+
+class CheckerServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = make_server("127.0.0.1", 0, application, threaded=True)
+        self.host_name = "http://127.0.0.1:%d/" % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        # the mementos are redirected to on the port of this server
+        patcher = mock.patch("memento_test.server.HOST_NAME", self.host_name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        if self.thread.is_alive():
+            self.server.shutdown()
+            self.thread.join()
+        self.server.server_close()
+
+    def _reports(self, uri_rs, **options):
+        checker = ConformanceChecker(self.host_name + "tg/", **options)
+        return sorted(checker.reports(uri_rs), key=lambda r: r["uri_r"])
+
+    def test_valid_timegate(self):
+        uri_rs = ["http://www.espn.com/%d\n" % i for i in range(50)] + ["\n", "# comment\n"]
+        reports = self._reports(uri_rs, concurrency=8)
+
+        assert len(reports) == 50
+        for report in reports:
+            assert report["valid"], report
+            assert report["status"] == 302
+            assert report["memento"]["status"] == 200
+            assert report["memento"]["uri"].startswith(self.host_name)
+
+    def test_scenarios_are_reported(self):
+        scenarios = {
+            "no_vary_header": ["no_vary_header"],
+            "invalid_vary_header": ["invalid_vary_header"],
+            "no_link_header": ["no_link_header"],
+            "invalid_link_header": ["invalid_link_header"],
+            "no_original_link_header": ["no_original_link_header"],
+            "invalid_datetime_in_link_header": ["no_original_link_header",
+                                                "invalid_datetime_in_link_header"],
+            "tg_302_no_location_header": ["no_location_header"],
+            "tg_200_no_memento_dt_header": ["no_content_location_header",
+                                            "no_memento_dt_header"],
+            "tg_302_memento_dt_header": ["unexpected_memento_dt_header"],
+            "no_accept_dt_error": ["unexpected_status"],
+        }
+        for prefer, errors in scenarios.items():
+            report = self._reports(["http://www.espn.com"], prefer=prefer, concurrency=1)[0]
+            assert not report["valid"]
+            assert report["errors"] == errors, (prefer, report)
+
+        report = self._reports(["http://www.espn.com"], prefer="tg_200")[0]
+        assert report["valid"]
+        assert "memento" not in report
+
+    def test_run_writes_json_lines(self):
+        checker = ConformanceChecker(self.host_name + "tg/", concurrency=4, method="GET")
+        output = io.StringIO()
+        checked, invalid = checker.run(["http://www.espn.com/%d" % i for i in range(10)],
+                                       output)
+        assert (checked, invalid) == (10, 0)
+        lines = output.getvalue().splitlines()
+        assert len(lines) == 10
+        assert {json.loads(line)["uri_r"] for line in lines} == \
+            {"http://www.espn.com/%d" % i for i in range(10)}
+
+    def test_connection_error(self):
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        report = self._reports(["http://www.espn.com"], timeout=1)[0]
+        assert report["errors"] == ["connection_error"]
+        assert not report["valid"]
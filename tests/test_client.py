@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.aioclient import AsyncMementoSession
+from memento_test.archive import SyntheticArchive, timeline_epochs, archive_timestamp
+from memento_test.client import MementoSession, LinkFormatParser, RedirectError, \
+    MementoClientError
+from memento_test.server import create_application
+from memento_test.serving import bind_socket, make_worker_server
+from datetime import datetime
+import asyncio
+import http.client
+import threading
+import unittest
+
+URI_R = "http://www.espn.com"
+TIMEMAP = ('<http://www.espn.com>; rel="original",\n'
+           '<http://a/tm>; rel="self"; type="application/link-format"; '
+           'from="Mon, 01 Jan 2001 00:00:00 GMT",\n'
+           '<http://a/20010101000000/http://www.espn.com>; rel="first memento"; '
+           'datetime="Mon, 01 Jan 2001 00:00:00 GMT", '
+           '<http://a/20020101000000/http://www.espn.com>; rel="last memento"; '
+           'datetime="Tue, 01 Jan 2002 00:00:00 GMT"\n')
+
+
+class LinkFormatParserTest(unittest.TestCase):
+
+    def test_incremental(self):
+        parser = LinkFormatParser()
+        entries = parser.feed(TIMEMAP) + parser.close()
+        assert [e.rel for e in entries] == [["original"], ["self"], ["first", "memento"],
+                                            ["last", "memento"]]
+        assert entries[3].datetime == "Tue, 01 Jan 2002 00:00:00 GMT"
+
+        for size in (1, 2, 7, 50):
+            parser = LinkFormatParser()
+            chunked = []
+            for i in range(0, len(TIMEMAP), size):
+                chunked.extend(parser.feed(TIMEMAP[i:i + size]))
+            assert chunked + parser.close() == entries, size
+
+
+class ClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.archive = SyntheticArchive(seed=1, density=20)
+        self.sock = bind_socket("127.0.0.1", 0)
+        self.host_name = "http://127.0.0.1:%d/" % self.sock.getsockname()[1]
+        application = create_application(archive=self.archive, host_name=self.host_name,
+                                          timemap_page_size=50)
+        self.server = make_worker_server(application, self.sock, keep_alive=True)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.session = MementoSession(timeout=10)
+
+    def tearDown(self):
+        self.session.close()
+        self.server.shutdown()
+        self.thread.join()
+        self.server.server_close()
+        self.sock.close()
+
+    def _timestamps(self):
+        return [archive_timestamp(int(s)) for s in timeline_epochs(self.archive.timeline(URI_R))]
+
+    def test_negotiate(self):
+        memento = self.session.negotiate(self.host_name + "tg/", URI_R,
+                                         accept_datetime=datetime(2010, 1, 1))
+        assert memento.status == 200
+        assert memento.uri_m.startswith(self.host_name)
+        assert memento.uri_m.endswith("/" + URI_R)
+        assert memento.redirects == [memento.uri_m]
+        assert memento.uri_m.split("/")[3] in self._timestamps()
+        assert "original" in memento.links[URI_R]["rel"]
+        assert memento.datetime.year in (2009, 2010)
+
+        # the connection kept alive by the server is pooled, and reused for every hop
+        key = ("http", self.host_name[7:-1])
+        assert len(self.session._idle.get(key)) == 1
+        pooled = self.session._idle[key][0]
+        self.session.negotiate(self.host_name + "tg/", URI_R)
+        assert self.session._idle[key] == [pooled]
+
+        # the connections closed by the server are not pooled
+        session = MementoSession(timeout=10, headers={"Connection": "close"})
+        self.addCleanup(session.close)
+        assert session.negotiate(self.host_name + "tg/", URI_R).status == 200
+        assert not session._idle.get(key)
+
+        # a connection closed while idle is replaced
+        stale = http.client.HTTPConnection(key[1])
+        stale.connect()
+        stale.sock.close()
+        self.session._idle[key] = [stale]
+        assert self.session.negotiate(self.host_name + "tg/", URI_R).status == 200
+
+    def test_redirect_limits(self):
+        with self.assertRaises(RedirectError):
+            self.session.negotiate(self.host_name + "tg/", URI_R,
+                                   prefer="valid_internal_redirect")
+        session = MementoSession(max_redirects=0)
+        self.addCleanup(session.close)
+        with self.assertRaises(RedirectError):
+            session.negotiate(self.host_name + "tg/", URI_R)
+
+    def test_paged_timemap(self):
+        timestamps = self._timestamps()
+        assert len(timestamps) > 100
+
+        for timemap_format in ("link", "json"):
+            uri = self.host_name + "timemap/%s/%s" % (timemap_format, URI_R)
+            mementos = list(self.session.mementos(uri))
+            assert [m.uri.split("/")[3] for m in mementos] == timestamps, timemap_format
+
+            first_page = list(self.session.mementos(uri, follow_pages=False))
+            assert len(first_page) == 50
+
+        entries = list(self.session.timemap(self.host_name + "timemap/link/" + URI_R))
+        nexts = [e.uri for e in entries if "next" in e.rel]
+        assert nexts[0] == self.host_name + "timemap/link/" + URI_R + "?page=2"
+        assert len(nexts) == (len(timestamps) - 1) // 50
+
+        with self.assertRaises(MementoClientError):
+            list(self.session.timemap(self.host_name + "timemap/link/" + URI_R + "?page=999"))
+
+    def test_async_session(self):
+        async def run():
+            async with AsyncMementoSession(timeout=10) as session:
+                mementos = await asyncio.gather(*[
+                    session.negotiate(self.host_name + "tg/", URI_R + "/%d" % i)
+                    for i in range(10)])
+                timemap = [m async for m in session.mementos(
+                    self.host_name + "timemap/link/" + URI_R)]
+                with self.assertRaises(RedirectError):
+                    await session.negotiate(self.host_name + "tg/", URI_R,
+                                            prefer="valid_internal_redirect")
+                return mementos, timemap
+
+        mementos, timemap = asyncio.run(run())
+        assert all(m.status == 200 and m.uri_m for m in mementos)
+        assert [m.uri.split("/")[3] for m in timemap] == self._timestamps()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.corpus import corpus_cases, export_corpus, Corpus, CorpusCase, \
+    CorpusFormatError, CORPUS_NOW
+from memento_test.server import create_application
+import os
+import shutil
+import tempfile
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+
+class CorpusTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "golden.mtc")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_cases(self):
+        cases = list(corpus_cases(["http://www.espn.com"], [None], max_combination=1))
+        assert CorpusCase("GET", "/", None, None) in cases
+        assert CorpusCase("GET", "/tg/http://www.espn.com", "tg_303", None) in cases
+        assert CorpusCase("GET", "/timemap/json/http://www.espn.com",
+                          "invalid_link_header", None) in cases
+        assert not any(case.prefer and "," in case.prefer for case in cases)
+
+        pairs = list(corpus_cases(["http://www.espn.com"], [None], max_combination=2))
+        assert CorpusCase("GET", "/tg/http://www.espn.com", "no_link_header, tg_303",
+                          None) in pairs
+        assert len(set(pairs)) == len(pairs)
+
+    def test_export(self):
+        cases = list(corpus_cases(["http://www.espn.com"],
+                                  [None, "Thu, 01 Jan 2015 00:00:00 GMT"],
+                                  max_combination=1))
+        assert export_corpus(cases, self.path, processes=0, seed=1) == len(cases)
+        other = os.path.join(self.tmp, "other.mtc")
+        export_corpus(cases, other, processes=2, seed=1)
+        with open(self.path, "rb") as f, open(other, "rb") as g:
+            assert f.read() == g.read()
+
+        corpus = Corpus.open(self.path)
+        self.addCleanup(corpus.close)
+        assert len(corpus) == len(cases)
+        assert set(corpus.cases()) == set(cases)
+
+        status, headers = corpus.get("GET", "/tg/http://www.espn.com", prefer="tg_303",
+                                     accept_datetime="Thu, 01 Jan 2015 00:00:00 GMT")
+        assert status == 303
+        headers = dict(headers)
+        assert headers["Preference-Applied"] == "tg_303"
+        assert headers["Location"].startswith("http://localhost:4000/201")
+        assert corpus.get("GET", "/tg/http://www.cnn.com") is None
+
+    def test_matches_the_server(self):
+        cases = list(corpus_cases(["http://www.espn.com"], [None], max_combination=1))
+        export_corpus(cases, self.path, processes=0)
+        corpus = Corpus.open(self.path)
+        self.addCleanup(corpus.close)
+
+        client = Client(create_application(now=CORPUS_NOW))
+        for case, status, headers in corpus.items():
+            environ_headers = [("Prefer", case.prefer)] if case.prefer else []
+            builder = EnvironBuilder(path=case.path, headers=environ_headers)
+            app_iter, expected_status, expected_headers = \
+                client.run_wsgi_app(builder.get_environ())
+            assert status == int(expected_status[:3]), case
+            assert headers == list(expected_headers.items()), case
+
+    def test_invalid_corpus(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a corpus file at all, not at all")
+        with self.assertRaises(CorpusFormatError):
+            Corpus.open(self.path)
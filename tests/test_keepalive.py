@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application
+from memento_test.serving import bind_socket, make_worker_server
+from memento_test.keepalive import KeepAliveWSGIServer
+import re
+import socket
+import threading
+import time
+import unittest
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+TIMEGATE = b"GET /tg/http://www.espn.com HTTP/1.1\r\nHost: localhost\r\n\r\n"
+
+
+def chunks_application(environ, start_response):
+    """
+    A response without a Content-Length.
+    """
+    if environ["PATH_INFO"] == "/error":
+        raise ValueError("error")
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"memento", b"", b"-test"]
+
+
+class KeepAliveTest(unittest.TestCase):
+
+    def _start(self, application=None, **options):
+        sock = bind_socket("127.0.0.1", 0)
+        self.addCleanup(sock.close)
+        server = make_worker_server(application or create_application(), sock,
+                                    keep_alive=True, **options)
+        assert isinstance(server, KeepAliveWSGIServer)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        self.port = sock.getsockname()[1]
+        return server
+
+    def _connect(self):
+        connection = socket.create_connection(("127.0.0.1", self.port), timeout=10)
+        self.addCleanup(connection.close)
+        return connection
+
+    def _read_all(self, connection):
+        data = b""
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                return data
+            data += chunk
+
+    def test_connection_reuse(self):
+        self._start()
+        connection = HTTPConnection("127.0.0.1", self.port, timeout=10)
+        self.addCleanup(connection.close)
+        sockets = set()
+        for path in ("/tg/http://www.espn.com", "/timemap/link/http://www.espn.com",
+                     "/tg/http://www.cnn.com"):
+            connection.request("GET", path)
+            response = connection.getresponse()
+            response.read()
+            assert response.version == 11
+            assert response.getheader("Connection") is None
+            sockets.add(connection.sock)
+        assert len(sockets) == 1
+
+    def test_pipelining(self):
+        self._start()
+        connection = self._connect()
+        # a POST body that the application does not read is skipped
+        post = (b"POST /tg/http://www.cnn.com HTTP/1.1\r\nHost: localhost\r\n"
+                b"Content-Length: 11\r\n\r\nhello world")
+        head = b"HEAD /timemap/link/http://www.espn.com HTTP/1.1\r\nHost: localhost\r\n\r\n"
+        close = b"GET /tg/http://www.cnn.com HTTP/1.1\r\nConnection: close\r\n\r\n"
+        connection.sendall(TIMEGATE + post + head + TIMEGATE + close)
+        data = self._read_all(connection)
+        statuses = re.findall(br"HTTP/1\.1 (\d{3}) ", data)
+        assert statuses == [b"302", b"405", b"200", b"302", b"302"]
+        assert data.count(b"Connection: close") == 1
+        assert data.count(b"Location: ") == 3
+
+    def test_chunked(self):
+        self._start(chunks_application)
+        connection = HTTPConnection("127.0.0.1", self.port, timeout=10)
+        self.addCleanup(connection.close)
+        for _ in range(2):
+            connection.request("GET", "/")
+            response = connection.getresponse()
+            assert response.getheader("Transfer-Encoding") == "chunked"
+            assert response.read() == b"memento-test"
+
+        connection = self._connect()
+        connection.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        time.sleep(0.2)
+        assert connection.recv(65536).endswith(
+            b"\r\n\r\n7\r\nmemento\r\n5\r\n-test\r\n0\r\n\r\n")
+
+    def test_http10(self):
+        self._start()
+        connection = self._connect()
+        connection.sendall(b"GET /tg/http://www.espn.com HTTP/1.0\r\n"
+                           b"Connection: keep-alive\r\n\r\n")
+        time.sleep(0.2)
+        response = connection.recv(65536)
+        assert b"Connection: keep-alive" in response
+        connection.sendall(b"GET /tg/http://www.espn.com HTTP/1.0\r\n\r\n")
+        response = self._read_all(connection)
+        assert response.startswith(b"HTTP/1.1 302")
+        assert b"Connection: close" in response
+
+        # without a length, the end of the body is the end of the connection
+        self.doCleanups()
+        self._start(chunks_application)
+        connection = self._connect()
+        connection.sendall(b"GET / HTTP/1.0\r\nConnection: keep-alive\r\n\r\n")
+        response = self._read_all(connection)
+        assert b"Connection: close" in response
+        assert b"Transfer-Encoding" not in response
+        assert response.endswith(b"\r\n\r\nmemento-test")
+
+    def test_idle_timeout(self):
+        self._start(idle_timeout=0.3)
+        connection = self._connect()
+        connection.sendall(TIMEGATE)
+        start = time.time()
+        data = self._read_all(connection)
+        assert data.startswith(b"HTTP/1.1 302")
+        assert 0.2 < time.time() - start < 5
+
+    def test_max_requests(self):
+        server = self._start()
+        server.max_requests = 2
+        connection = self._connect()
+        connection.sendall(TIMEGATE * 3)
+        data = self._read_all(connection)
+        assert data.count(b"HTTP/1.1 302") == 2
+        assert data.count(b"Connection: close") == 1
+
+    def test_errors(self):
+        self._start(chunks_application)
+        connection = self._connect()
+        connection.sendall(b"GET /error HTTP/1.1\r\nHost: localhost\r\n\r\n" + TIMEGATE)
+        data = self._read_all(connection)
+        assert data.startswith(b"HTTP/1.1 500")
+        assert data.count(b"HTTP/1.1 ") == 1
+
+        with self.assertRaises(ValueError):
+            KeepAliveWSGIServer("127.0.0.1", 0, chunks_application, idle_timeout=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,9 @@
 # -*- coding: utf-8 -*-
 
 from memento_test.server import application, \
-    convert_to_datetime, \
+    convert_to_datetime, convert_archive_datetime, \
     parse_link_header, get_uri_dt_for_rel
+from datetime import datetime
 import unittest
 import logging
 from werkzeug.test import Client, EnvironBuilder
@@ -16,7 +17,7 @@ class MementoTest(unittest.TestCase):
     def test_on_all_headers(self):
 
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "all_headers")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -41,7 +42,7 @@ class MementoTest(unittest.TestCase):
     def test_on_required_headers(self):
 
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "required_headers")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -57,7 +58,7 @@ class MementoTest(unittest.TestCase):
     def test_on_no_headers(self):
 
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "no_headers")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -69,7 +70,7 @@ class MementoTest(unittest.TestCase):
     def test_on_no_link_header(self):
 
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "no_link_header")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -81,7 +82,7 @@ class MementoTest(unittest.TestCase):
     def test_on_invalid_link_header(self):
 
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "invalid_link_header")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -96,7 +97,7 @@ class MementoTest(unittest.TestCase):
     def test_on_no_original_link_header(self):
 
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "no_original_link_header")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -111,7 +112,7 @@ class MementoTest(unittest.TestCase):
     def test_on_invalid_datetime_in_link_header(self):
 
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "invalid_datetime_in_link_header")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -128,7 +129,7 @@ class MementoTest(unittest.TestCase):
 
     def test_on_no_memento_dt_header(self):
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "no_memento_dt_header")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -142,7 +143,7 @@ class MementoTest(unittest.TestCase):
 
     def test_on_invalid_memento_dt_header(self):
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "invalid_memento_dt_header")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -184,7 +185,7 @@ class MementoTest(unittest.TestCase):
 
     def test_on_invalid_archived_redirect(self):
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "invalid_archived_redirect")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -196,7 +197,7 @@ class MementoTest(unittest.TestCase):
 
     def test_on_invalid_internal_redirect(self):
         client = Client(application)
-        builder = EnvironBuilder(path="/2016/http://www.espn.com",
+        builder = EnvironBuilder(path="/20160101000000/http://www.espn.com",
                                  headers=[("Prefer", "invalid_internal_redirect")])
         env = builder.get_environ()
         app_iter, status, headers = client.run_wsgi_app(env)
@@ -205,3 +206,46 @@ class MementoTest(unittest.TestCase):
         assert headers.get("Location") is None \
                or headers.get("Link") is None \
                or headers.get("Memento-Datetime") is None
+
+    def test_partial_url_datetime(self):
+        client = Client(application)
+        for path, location in (("/2016/", "20160101000000"), ("/201607/", "20160701000000"),
+                               ("/1999/", "19990101000000")):
+            builder = EnvironBuilder(path=path + "http://www.espn.com",
+                                     headers=[("Prefer", "all_headers")])
+            app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+            assert "302" in status
+            assert headers.get("Location") == \
+                "http://localhost:4000/%s/http://www.espn.com" % location
+
+    def test_convert_archive_datetime(self):
+        assert convert_archive_datetime(2016) == datetime(2016, 1, 1)
+        assert convert_archive_datetime("201607") == datetime(2016, 7, 1)
+        assert convert_archive_datetime(201607131212) == datetime(2016, 7, 13, 12, 12)
+        assert convert_archive_datetime(20160713121) == datetime(2016, 7, 13, 12, 10)
+        assert convert_archive_datetime(20170713121257) == datetime(2017, 7, 13, 12, 12, 57)
+        for invalid in (201, 201607131212570, 20161301, 20160230, "2016-07", -2016):
+            with self.assertRaises(ValueError):
+                convert_archive_datetime(invalid)
+
+    def test_url_datetime(self):
+        client = Client(application)
+        builder = EnvironBuilder(path="/20170713121257/http://www.espn.com",
+                                 headers=[("Prefer", "all_headers")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "200" in status
+        assert headers.get("Memento-Datetime") == "Thu, 13 Jul 2017 12:12:57 GMT"
+        lh = parse_link_header(headers.get("Link"))
+        assert "memento" in lh["http://localhost:4000/20170713121257/http://www.espn.com"]["rel"]
+
+        # before the default first memento
+        builder = EnvironBuilder(path="/19990101000000/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert headers.get("Memento-Datetime") == "Fri, 01 Jan 1999 00:00:00 GMT"
+        lh = parse_link_header(headers.get("Link"))
+        assert {"first", "memento"} == \
+            set(lh["http://localhost:4000/19990101000000/http://www.espn.com"]["rel"])
+
+        builder = EnvironBuilder(path="/20171301/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "404" in status
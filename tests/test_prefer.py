@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import application
+from memento_test.prefer import parse_prefer, format_preference, prefer_cache_info, Preference
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+
+class PreferTest(unittest.TestCase):
+
+    def test_tokens(self):
+        assert parse_prefer("tg_302") == (Preference("tg_302", None, ()),)
+        assert [p.name for p in parse_prefer(" tg_302 ,all_headers,, ")] == \
+            ["tg_302", "all_headers"]
+        assert parse_prefer("") == ()
+        assert parse_prefer(None) == ()
+
+    def test_values_and_params(self):
+        prefs = parse_prefer('return=minimal; foo="some, parameter"; bar, wait = 10,x=""')
+        assert prefs == (
+            Preference("return", "minimal", (("foo", "some, parameter"), ("bar", None))),
+            Preference("wait", "10", ()),
+            Preference("x", None, ()),
+        )
+        assert parse_prefer(r'a="q\"uo\\te"')[0].value == 'q"uo\\te'
+
+    def test_case_folding_and_duplicates(self):
+        prefs = parse_prefer("Return=Minimal; Foo=Bar, RETURN=representation")
+        assert prefs == (Preference("return", "Minimal", (("foo", "Bar"),)),)
+
+    def test_malformed_preferences_are_ignored(self):
+        prefs = parse_prefer('tg_302 x, "quoted", =1, a="unterminated, tg_303')
+        # an unterminated quoted-string runs to the end of the header
+        assert prefs == ()
+        prefs = parse_prefer('@bad, tg_303; p="a,b" junk, all_headers')
+        assert [p.name for p in prefs] == ["all_headers"]
+
+    def test_cache(self):
+        header = "tg_302, return=minimal; cache=test"
+        first = parse_prefer(header)
+        hits = prefer_cache_info().hits
+        assert parse_prefer(header) is first
+        assert prefer_cache_info().hits == hits + 1
+        assert prefer_cache_info().maxsize is not None
+
+    def test_format_preference(self):
+        assert format_preference("tg_302") == "tg_302"
+        assert format_preference("return", "minimal") == "return=minimal"
+        assert format_preference("x", 'a "b"') == 'x="a \\"b\\""'
+
+
+class PreferServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = Client(application)
+
+    def _get(self, path, *prefer):
+        builder = EnvironBuilder(path=path, headers=[("Prefer", p) for p in prefer])
+        app_iter, status, headers = self.client.run_wsgi_app(builder.get_environ())
+        return b"".join(app_iter), status, headers
+
+    def test_case_insensitive_names(self):
+        body, status, headers = self._get("/tg/http://www.espn.com", "TG_303")
+        assert "303" in status
+        assert headers.get("Preference-Applied") == "tg_303"
+
+    def test_multiple_headers(self):
+        body, status, headers = self._get("/tg/http://www.espn.com", "unknown", "tg_303")
+        assert "303" in status
+        assert headers.get("Preference-Applied") == "tg_303"
+
+    def test_parameters_do_not_hide_preferences(self):
+        body, status, headers = self._get("/tg/http://www.espn.com", 'tg_303; reason="test"')
+        assert "303" in status
+        assert headers.get("Preference-Applied") == "tg_303"
+
+    def test_return_minimal(self):
+        body, status, headers = self._get("/timemap/link/http://www.espn.com")
+        assert body
+        body, status, headers = self._get("/timemap/link/http://www.espn.com",
+                                          "return=minimal")
+        assert "200" in status
+        assert body == b""
+        assert headers.get("Preference-Applied") == "return=minimal"
+        assert headers.get("Content-Type").startswith("application/link-format")
+
+    def test_return_with_scenario(self):
+        body, status, headers = self._get("/tg/http://www.espn.com",
+                                          "return=representation, tg_303")
+        assert "303" in status
+        assert headers.get("Preference-Applied") == "return=representation, tg_303"
+
+        body, status, headers = self._get("/tg/http://www.espn.com", "return=other")
+        assert "302" in status
+        assert headers.get("Preference-Applied") is None
+        assert headers.get("Location")
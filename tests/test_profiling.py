@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application, MementoServer
+from memento_test.profiling import RequestProfiler, StackProfiler
+import os
+import pstats
+import shutil
+import tempfile
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+
+def _profiles(directory):
+    found = []
+    for root, dirs, files in os.walk(directory):
+        found.extend(os.path.join(root, f) for f in files)
+    return sorted(found)
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_profile_header(self):
+        client = Client(create_application(profiler=RequestProfiler(self.tmp)))
+
+        builder = EnvironBuilder(path="/tg/http://www.espn.com",
+                                 headers=[("Prefer", "tg_303")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "303" in status
+        assert _profiles(self.tmp) == []
+
+        builder = EnvironBuilder(path="/tg/http://www.espn.com",
+                                 headers=[("Prefer", "tg_303"), ("X-Memento-Profile", "1")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "303" in status
+
+        profiles = _profiles(self.tmp)
+        assert len(profiles) == 1
+        assert os.path.dirname(profiles[0]) == os.path.join(self.tmp, "timegate", "tg_303")
+        stats = pstats.Stats(profiles[0])
+        functions = [f[2] for f in stats.stats]
+        assert "dispatch_request" in functions
+        assert "on_tg_303" in functions
+
+    def test_sample_rate(self):
+        client = Client(create_application(profiler=RequestProfiler(self.tmp, sample_rate=3)))
+        for _ in range(9):
+            builder = EnvironBuilder(path="/20160101000000/http://www.espn.com")
+            app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+            assert "200" in status
+
+        profiles = _profiles(self.tmp)
+        assert len(profiles) == 3
+        assert all(os.path.dirname(p) == os.path.join(self.tmp, "memento", "default")
+                   for p in profiles)
+
+    def test_collapsed_stacks_include_body(self):
+        profiler = RequestProfiler(self.tmp, profile_format="collapsed")
+        client = Client(create_application(profiler=profiler))
+        builder = EnvironBuilder(path="/timemap/link/http://www.espn.com",
+                                 headers=[("X-Memento-Profile", "1")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+
+        assert "200" in status
+        assert b"rel=\"original\"" in b"".join(app_iter)
+        profiles = _profiles(self.tmp)
+        assert len(profiles) == 1
+        assert profiles[0].endswith(".collapsed")
+        with open(profiles[0]) as f:
+            lines = f.read().splitlines()
+        assert any("link_format_timemap" in line for line in lines)
+        for line in lines:
+            stack, micros = line.rsplit(" ", 1)
+            assert int(micros) >= 0
+
+    def test_unmatched_request(self):
+        client = Client(create_application(profiler=RequestProfiler(self.tmp, sample_rate=1)))
+        builder = EnvironBuilder(path="/tg/")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+
+        assert "404" in status
+        assert os.path.dirname(_profiles(self.tmp)[0]) == \
+            os.path.join(self.tmp, "unknown", "default")
+
+    def test_disabled_by_default(self):
+        assert MementoServer().profiler is None
+        with self.assertRaises(ValueError):
+            RequestProfiler(self.tmp, profile_format="svg")
+
+    def test_stack_profiler(self):
+        def leaf():
+            return sum(range(1000))
+
+        def root():
+            return leaf()
+
+        profiler = StackProfiler()
+        profiler.enable()
+        root()
+        profiler.disable()
+
+        stacks = [";".join(s) for s in profiler.stacks]
+        assert any("root" in s and "leaf" in s and s.index("root") < s.index("leaf")
+                   for s in stacks)
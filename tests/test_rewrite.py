@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.rewrite import HtmlRewriter, rewrite_html
+from memento_test.server import create_application
+from memento_test.warc import WarcArchive
+from tests.test_warc import warc_record
+import os
+import shutil
+import tempfile
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+PREFIX = "http://localhost:4000/20170713121257/"
+PAGE = b"""<html><head><base href="/sub/"><link rel=stylesheet href=style.css></head>
+<body><a href="http://www.cnn.com/">cnn</a> <a HREF='/about'>about</a>
+<img data-src="x.png" src="//cdn.espn.com/logo.png" alt="a > b">
+<a href="#top">top</a><a href="javascript:void(0)">js</a><a href="mailto:a@b">m</a>
+<form action="search"><p>1 < 2</p></form>
+<a href="http://localhost:4000/20170713121257/http://www.espn.com/">self</a>
+</body></html>"""
+EXPECTED = b"""<html><head><base href="http://localhost:4000/20170713121257/http://www.espn.com/sub/"><link rel=stylesheet href="http://localhost:4000/20170713121257/http://www.espn.com/sub/style.css"></head>
+<body><a href="http://localhost:4000/20170713121257/http://www.cnn.com/">cnn</a> <a HREF='http://localhost:4000/20170713121257/http://www.espn.com/about'>about</a>
+<img data-src="x.png" src="http://localhost:4000/20170713121257/http://cdn.espn.com/logo.png" alt="a > b">
+<a href="#top">top</a><a href="javascript:void(0)">js</a><a href="mailto:a@b">m</a>
+<form action="http://localhost:4000/20170713121257/http://www.espn.com/sub/search"><p>1 < 2</p></form>
+<a href="http://localhost:4000/20170713121257/http://www.espn.com/">self</a>
+</body></html>"""
+
+
+class RewriteTest(unittest.TestCase):
+
+    def test_rewrite(self):
+        out = b"".join(rewrite_html([PAGE], "http://www.espn.com/", PREFIX))
+        assert out == EXPECTED
+
+    def test_chunk_boundaries(self):
+        for size in (1, 2, 3, 7, 64):
+            chunks = [PAGE[i:i + size] for i in range(0, len(PAGE), size)]
+            out = b"".join(rewrite_html(chunks, "http://www.espn.com/", PREFIX))
+            assert out == EXPECTED, size
+
+    def test_quoted_values(self):
+        page = b'<a title="see href=/x" href="/y">y</a><img alt="a>b" src="/i.png">'
+        expected = (b'<a title="see href=/x" href="' + PREFIX.encode() +
+                    b'http://www.espn.com/y">y</a><img alt="a>b" src="' + PREFIX.encode() +
+                    b'http://www.espn.com/i.png">')
+        for size in (1, 2, 5, len(page)):
+            chunks = [page[i:i + size] for i in range(0, len(page), size)]
+            out = b"".join(rewrite_html(chunks, "http://www.espn.com/", PREFIX))
+            assert out == expected, size
+
+    def test_bounded_carry(self):
+        rewriter = HtmlRewriter("http://www.espn.com/", PREFIX)
+        out = rewriter.feed(b"<p>text</p><a href='/x'")
+        assert out == b"<p>text</p>"
+        assert rewriter.feed(b">") == b"<a href='" + PREFIX.encode() + b"http://www.espn.com/x'>"
+
+        # an unterminated tag is not kept forever
+        huge = b"<a " + b"x" * 100000
+        assert rewriter.feed(huge) == huge
+        assert rewriter.close() == b""
+
+    def test_memento_payload_is_rewritten(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        with open(os.path.join(tmp, "a.warc"), "wb") as f:
+            f.write(warc_record("http://www.espn.com/", "2017-07-13T12:12:57Z", PAGE))
+        archive = WarcArchive(tmp)
+        self.addCleanup(archive.close)
+
+        client = Client(create_application(archive=archive))
+        builder = EnvironBuilder(path="/20170713121257/http://www.espn.com/")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "200" in status
+        assert headers.get("Content-Length") is None
+        assert b"".join(app_iter) == EXPECTED
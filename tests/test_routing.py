@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.routing import fast_match, match_request
+from memento_test.server import URL_MAP
+import random
+import unittest
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import RequestRedirect
+from werkzeug.test import EnvironBuilder
+
+PATHS = [
+    "/", "//", "///", "", "/tg", "/tg/", "/tg//", "/tg/x", "//tg/x", "/tg//x", "/tg/x/",
+    "/tg/http://www.espn.com", "/tg/http://www.espn.com/", "/tg/http:/www.espn.com",
+    "/tg/http://www.espn.com//a//b", "/tg/http://www.espn.com/?q=1", "/tg/a\nb",
+    "/20170713121257/http://www.espn.com", "/0016/http://www.espn.com", "/2017/x",
+    "/2017", "/2017/", "/2017//x", "/-1/x", "/+1/x", "/1.0/x", "/١٢/x",
+    "/timemap/link/http://www.espn.com", "/timemap/json/http://www.espn.com/",
+    "/timemap/xml/http://www.espn.com", "/timemap/link", "/timemap/link/",
+    "/timemap/link//x", "/timemap//link/x", "/timemap/LINK/x", "/TG/x", "/tgx/y",
+    "/other/x", "/tg/été", "/tg/%2F%2Fx", "/tg/x%0Ay", "/tg/ x", "/ tg/x",
+]
+ALPHABET = ["/", "//", "tg", "timemap", "link", "json", "2017", "0", "http:", "x",
+            "١", "é", "%2F", "\n", ".", " "]
+
+
+def werkzeug_match(environ):
+    try:
+        return URL_MAP.bind_to_environ(environ).match()
+    except RequestRedirect as e:
+        return type(e), e.new_url
+    except HTTPException as e:
+        return type(e),
+
+
+def fast_router_match(environ):
+    try:
+        return match_request(URL_MAP, environ)
+    except RequestRedirect as e:
+        return type(e), e.new_url
+    except HTTPException as e:
+        return type(e),
+
+
+class RoutingTest(unittest.TestCase):
+
+    def _check(self, path, method="GET"):
+        environ = EnvironBuilder(method=method).get_environ()
+        environ["PATH_INFO"] = path.encode("utf-8").decode("latin1")
+        assert fast_router_match(environ) == werkzeug_match(environ), (method, path)
+
+    def test_known_paths(self):
+        for method in ("GET", "HEAD", "POST", "OPTIONS"):
+            for path in PATHS:
+                self._check(path, method)
+
+    def test_random_paths(self):
+        rnd = random.Random(42)
+        for _ in range(5000):
+            path = "/" + "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 8)))
+            self._check(path)
+
+    def test_fast_path(self):
+        assert fast_match("/tg/http://www.espn.com//a") == (
+            "timegate", {"uri_r": "http://www.espn.com//a"})
+        assert fast_match("/0016/x") == ("memento", {"mem_dt": 16, "uri_r": "x"})
+        assert fast_match("/timemap/json/x") == (
+            "timemap", {"timemap_format": "json", "uri_r": "x"})
+        # left to werkzeug
+        assert fast_match("/tg//x") is None
+        assert fast_match("/other/x") is None
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application
+from memento_test.serving import bind_socket, listen_fds, inherited_socket, \
+    socket_address, make_worker_server, UnixHTTPConnection
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+try:
+    from http.client import HTTPConnection
+except ImportError:
+    from httplib import HTTPConnection
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ServingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "memento.sock")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _start(self, sock):
+        server = make_worker_server(create_application(), sock)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def test_unix_socket(self):
+        sock = bind_socket("unix://" + self.path, 0)
+        self.addCleanup(sock.close)
+        assert socket_address(sock) == ("unix://" + self.path, 0)
+        self._start(sock)
+
+        connection = UnixHTTPConnection(self.path, timeout=10)
+        connection.request("HEAD", "/tg/http://www.espn.com")
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        assert response.status == 302
+        assert response.getheader("Location").endswith("/http://www.espn.com")
+
+    def test_stale_unix_socket(self):
+        sock = bind_socket("unix://" + self.path, 0)
+        sock.close()
+        assert os.path.exists(self.path)
+        sock = bind_socket("unix://" + self.path, 0)
+        sock.close()
+
+        # other files are not removed
+        os.unlink(self.path)
+        open(self.path, "w").close()
+        with self.assertRaises(OSError):
+            bind_socket("unix://" + self.path, 0)
+        assert os.path.isfile(self.path)
+
+    def test_inherited_socket(self):
+        sock = bind_socket("127.0.0.1", 0)
+        self.addCleanup(sock.close)
+        inherited = inherited_socket(os.dup(sock.fileno()))
+        self.addCleanup(inherited.close)
+        assert socket_address(inherited) == sock.getsockname()
+        server = self._start(inherited)
+
+        connection = HTTPConnection("127.0.0.1", server.port, timeout=10)
+        connection.request("HEAD", "/tg/http://www.espn.com")
+        response = connection.getresponse()
+        response.read()
+        connection.close()
+        assert response.status == 302
+
+        r, w = os.pipe()
+        self.addCleanup(os.close, w)
+        with self.assertRaises(ValueError):
+            inherited_socket(r)
+        os.close(r)
+
+    def test_listen_fds(self):
+        environ = {"LISTEN_PID": str(os.getpid()), "LISTEN_FDS": "2",
+                   "LISTEN_FDNAMES": "http:http"}
+        with mock.patch.dict(os.environ, environ):
+            assert listen_fds() == [3, 4]
+            assert "LISTEN_FDS" not in os.environ
+            assert listen_fds() == []
+
+        with mock.patch.dict(os.environ, {"LISTEN_PID": "1", "LISTEN_FDS": "1"}):
+            assert listen_fds(unset_environment=False) == []
+            assert os.environ["LISTEN_FDS"] == "1"
+
+    def test_workers_on_inherited_socket(self):
+        sock = bind_socket("unix://" + self.path, 0)
+        self.addCleanup(sock.close)
+        env = dict(os.environ, PYTHONPATH=ROOT)
+        process = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "bin", "memento_test_server"),
+             "--fd", str(sock.fileno()), "--workers", "2"],
+            pass_fds=[sock.fileno()], env=env)
+        self.addCleanup(process.wait)
+        self.addCleanup(process.terminate)
+
+        # the socket is already listening, the connections wait for the workers
+        for _ in range(4):
+            connection = UnixHTTPConnection(self.path, timeout=30)
+            connection.request("HEAD", "/tg/http://www.espn.com")
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            assert response.status == 302
+        assert process.poll() is None
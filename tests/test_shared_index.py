@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application
+from memento_test.archive import SyntheticArchive, MementoIndex, closest_memento, numpy
+from memento_test.surt import surt
+from memento_test.shared_index import SharedMementoIndex, IndexFormatError, \
+    write_index, share_index
+from datetime import datetime
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+
+def _closest_in_child(name, uri_r, seconds, queue):
+    index = SharedMementoIndex.attach(name)
+    queue.put(closest_memento(index.timeline(uri_r), seconds))
+    index.close()
+
+
+class SharedMementoIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "index.mti")
+        self.archive = SyntheticArchive(seed=3, density=20)
+        self.uris = list(self.archive.uris(60))
+        self.index = self.archive.materialize(self.uris)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_file_round_trip(self):
+        size = write_index(self.index, self.path)
+        assert size == os.path.getsize(self.path)
+
+        shared = SharedMementoIndex.open(self.path)
+        assert len(shared) == len(self.index)
+        assert shared.memento_count() == self.index.memento_count()
+        assert sorted(shared.uris()) == sorted(surt(uri_r) for uri_r in self.uris)
+        for uri_r in self.uris:
+            assert list(shared.timeline(uri_r)) == list(self.index.timeline(uri_r))
+            assert uri_r in shared
+        assert shared.timeline("http://www.cnn.com") is None
+        assert "http://www.cnn.com" not in shared
+        shared.close()
+
+    def test_empty_and_unicode_keys(self):
+        index = MementoIndex()
+        write_index(index, self.path)
+        shared = SharedMementoIndex.open(self.path)
+        assert len(shared) == 0
+        assert shared.timeline("http://www.espn.com") is None
+        shared.close()
+
+        index.add(u"http://www.例え.jp/ü", [datetime(2010, 1, 1)])
+        index.add("http://a.com", [datetime(2011, 1, 1), datetime(2012, 1, 1)])
+        write_index(index, self.path)
+        shared = SharedMementoIndex.open(self.path)
+        assert len(shared.timeline(u"http://www.例え.jp/ü")) == 1
+        assert len(shared.timeline("http://a.com")) == 2
+        shared.close()
+
+    def test_not_an_index(self):
+        with open(self.path, "wb") as f:
+            f.write(b"x" * 100)
+        with self.assertRaises(IndexFormatError):
+            SharedMementoIndex.open(self.path)
+
+    @unittest.skipIf(numpy is None, "NumPy is not installed")
+    def test_numpy_views(self):
+        write_index(self.index, self.path)
+        shared = SharedMementoIndex.open(self.path, use_numpy=True)
+        timeline = shared.timeline(self.uris[0])
+
+        assert timeline.dtype == numpy.dtype("datetime64[s]")
+        assert list(timeline.view(numpy.int64)) == list(self.index.timeline(self.uris[0]))
+
+    def test_open_is_constant_time(self):
+        archive = SyntheticArchive(seed=4, density=400, density_spread=0)
+        index = archive.materialize(archive.uris(20))
+        assert index.memento_count() > 100000
+        write_index(index, self.path)
+
+        start = time.time()
+        shared = SharedMementoIndex.open(self.path)
+        assert time.time() - start < 0.05
+        shared.close()
+
+    def test_shared_memory_between_processes(self):
+        block = share_index(self.index)
+        try:
+            uri_r = self.uris[5]
+            seconds = self.index.timeline(uri_r)[0] + 10
+            ctx = multiprocessing.get_context("fork")
+            queue = ctx.Queue()
+            process = ctx.Process(target=_closest_in_child,
+                                  args=(block.name, uri_r, seconds, queue))
+            process.start()
+            result = queue.get(timeout=10)
+            process.join(10)
+
+            assert result == closest_memento(self.index.timeline(uri_r), seconds)
+        finally:
+            block.close()
+            block.unlink()
+
+    def test_server_from_shared_index(self):
+        index = MementoIndex()
+        index.add("http://www.espn.com", [datetime(2005, 1, 1), datetime(2010, 6, 1)])
+        write_index(index, self.path)
+        client = Client(create_application(archive=SharedMementoIndex.open(self.path)))
+
+        builder = EnvironBuilder(path="/tg/http://www.espn.com",
+                                 headers=[("Accept-Datetime", "Mon, 01 Mar 2010 00:00:00 GMT")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "302" in status
+        assert headers.get("Location") == "http://localhost:4000/20100601000000/http://www.espn.com"
+
+        builder = EnvironBuilder(path="/timemap/link/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "200" in status
+        assert b"20050101000000" in b"".join(app_iter)
+
+        builder = EnvironBuilder(path="/tg/http://www.cnn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "404" in status
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.archive import SyntheticArchive
+from memento_test.server import create_application, link_format_timemap
+from memento_test.singleflight import SingleFlight
+from memento_test.aiosingleflight import AsyncSingleFlight
+import asyncio
+import threading
+import unittest
+from unittest import mock
+from werkzeug.test import Client
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def _concurrent(self, target, count):
+        results = []
+
+        def run():
+            try:
+                results.append(target())
+            except Exception as e:
+                results.append(e)
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    def test_coalesced(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute(value):
+            calls.append(value)
+            started.set()
+            release.wait(10)
+            return [value]
+
+        leader, results = self._concurrent(lambda: flight.do("a", compute, 1), 1)
+        started.wait(10)
+        followers, follower_results = self._concurrent(lambda: flight.do("a", compute, 2), 9)
+        while flight.calls < 10:
+            threading.Event().wait(0.01)
+        # another key is not coalesced
+        assert flight.do("b", lambda: "b") == "b"
+        release.set()
+        for thread in leader + followers:
+            thread.join()
+
+        assert calls == [1]
+        assert results + follower_results == [[1]] * 10
+        assert all(result is results[0] for result in follower_results)
+        assert flight.stats() == {"calls": 11, "executions": 2, "coalesced": 9, "errors": 0,
+                                  "in_flight": 0, "coalescing_ratio": 0.8182}
+
+        # not cached
+        assert flight.do("a", compute, 3) == [3]
+
+    def test_errors(self):
+        flight = SingleFlight()
+        release = threading.Event()
+
+        def fail():
+            release.wait(10)
+            raise KeyError("x")
+
+        threads, results = self._concurrent(lambda: flight.do("a", fail), 5)
+        while flight.calls < 5:
+            threading.Event().wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        assert len(results) == 5 and all(isinstance(r, KeyError) for r in results)
+        assert flight.stats()["errors"] == 1
+        assert flight.stats()["in_flight"] == 0
+
+    def test_stream(self):
+        flight = SingleFlight()
+        produced = []
+
+        def chunks(count):
+            for i in range(count):
+                produced.append(i)
+                yield b"%d," % i
+
+        # a lone caller does not keep the chunks, and cannot be joined once one is read
+        lone = flight.stream("a", chunks, 100)
+        assert next(lone) == b"0,"
+        assert next(lone) == b"1,"
+        stream = flight._calls["a"]
+        assert stream.chunks == [] and stream.offset == 2
+        assert b"".join(flight.stream("a", chunks, 3)) == b"0,1,2,"
+        assert len(b"".join(lone)) == len(b"".join(b"%d," % i for i in range(2, 100)))
+        assert flight.stats()["executions"] == 2 and flight.stats()["in_flight"] == 0
+
+        # the callers joining before the first chunk share the chunks
+        del produced[:]
+        leader = flight.stream("b", chunks, 5)
+        followers = [flight.stream("b", chunks, 5) for _ in range(3)]
+        stream = flight._calls["b"]
+        assert next(leader) == b"0,"
+        assert [next(follower) for follower in followers] == [b"0,"] * 3
+        assert stream.chunks == []
+        # kept until the followers read them
+        assert b"".join(leader) == b"1,2,3,4,"
+        assert len(stream.chunks) == 4
+        # a follower left alone produces the rest
+        closed = followers.pop()
+        closed.close()
+        for follower in followers:
+            assert b"".join(follower) == b"1,2,3,4,"
+        assert produced == [0, 1, 2, 3, 4]
+        stats = flight.stats()
+        assert stats["calls"] == 6 and stats["executions"] == 3 and stats["in_flight"] == 0
+
+    def test_stream_errors(self):
+        flight = SingleFlight()
+        closed = []
+
+        def failing():
+            try:
+                yield b"a"
+                raise KeyError("x")
+            finally:
+                closed.append(True)
+
+        readers = [flight.stream("a", failing) for _ in range(3)]
+        assert [next(reader) for reader in readers] == [b"a"] * 3
+        for reader in readers:
+            with self.assertRaises(KeyError):
+                next(reader)
+        assert flight.stats()["errors"] == 1 and flight.stats()["in_flight"] == 0
+
+        # the computation is closed when all its readers are
+        reader = flight.stream("b", failing)
+        next(reader)
+        reader.close()
+        assert len(closed) == 2 and flight.stats()["in_flight"] == 0
+
+    def test_synthetic_archive_misses(self):
+        archive = SyntheticArchive(seed=1)
+        generate = archive.generate
+        release = threading.Event()
+
+        def slow_generate(uri_r):
+            release.wait(10)
+            return generate(uri_r)
+
+        with mock.patch.object(archive, "generate", side_effect=slow_generate) as patched:
+            threads, results = self._concurrent(lambda: archive.timeline("http://a.com"), 8)
+            while archive.single_flight.calls < 8:
+                threading.Event().wait(0.01)
+            release.set()
+            for thread in threads:
+                thread.join()
+        assert patched.call_count == 1
+        assert all(result is results[0] for result in results)
+        # then served by the cache
+        assert archive.timeline("http://a.com") is results[0]
+        assert archive.single_flight.calls == 8
+
+    def test_timemaps(self):
+        flight = SingleFlight()
+        client = Client(create_application(archive=SyntheticArchive(seed=1),
+                                           single_flight=flight))
+        expected = client.get("/timemap/link/http://a.com").data
+        assert flight.stats()["executions"] == 1
+
+        release = threading.Event()
+
+        def slow_serializer(*args, **options):
+            release.wait(10)
+            return link_format_timemap(*args, **options)
+
+        with mock.patch("memento_test.server.link_format_timemap",
+                        side_effect=slow_serializer) as patched:
+            threads, results = self._concurrent(
+                lambda: client.get("/timemap/link/http://a.com").data, 6)
+            # other preferences are another TimeMap
+            others, other_results = self._concurrent(lambda: client.get(
+                "/timemap/link/http://a.com",
+                headers={"Prefer": "no_original_link_header"}).data, 1)
+            while flight.calls < 8:
+                threading.Event().wait(0.01)
+            release.set()
+            for thread in threads + others:
+                thread.join()
+        assert patched.call_count == 2
+        assert results == [expected] * 6
+        assert other_results[0] != expected
+        assert flight.stats()["coalesced"] == 5
+
+
+class AsyncSingleFlightTest(unittest.TestCase):
+
+    def test_coalesced(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def compute(value):
+            calls.append(value)
+            await asyncio.sleep(0.05)
+            if value == "error":
+                raise ValueError(value)
+            return value
+
+        async def run():
+            results = await asyncio.gather(*[flight.do("a", compute, i) for i in range(5)])
+            errors = await asyncio.gather(*[flight.do("e", compute, "error") for _ in range(3)],
+                                          return_exceptions=True)
+            # a cancelled waiter does not cancel the computation of the others
+            first = asyncio.ensure_future(flight.do("c", compute, "c"))
+            second = asyncio.ensure_future(flight.do("c", compute, "c"))
+            await asyncio.sleep(0)
+            first.cancel()
+            return results, errors, await second
+
+        results, errors, second = asyncio.run(run())
+        assert results == [0] * 5
+        assert all(isinstance(e, ValueError) for e in errors)
+        assert second == "c"
+        assert calls == [0, "error", "c"]
+        stats = flight.stats()
+        assert stats["calls"] == 10 and stats["executions"] == 3
+        assert stats["errors"] == 1 and stats["in_flight"] == 0
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.archive import SyntheticArchive
+from memento_test.server import create_application
+from memento_test.snapshot import load_snapshot, open_snapshot, write_snapshot, \
+    SnapshotError, HEADER
+from memento_test.warmup import Warmup, ReadinessApplication, READY_PATH
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from werkzeug.test import Client
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "memento.snapshot")
+        self.archive = SyntheticArchive(seed=2, density=10)
+        self.uris = list(self.archive.uris(50))
+        self.settings = {"seed": 2, "density": 10, "uris": 50}
+        self.builds = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _build(self):
+        self.builds += 1
+        return self.archive.materialize(self.uris)
+
+    def test_load_or_build(self):
+        index, loaded = load_snapshot(self.path, self.settings, self._build)
+        assert not loaded and self.builds == 1
+        for uri_r in self.uris:
+            assert list(index.timeline(uri_r)) == list(self.archive.timeline(uri_r))
+        index.close()
+
+        index, loaded = load_snapshot(self.path, self.settings, self._build)
+        assert loaded and self.builds == 1
+        assert len(index) == len(self.uris)
+        assert list(index.timeline(self.uris[0])) == list(self.archive.timeline(self.uris[0]))
+        assert index.timeline("http://www.cnn.com") is None
+        index.close()
+
+        # other settings rebuild the snapshot
+        settings = dict(self.settings, density=11)
+        with self.assertRaises(SnapshotError):
+            open_snapshot(self.path, settings)
+        index, loaded = load_snapshot(self.path, settings, self._build)
+        assert not loaded and self.builds == 2
+        index.close()
+        assert os.listdir(self.tmp) == ["memento.snapshot"]
+
+    def test_invalid(self):
+        size = write_snapshot(self.path, self._build(), self.settings)
+        assert size == os.path.getsize(self.path)
+        with open(self.path, "rb") as f:
+            data = f.read()
+        for invalid in (data[:HEADER.size - 1], b"X" + data[1:], data[:8] + b"\x09" + data[9:],
+                        data[:-1]):
+            with open(self.path, "wb") as f:
+                f.write(invalid)
+            with self.assertRaises(SnapshotError):
+                open_snapshot(self.path, self.settings)
+        index, loaded = load_snapshot(self.path, self.settings, self._build)
+        assert not loaded
+        index.close()
+
+    def test_server(self):
+        index, loaded = load_snapshot(self.path, self.settings, self._build)
+        client = Client(create_application(archive=index))
+        response = client.get("/timemap/link/" + self.uris[0])
+        assert response.status_code == 200
+        # the streamed TimeMap holds the timeline until the response is closed
+        response.close()
+        index.close()
+
+
+class WarmupTest(unittest.TestCase):
+
+    def test_readiness(self):
+        release = threading.Event()
+        details = {}
+
+        def load():
+            release.wait(10)
+            details["snapshot"] = "loaded"
+            return SyntheticArchive(seed=1)
+
+        warmup = Warmup(load, details)
+        warmup.start()
+        client = Client(ReadinessApplication(
+            warmup, lambda: create_application(archive=warmup.result), retry_after=3))
+        response = client.get(READY_PATH)
+        assert response.status_code == 503 and response.headers["Retry-After"] == "3"
+        assert json.loads(response.data) == {"ready": False, "warmup_seconds": None,
+                                             "error": None}
+        response = client.get("/tg/http://www.espn.com")
+        assert response.status_code == 503 and response.headers["Retry-After"] == "3"
+
+        release.set()
+        warmup.done.wait(10)
+        response = client.get(READY_PATH)
+        assert response.status_code == 200
+        stats = json.loads(response.data)
+        assert stats["ready"] and stats["snapshot"] == "loaded"
+        assert stats["warmup_seconds"] >= 0
+        assert client.head(READY_PATH).data == b""
+        assert client.get("/tg/http://www.espn.com").status_code == 302
+
+    def test_failed(self):
+        def load():
+            raise IOError("no index")
+
+        warmup = Warmup(load)
+        warmup.start(background=False)
+        client = Client(ReadinessApplication(warmup, lambda: None))
+        response = client.get(READY_PATH)
+        assert response.status_code == 503
+        assert json.loads(response.data)["error"] == "no index"
+        assert client.get("/tg/http://www.espn.com").status_code == 503
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.archive import MementoIndex, SyntheticArchive
+from memento_test.server import create_application
+from memento_test.shared_index import SharedMementoIndex, write_index
+from memento_test.surt import surt, canonicalize, SURT_CACHE_SIZE
+from datetime import datetime
+import os
+import tempfile
+import unittest
+from werkzeug.test import Client
+
+
+class SurtTest(unittest.TestCase):
+
+    def test_canonicalize(self):
+        cases = [
+            ("http://www.espn.com", "com,espn)/"),
+            ("https://ESPN.com/", "com,espn)/"),
+            ("http://espn.com:80/#top", "com,espn)/"),
+            ("https://www.espn.com:443", "com,espn)/"),
+            ("http://user:pw@www3.espn.com/NBA/", "com,espn)/nba/"),
+            ("http://www.espn.com/nba/?b=2&a=1", "com,espn)/nba/?a=1&b=2"),
+            ("http://www.espn.com/?", "com,espn)/"),
+            ("http://espn.com:8080/x", "com,espn:8080)/x"),
+            ("http://www2.bbc.co.uk./", "uk,co,bbc)/"),
+            ("http://www.com/", "com,www)/"),
+            ("http://192.168.1.1/a", "192.168.1.1)/a"),
+            ("http://[::1]:80/a", "[::1])/a"),
+            ("http:/www.espn.com/", "com,espn)/"),
+            ("espn.com/nba", "com,espn)/nba"),
+            (" http://espn.com \n", "com,espn)/"),
+            ("ftp://ftp.example.org/a", "ftp://(org,example,ftp)/a"),
+            (u"http://www.例え.jp/ü", u"jp,例え)/ü"),
+        ]
+        for uri, key in cases:
+            assert canonicalize(uri) == key, uri
+            # a SURT is its own SURT
+            assert canonicalize(key) == key, key
+            assert surt(uri) == key
+
+    def test_memoized(self):
+        surt.cache_clear()
+        for _ in range(3):
+            surt("http://www.espn.com/")
+        info = surt.cache_info()
+        assert (info.hits, info.misses, info.maxsize) == (2, 1, SURT_CACHE_SIZE)
+
+
+class SurtIndexTest(unittest.TestCase):
+
+    def test_equivalent_uris(self):
+        index = MementoIndex()
+        index.add("http://www.espn.com", [datetime(2010, 1, 1)])
+        assert list(index.uris()) == ["com,espn)/"]
+        tmp = tempfile.mkdtemp()
+        path = os.path.join(tmp, "index.mti")
+        write_index(index, path)
+        shared = SharedMementoIndex.open(path)
+        archive = SyntheticArchive(seed=1)
+        for uri_r in ("http://www.espn.com/", "https://ESPN.com", "com,espn)/"):
+            assert uri_r in index and uri_r in shared
+            assert list(shared.timeline(uri_r)) == list(index.timeline(uri_r))
+            assert archive.timeline(uri_r) is archive.timeline("http://www.espn.com")
+        shared.close()
+        os.remove(path)
+        os.rmdir(tmp)
+
+    def test_server(self):
+        index = MementoIndex()
+        index.add("http://www.espn.com", [datetime(2010, 1, 1)])
+        client = Client(create_application(archive=index))
+        for uri_r in ("http://www.espn.com", "http://www.espn.com/", "https://espn.com/"):
+            response = client.get("/tg/" + uri_r)
+            assert response.status_code == 302
+            # the links keep the URI-R of the request
+            assert response.headers["Location"] == \
+                "http://localhost:4000/20100101000000/" + uri_r
+            assert client.get("/timemap/link/" + uri_r).status_code == 200
+        assert client.get("/tg/http://www.espn.com/nba").status_code == 404
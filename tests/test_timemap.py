@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application, parse_link_header, \
+    convert_archive_datetime_end
+from memento_test.binary_timemap import decode_binary_timemap, BINARY_TIMEMAP_MIMETYPE
+from memento_test.archive import SyntheticArchive, MementoIndex, iso_date, to_epoch
+from memento_test.timemap import json_timemap, link_format_timemap, CHUNK_ENTRIES, \
+    json_timemap_length, link_format_timemap_length
+from datetime import date, datetime
+from array import array
+import json
+import unittest
+from unittest import mock
+from werkzeug.test import Client, EnvironBuilder
+
+TIMEMAP_URIS = {"link_format": "http://a/timemap/link/http://x.com/",
+                "json_format": "http://a/timemap/json/http://x.com/"}
+
+
+class JsonTimeMapTest(unittest.TestCase):
+
+    def test_json_timemap(self):
+        timeline = array("q", [to_epoch(date(2001, 1, 1)), to_epoch(datetime(2005, 5, 5, 5, 5, 5))])
+        body = b"".join(json_timemap("http://x.com/", timeline, "http://a/", TIMEMAP_URIS,
+                                     "http://a/tg/http://x.com/"))
+        timemap = json.loads(body.decode("utf-8"))
+
+        assert timemap["original_uri"] == "http://x.com/"
+        assert timemap["timegate_uri"] == "http://a/tg/http://x.com/"
+        assert timemap["timemap_uri"] == TIMEMAP_URIS
+        assert timemap["mementos"]["first"] == {
+            "datetime": "2001-01-01T00:00:00Z", "uri": "http://a/20010101000000/http://x.com/"}
+        assert timemap["mementos"]["last"]["datetime"] == "2005-05-05T05:05:05Z"
+        assert [m["uri"] for m in timemap["mementos"]["list"]] == [
+            "http://a/20010101000000/http://x.com/", "http://a/20050505050505/http://x.com/"]
+
+    def test_pages(self):
+        timeline = array("q", range(0, 500, 100))
+        pages = {"prev": "http://a/tm?page=1", "next": "http://a/tm?page=3"}
+        timemap = json.loads(b"".join(json_timemap(
+            "http://x.com/", timeline, "http://a/", TIMEMAP_URIS, "tg",
+            start=2, stop=4, pages=pages)).decode("utf-8"))
+        assert timemap["pages"] == pages
+        assert [m["datetime"] for m in timemap["mementos"]["list"]] == [
+            iso_date(200), iso_date(300)]
+        # of the whole timeline
+        assert timemap["mementos"]["first"]["datetime"] == iso_date(0)
+
+        body = b"".join(link_format_timemap("http://x.com/", timeline, "http://a/", "http://a/tm",
+                                            "tg", start=4, stop=6, pages={"prev": pages["prev"]}))
+        links = parse_link_header(body.decode("utf-8"))
+        assert links["http://a/tm?page=1"]["rel"] == ["prev"]
+        assert links["http://a/19700101000640/http://x.com/"]["rel"] == ["last", "memento"]
+        assert len([uri for uri in links if "memento" in links[uri]["rel"]]) == 1
+
+    def test_escaping_and_empty_timeline(self):
+        uri_r = 'http://x.com/"quoted"\\'
+        timemap = json.loads(b"".join(json_timemap(uri_r, array("q", [0]), "http://a/",
+                                                   TIMEMAP_URIS, "tg")).decode("utf-8"))
+        assert timemap["original_uri"] == uri_r
+        assert timemap["mementos"]["list"][0]["uri"] == "http://a/19700101000000/" + uri_r
+
+        timemap = json.loads(b"".join(json_timemap("http://x.com/", array("q"), "http://a/",
+                                                   TIMEMAP_URIS, "tg")).decode("utf-8"))
+        assert timemap["mementos"] == {"list": []}
+
+    def test_streamed_in_chunks(self):
+        timeline = array("q", range(0, 86400 * 3 * CHUNK_ENTRIES, 86400))
+        chunks = list(json_timemap("http://x.com/", timeline, "http://a/", TIMEMAP_URIS, "tg"))
+        assert len(chunks) == 4
+        timemap = json.loads(b"".join(chunks).decode("utf-8"))
+        assert len(timemap["mementos"]["list"]) == len(timeline)
+        assert timemap["mementos"]["list"][-1]["datetime"] == iso_date(timeline[-1])
+
+    def test_malformed_timemaps(self):
+        timeline = array("q", [0, 86400])
+        body = b"".join(json_timemap("http://x.com/", timeline, "http://a/", TIMEMAP_URIS,
+                                     "tg", original=False, invalid_datetime=True))
+        timemap = json.loads(body.decode("utf-8"))
+        assert "original_uri" not in timemap
+        assert timemap["mementos"]["first"]["datetime"] == "1970-01-01T00:00:0"
+
+        body = b"".join(json_timemap("http://x.com/", timeline, "http://a/", TIMEMAP_URIS,
+                                     "tg", invalid=True))
+        with self.assertRaises(ValueError):
+            json.loads(body.decode("utf-8"))
+
+    def test_lengths(self):
+        timelines = [array("q"), array("q", [0]), array("q", range(0, 86400 * 700, 86400))]
+        serializers = [(json_timemap, json_timemap_length, TIMEMAP_URIS),
+                       (link_format_timemap, link_format_timemap_length, "http://a/tm")]
+        option_sets = [{}, {"original": False}, {"invalid": True}, {"invalid_datetime": True},
+                       {"start": 0, "stop": 1}, {"start": 1, "stop": 699},
+                       {"start": 600, "stop": 1200, "pages": {"prev": "http://a/tm?page=2"}}]
+        for timeline in timelines:
+            for serializer, length, timemap_uri in serializers:
+                for options in option_sets:
+                    body = b"".join(serializer(u"http://x.com/\u00e9", timeline, "http://a/",
+                                               timemap_uri, "tg", **options))
+                    assert length(u"http://x.com/\u00e9", timeline, "http://a/", timemap_uri,
+                                  "tg", **options) == len(body), (serializer, options)
+
+
+class TimeMapServerTest(unittest.TestCase):
+
+    def setUp(self):
+        index = MementoIndex()
+        index.add("http://www.espn.com", [datetime(2005, 1, 1), datetime(2010, 1, 1),
+                                          datetime(2015, 1, 1)])
+        self.client = Client(create_application(archive=index))
+
+    def _get(self, path, prefer=None, method="GET"):
+        headers = [("Prefer", prefer)] if prefer else []
+        builder = EnvironBuilder(path=path, headers=headers, method=method)
+        app_iter, status, headers = self.client.run_wsgi_app(builder.get_environ())
+        return b"".join(app_iter).decode("utf-8"), status, headers
+
+    def test_json_endpoint(self):
+        body, status, headers = self._get("/timemap/json/http://www.espn.com")
+        assert "200" in status
+        assert headers.get("Content-Type").startswith("application/json")
+        timemap = json.loads(body)
+        assert timemap["original_uri"] == "http://www.espn.com"
+        assert timemap["timemap_uri"]["json_format"] == \
+            "http://localhost:4000/timemap/json/http://www.espn.com"
+        assert len(timemap["mementos"]["list"]) == 3
+
+        body, status, headers = self._get("/timemap/json/http://www.espn.com", method="HEAD")
+        assert "200" in status
+        assert body == ""
+
+        body, status, headers = self._get("/timemap/xml/http://www.espn.com")
+        assert "404" in status
+
+    def test_head(self):
+        for path in ("/timemap/json/http://www.espn.com", "/timemap/link/http://www.espn.com"):
+            for prefer in (None, "no_original_link_header", "return=minimal"):
+                body, status, headers = self._get(path, prefer)
+                with mock.patch("memento_test.server.json_timemap") as json_serializer, \
+                        mock.patch("memento_test.server.link_format_timemap") as link_serializer:
+                    head_body, head_status, head_headers = self._get(path, prefer, "HEAD")
+                assert not json_serializer.called and not link_serializer.called
+                assert head_body == ""
+                assert head_status == status
+                assert list(head_headers.items()) == list(headers.items())
+                assert int(headers.get("Content-Length")) == len(body.encode("utf-8"))
+
+        assert "404" in self._get("/timemap/link/http://www.cnn.com", method="HEAD")[1]
+        body, status, headers = self._get("/timemap/link/http://www.espn.com")
+        assert headers.get("ETag").startswith('W/"')
+        assert self._get("/timemap/json/http://www.espn.com")[2].get("ETag") != \
+            headers.get("ETag")
+
+    def test_json_scenarios(self):
+        body, status, headers = self._get("/timemap/json/http://www.espn.com",
+                                          "no_original_link_header, invalid_datetime_in_link_header")
+        assert headers.get("Preference-Applied") == \
+            "no_original_link_header, invalid_datetime_in_link_header"
+        timemap = json.loads(body)
+        assert "original_uri" not in timemap
+        assert timemap["mementos"]["last"]["datetime"] == "2015-01-01T00:00:0"
+
+        body, status, headers = self._get("/timemap/json/http://www.espn.com",
+                                          "invalid_link_header")
+        assert "200" in status
+        with self.assertRaises(ValueError):
+            json.loads(body)
+
+    def test_link_format_scenarios(self):
+        body, status, headers = self._get("/timemap/link/http://www.espn.com",
+                                          "no_original_link_header")
+        assert headers.get("Preference-Applied") == "no_original_link_header"
+        lh = parse_link_header(body)
+        assert "http://www.espn.com" not in lh
+        assert len(lh) == 5
+
+        body, status, headers = self._get("/timemap/link/http://www.espn.com",
+                                          "invalid_datetime_in_link_header")
+        lh = parse_link_header(body)
+        assert lh["http://localhost:4000/20050101000000/http://www.espn.com"]["datetime"] == \
+            ["Sat, 01 Jan 2005 00:00:00 G"]
+
+        body, status, headers = self._get("/timemap/link/http://www.espn.com",
+                                          "invalid_link_header")
+        with self.assertRaises((ValueError, IndexError)):
+            parse_link_header(body)
+
+    def test_bounds(self):
+        path = "/timemap/link/http://www.espn.com"
+        body, status, headers = self._get(path + "?from=2006&until=20150101")
+        assert "200" in status
+        assert int(headers.get("Content-Length")) == len(body.encode("utf-8"))
+        lh = parse_link_header(body)
+        mementos = [uri for uri, link in lh.items() if "memento" in " ".join(link["rel"])]
+        assert mementos == ["http://localhost:4000/20100101000000/http://www.espn.com",
+                            "http://localhost:4000/20150101000000/http://www.espn.com"]
+        self_uri = "http://localhost:4000" + path + "?from=2006&until=20150101"
+        assert lh[self_uri]["rel"] == ["self"]
+        assert lh[self_uri]["from"] == ["Fri, 01 Jan 2010 00:00:00 GMT"]
+        assert lh[self_uri]["until"] == ["Thu, 01 Jan 2015 00:00:00 GMT"]
+        # the first and last mementos are those of the slice
+        assert lh[mementos[0]]["rel"] == ["first", "memento"]
+        assert lh[mementos[1]]["rel"] == ["last", "memento"]
+
+        body, status, headers = self._get("/timemap/json/http://www.espn.com?until=2009")
+        timemap = json.loads(body)
+        assert [m["datetime"] for m in timemap["mementos"]["list"]] == ["2005-01-01T00:00:00Z"]
+        assert timemap["mementos"]["first"] == timemap["mementos"]["last"]
+        assert timemap["timemap_uri"]["link_format"].endswith("?until=2009")
+
+        body, status, headers = self._get(path + "?from=2016")
+        assert "200" in status
+        assert [link["rel"] for link in parse_link_header(body).values()] == \
+            [["original"], ["self"], ["timegate"]]
+        assert self._get(path + "?from=2016", method="HEAD")[2].get("Content-Length") == \
+            headers.get("Content-Length")
+
+        for query in ("?from=x", "?until=2010-01-01", "?from=20101301"):
+            assert "400" in self._get(path + query)[1]
+
+    def test_partial_until(self):
+        assert convert_archive_datetime_end(2015) == datetime(2015, 12, 31, 23, 59, 59)
+        assert convert_archive_datetime_end(201602) == datetime(2016, 2, 29, 23, 59, 59)
+        assert convert_archive_datetime_end(201512) == datetime(2015, 12, 31, 23, 59, 59)
+        assert convert_archive_datetime_end(2015030112) == datetime(2015, 3, 1, 12, 59, 59)
+        assert convert_archive_datetime_end(20150301120000) == datetime(2015, 3, 1, 12)
+        assert convert_archive_datetime_end(9999) == datetime(9999, 12, 31, 23, 59, 59)
+
+        archive = SyntheticArchive(seed=1)
+        client = Client(create_application(archive=archive))
+        uri_r = "http://www.espn.com"
+        epochs = list(archive.timeline(uri_r))
+        for query, start, stop in (("?from=2015&until=2015", datetime(2015, 1, 1),
+                                    datetime(2016, 1, 1)),
+                                   ("?from=20150301&until=201503", datetime(2015, 3, 1),
+                                    datetime(2015, 4, 1))):
+            expected = [s for s in epochs if to_epoch(start) <= s < to_epoch(stop)]
+            assert expected
+            timemap = json.loads(client.get("/timemap/json/" + uri_r + query).data)
+            assert [to_epoch(datetime.strptime(m["datetime"], "%Y-%m-%dT%H:%M:%SZ"))
+                    for m in timemap["mementos"]["list"]] == expected, query
+
+    def test_bounds_pages(self):
+        archive = SyntheticArchive(seed=1, density=20)
+        client = Client(create_application(archive=archive, timemap_page_size=10))
+        uri_r = "http://www.espn.com"
+        epochs = list(archive.timeline(uri_r))
+        bounded = [s for s in epochs if to_epoch(datetime(2010, 1, 1)) <= s
+                   < to_epoch(datetime(2011, 1, 1))]
+        assert len(bounded) > 10
+        path = "/timemap/json/%s?from=2010&until=20101231235959" % uri_r
+        mementos = []
+        while path:
+            timemap = json.loads(client.get(path).data)
+            mementos += [to_epoch(datetime.strptime(m["datetime"], "%Y-%m-%dT%H:%M:%SZ"))
+                         for m in timemap["mementos"]["list"]]
+            assert "from=2010&until=20101231235959" in timemap["timemap_uri"]["json_format"]
+            path = timemap["pages"].get("next")
+            path = path and path[len("http://localhost:4000"):]
+        assert mementos == bounded
+
+        binary = decode_binary_timemap(client.get(
+            "/timemap/link/%s?from=2010&until=20101231235959&page=2" % uri_r,
+            headers={"Accept": BINARY_TIMEMAP_MIMETYPE}).data)
+        assert (binary.total, binary.start) == (len(bounded), 10)
+        assert list(binary.epochs) == bounded[10:20]
+        assert (binary.first, binary.last) == (bounded[0], bounded[-1])
+        assert client.get("/timemap/json/%s?from=2010&until=2010&page=%d" % (
+            uri_r, len(bounded) // 10 + 2)).status_code == 404
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application
+from memento_test.tracing import Tracer, SpanExporter, parse_traceparent, NOOP_SPAN
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+TRACE_ID = "4bf92f3577b34da6a3ce929d0e0e4736"
+PARENT_ID = "00f067aa0ba902b7"
+
+
+class TracingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "spans.jsonl")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _request(self, tracer, path="/tg/http://www.espn.com", headers=()):
+        client = Client(create_application(tracer=tracer))
+        builder = EnvironBuilder(path=path, headers=list(headers))
+        app_iter, status, response_headers = client.run_wsgi_app(builder.get_environ())
+        body = b"".join(app_iter)
+        app_iter.close()
+        return status, body
+
+    def _lines(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_parse_traceparent(self):
+        assert parse_traceparent("00-%s-%s-01" % (TRACE_ID, PARENT_ID)) == \
+            (TRACE_ID, PARENT_ID, True)
+        assert parse_traceparent("00-%s-%s-00" % (TRACE_ID, PARENT_ID)) == \
+            (TRACE_ID, PARENT_ID, False)
+        assert parse_traceparent(None) is None
+        assert parse_traceparent("00-%s-%s" % (TRACE_ID, PARENT_ID)) is None
+        assert parse_traceparent("00-%s-%s-01" % ("0" * 32, PARENT_ID)) is None
+        assert parse_traceparent("ff-%s-%s-01" % (TRACE_ID, PARENT_ID)) is None
+
+    def test_spans(self):
+        exporter = SpanExporter(self.path)
+        status, body = self._request(Tracer(exporter), headers=[("Prefer", "tg_303")])
+        assert "303" in status
+        exporter.close()
+
+        spans = {span["name"]: span for span in self._lines()}
+        assert {"request", "dispatch_request", "parse_prefer", "on_tg_303",
+                "create_link_header", "stream_body"} <= set(spans)
+        root = spans["request"]
+        assert root["parent_id"] is None
+        assert root["attributes"]["status"] == 303
+        assert root["attributes"]["endpoint"] == "timegate"
+        assert root["attributes"]["preference"] == "tg_303"
+        assert len({span["trace_id"] for span in spans.values()}) == 1
+        # the spans are nested
+        assert spans["dispatch_request"]["parent_id"] == root["span_id"]
+        assert spans["stream_body"]["parent_id"] == root["span_id"]
+        assert spans["on_tg_303"]["parent_id"] == spans["dispatch_request"]["span_id"]
+        assert spans["create_link_header"]["parent_id"] == spans["on_tg_303"]["span_id"]
+        assert spans["on_tg_303"]["attributes"] == {"endpoint": "timegate",
+                                                   "preference": "tg_303"}
+        assert spans["stream_body"]["attributes"]["bytes"] == len(body)
+        for span in spans.values():
+            assert span["end_time_unix_nano"] >= span["start_time_unix_nano"]
+
+    def test_traceparent_is_propagated(self):
+        exporter = SpanExporter(self.path)
+        tracer = Tracer(exporter, sample_rate=0)
+        self._request(tracer, headers=[("traceparent", "00-%s-%s-01" % (TRACE_ID, PARENT_ID))])
+        # not sampled by the client
+        self._request(tracer, headers=[("traceparent", "00-%s-%s-00" % (TRACE_ID, PARENT_ID))])
+        # not sampled by the server
+        self._request(tracer)
+        exporter.close()
+
+        spans = self._lines()
+        assert spans
+        assert {span["trace_id"] for span in spans} == {TRACE_ID}
+        roots = [span for span in spans if span["name"] == "request"]
+        assert len(roots) == 1
+        assert roots[0]["parent_id"] == PARENT_ID
+
+    def test_sampling(self):
+        tracer = Tracer(SpanExporter(self.path), sample_rate=0.25)
+        sampled = sum(tracer.start_request({}) is not None for i in range(4000))
+        assert 800 < sampled < 1200
+        assert Tracer(tracer.exporter, sample_rate=0).start_request({}) is None
+        # no current span outside of the traced requests
+        assert tracer.span("on_tg_303") is NOOP_SPAN
+        tracer.exporter.close()
+        with self.assertRaises(ValueError):
+            Tracer(tracer.exporter, sample_rate=2)
+
+    def test_otlp(self):
+        exporter = SpanExporter(self.path, span_format="otlp")
+        self._request(Tracer(exporter), path="/timemap/link/http://www.espn.com")
+        exporter.close()
+
+        lines = self._lines()
+        assert len(lines) == 1
+        resource_spans = lines[0]["resourceSpans"][0]
+        assert {"key": "service.name", "value": {"stringValue": "memento_test"}} in \
+            resource_spans["resource"]["attributes"]
+        spans = {span["name"]: span for span in resource_spans["scopeSpans"][0]["spans"]}
+        root = spans["request"]
+        assert "parentSpanId" not in root
+        assert spans["dispatch_request"]["parentSpanId"] == root["spanId"]
+        assert len(root["traceId"]) == 32 and len(root["spanId"]) == 16
+        assert int(root["endTimeUnixNano"]) >= int(root["startTimeUnixNano"])
+        assert {"key": "status", "value": {"intValue": "200"}} in root["attributes"]
+        assert {"key": "endpoint", "value": {"stringValue": "timemap"}} in \
+            spans["on_all_headers"]["attributes"]
+
+    def test_untraced_responses_are_unchanged(self):
+        exporter = SpanExporter(self.path)
+        traced = self._request(Tracer(exporter), headers=[("Prefer", "tg_200")])
+        exporter.close()
+        assert traced[0] == self._request(None, headers=[("Prefer", "tg_200")])[0]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.archive import SyntheticArchive
+from memento_test.server import parse_link_header, convert_to_datetime
+from memento_test.virtual import VirtualArchive, create_virtual_application, load_archives
+from datetime import date, datetime
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from werkzeug.test import Client, EnvironBuilder
+
+
+class VirtualArchivesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.archives = [
+            VirtualArchive("ia", first_datetime=date(1996, 1, 1)),
+            VirtualArchive("ukwa", host_name="http://wayback.test",
+                           archive=SyntheticArchive(seed=1, density=20,
+                                                    first_datetime=date(2005, 1, 1)),
+                           scenarios=["all_headers", "tg_302"]),
+        ]
+        self.client = Client(create_virtual_application(self.archives))
+
+    def _get(self, path, prefer=None, host="localhost"):
+        headers = [("Host", host)]
+        if prefer:
+            headers.append(("Prefer", prefer))
+        builder = EnvironBuilder(path=path, headers=headers)
+        app_iter, status, headers = self.client.run_wsgi_app(builder.get_environ())
+        return status, headers
+
+    def test_host_names(self):
+        assert self.archives[0].host_name == "http://localhost:4000/archive/ia/"
+        assert self.archives[0].host is None
+        assert self.archives[1].host_name == "http://wayback.test/"
+        assert self.archives[1].host == "wayback.test"
+
+    def test_by_path(self):
+        status, headers = self._get("/archive/ia/tg/http://www.espn.com")
+        assert "302" in status
+        assert headers["Location"].startswith("http://localhost:4000/archive/ia/")
+        lh = parse_link_header(headers["Link"])
+        firsts = [lh[uri]["datetime"][0] for uri in lh if "first" in lh[uri]["rel"]]
+        assert convert_to_datetime(firsts[0]) == datetime(1996, 1, 1)
+
+        status, headers = self._get("/archive/ukwa/20050101/http://www.espn.com")
+        assert headers["Location"].startswith("http://wayback.test/")
+
+        status, headers = self._get("/archive/other/tg/http://www.espn.com")
+        assert "404" in status
+
+    def test_by_host(self):
+        status, headers = self._get("/tg/http://www.espn.com", host="wayback.test")
+        assert "302" in status
+        assert headers["Location"].startswith("http://wayback.test/2")
+
+        status, headers = self._get("/tg/http://www.espn.com")
+        assert "404" in status
+
+    def test_scenarios(self):
+        status, headers = self._get("/tg/http://www.espn.com", prefer="tg_302",
+                                    host="wayback.test")
+        assert headers["Preference-Applied"] == "tg_302"
+
+        # not enabled in this archive
+        status, headers = self._get("/tg/http://www.espn.com", prefer="tg_303",
+                                    host="wayback.test")
+        assert "302" in status
+        assert "Preference-Applied" not in headers
+
+        status, headers = self._get("/archive/ia/tg/http://www.espn.com", prefer="tg_303")
+        assert "303" in status
+
+    def test_default_archive(self):
+        client = Client(create_virtual_application(self.archives, default="ia"))
+        builder = EnvironBuilder(path="/tg/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert headers["Location"].startswith("http://localhost:4000/archive/ia/")
+
+        with self.assertRaises(ValueError):
+            create_virtual_application(self.archives, default="other")
+        with self.assertRaises(ValueError):
+            create_virtual_application(self.archives + [VirtualArchive("ia")])
+        with self.assertRaises(ValueError):
+            VirtualArchive("a/b")
+
+    def test_load_archives(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        path = os.path.join(tmp, "archives.json")
+        with open(path, "w") as f:
+            json.dump({"default": "ia", "archives": [
+                {"name": "ia", "first_datetime": "1996-01-01",
+                 "synthetic": {"seed": 1, "density": 10}},
+                {"name": "empty", "scenarios": ["all_headers"]}]}, f)
+        archives, default = load_archives(path)
+        assert default == "ia"
+        assert [a.name for a in archives] == ["ia", "empty"]
+        assert archives[0].archive.first_datetime == date(1996, 1, 1)
+        assert archives[0].first_datetime == date(1996, 1, 1)
+        assert archives[1].archive is None
+        assert archives[1].scenarios == frozenset(["all_headers"])
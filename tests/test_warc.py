@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+from memento_test.server import create_application
+from memento_test.warc import WarcArchive, WarcFormatError, warc_datetime, PAYLOAD_CHUNK
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+from unittest import mock
+from werkzeug.test import Client, EnvironBuilder
+
+
+def chunked(payload, size=5):
+    return b"".join(b"%x;ext=1\r\n%s\r\n" % (len(payload[i:i + size]), payload[i:i + size])
+                    for i in range(0, len(payload), size)) + b"0\r\nTrailer: x\r\n\r\n"
+
+
+def warc_record(uri, date, payload, content_type="text/html", warc_type="response",
+                http_headers=None):
+    if warc_type == "response":
+        if http_headers is None:
+            http_headers = b"Content-Length: %d\r\n" % len(payload)
+        block = b"HTTP/1.1 200 OK\r\nContent-Type: " + content_type.encode("ascii") + \
+            b"\r\n" + http_headers + b"\r\n" + payload
+        block_type = b"application/http; msgtype=response"
+    else:
+        block = payload
+        block_type = content_type.encode("ascii")
+    headers = b"WARC/1.0\r\nWARC-Type: %s\r\nWARC-Target-URI: %s\r\nWARC-Date: %s\r\n" \
+              b"Content-Type: %s\r\nContent-Length: %d\r\n\r\n" % (
+                  warc_type.encode("ascii"), uri.encode("utf-8"), date.encode("ascii"),
+                  block_type, len(block))
+    return headers + block + b"\r\n\r\n"
+
+
+class WarcArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.big = bytes(bytearray(range(256))) * (3 * PAYLOAD_CHUNK // 256 + 7)
+        records = [
+            warc_record("http://www.espn.com", "2005-01-01T00:00:00Z", b"<html>2005</html>"),
+            warc_record("http://www.espn.com", "2010-06-01T12:00:00Z", b"<html>2010</html>"),
+            warc_record("http://www.espn.com/logo", "2010-06-01T12:00:00Z", b"GIF89a",
+                        content_type="image/gif", warc_type="resource"),
+            warc_record("http://www.espn.com", "2011-01-01T00:00:00Z", b"request",
+                        warc_type="request"),
+        ]
+        with open(os.path.join(self.tmp, "a.warc"), "wb") as f:
+            f.write(b"".join(records))
+        os.makedirs(os.path.join(self.tmp, "sub"))
+        with open(os.path.join(self.tmp, "sub", "b.warc.gz"), "wb") as f:
+            for record in [
+                    warc_record("http://www.espn.com", "2015-01-01T00:00:00.123Z", self.big,
+                                content_type="application/octet-stream"),
+                    warc_record("http://www.cnn.com", "2016-01-01T00:00:00Z", b"cnn")]:
+                f.write(gzip.compress(record))
+        # archived with their HTTP framing and content coding
+        self.html = b"<html><a href=\"/about\">about</a>" + b"x" * 1000 + b"</html>"
+        with open(os.path.join(self.tmp, "encoded.warc"), "wb") as f:
+            for date, payload, http_headers in [
+                    ("2001-01-01T00:00:00Z", chunked(self.html),
+                     b"Transfer-Encoding: chunked\r\n"),
+                    ("2002-01-01T00:00:00Z", gzip.compress(self.html),
+                     b"Content-Encoding: gzip\r\n"),
+                    ("2003-01-01T00:00:00Z", chunked(zlib.compress(self.html), 64),
+                     b"Transfer-Encoding: chunked\r\nContent-Encoding: deflate\r\n"),
+                    ("2004-01-01T00:00:00Z", chunked(b"brotli"),
+                     b"Transfer-Encoding: chunked\r\nContent-Encoding: br\r\n"),
+                    ("2005-01-01T00:00:00Z", b"not gzip",
+                     b"Content-Encoding: gzip\r\n")]:
+                f.write(warc_record("http://www.encoded.com", date, payload,
+                                    http_headers=http_headers))
+        with open(os.path.join(self.tmp, "ignored.txt"), "wb") as f:
+            f.write(b"not a warc")
+        self.archive = WarcArchive(self.tmp)
+
+    def tearDown(self):
+        self.archive.close()
+        shutil.rmtree(self.tmp)
+
+    def _payload(self, uri_r, date):
+        record = self.archive.record(uri_r, warc_datetime(date))
+        return record, b"".join(self.archive.payload(record))
+
+    def test_index(self):
+        assert len(self.archive) == 4
+        assert self.archive.memento_count() == 10
+        assert list(self.archive.timeline("http://www.espn.com")) == [
+            warc_datetime("2005-01-01T00:00:00Z"), warc_datetime("2010-06-01T12:00:00Z"),
+            warc_datetime("2015-01-01T00:00:00Z")]
+        assert "http://www.cnn.com" in self.archive
+        assert self.archive.timeline("http://www.example.com") is None
+
+    def test_uncompressed_payloads(self):
+        record, payload = self._payload("http://www.espn.com", "2010-06-01T12:00:00Z")
+        assert payload == b"<html>2010</html>"
+        assert record.content_type == "text/html"
+        assert not record.compressed
+
+        record, payload = self._payload("http://www.espn.com/logo", "2010-06-01T12:00:00Z")
+        assert payload == b"GIF89a"
+        assert record.content_type == "image/gif"
+
+    def test_compressed_payloads(self):
+        record, payload = self._payload("http://www.espn.com", "2015-01-01T00:00:00Z")
+        assert record.compressed
+        assert payload == self.big
+        chunks = list(self.archive.payload(record))
+        assert max(len(c) for c in chunks) <= PAYLOAD_CHUNK
+
+        record, payload = self._payload("http://www.cnn.com", "2016-01-01T00:00:00Z")
+        assert payload == b"cnn"
+
+    def test_encoded_payloads(self):
+        for date, decode in [("2001-01-01T00:00:00Z", ("chunked",)),
+                             ("2002-01-01T00:00:00Z", ("gzip",)),
+                             ("2003-01-01T00:00:00Z", ("chunked", "deflate"))]:
+            record, payload = self._payload("http://www.encoded.com", date)
+            assert record.decode == decode
+            assert record.content_encoding == ""
+            assert payload == self.html
+            assert record.body_length == len(self.html)
+
+        # the codings that are not decoded are served as they are
+        record, payload = self._payload("http://www.encoded.com", "2004-01-01T00:00:00Z")
+        assert record.decode == ("chunked",)
+        assert record.content_encoding == "br"
+        assert payload == b"brotli"
+        record, payload = self._payload("http://www.encoded.com", "2005-01-01T00:00:00Z")
+        assert record.decode == ()
+        assert record.content_encoding == "gzip"
+        assert payload == b"not gzip"
+
+    def test_encoded_memento_payload(self):
+        client = Client(create_application(archive=self.archive))
+        for timestamp in ("20010101000000", "20020101000000", "20030101000000"):
+            builder = EnvironBuilder(path="/%s/http://www.encoded.com" % timestamp)
+            app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+            body = b"".join(app_iter)
+            assert "200" in status
+            assert "Content-Encoding" not in headers
+            # decoded, then rewritten
+            assert b"http://localhost:4000/%s/http://www.encoded.com/about" % \
+                timestamp.encode("ascii") in body
+            assert body.endswith(b"x" * 1000 + b"</html>")
+
+        builder = EnvironBuilder(path="/20050101000000/http://www.encoded.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert headers.get("Content-Encoding") == "gzip"
+        assert headers.get("Content-Length") == "8"
+        assert b"".join(app_iter) == b"not gzip"
+
+    def test_invalid_warc(self):
+        with open(os.path.join(self.tmp, "bad.warc"), "wb") as f:
+            f.write(b"HTTP/1.1 200 OK\r\n\r\n")
+        with self.assertRaises(WarcFormatError):
+            WarcArchive(self.tmp)
+
+    def test_memento_payload(self):
+        client = Client(create_application(archive=self.archive))
+        builder = EnvironBuilder(path="/20100601120000/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "200" in status
+        assert headers.get("Content-Type") == "text/html"
+        assert headers.get("Memento-Datetime") == "Tue, 01 Jun 2010 12:00:00 GMT"
+        assert b"".join(app_iter) == b"<html>2010</html>"
+
+        builder = EnvironBuilder(path="/20150101000000/http://www.espn.com",
+                                 headers=[("Prefer", "all_headers")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "200" in status
+        assert int(headers.get("Content-Length")) == len(self.big)
+        assert b"".join(app_iter) == self.big
+
+        etag = headers.get("ETag")
+        builder = EnvironBuilder(path="/20150101000000/http://www.espn.com", method="HEAD",
+                                 headers=[("Prefer", "all_headers")])
+        with mock.patch.object(self.archive, "payload") as payload:
+            app_iter, status, head_headers = client.run_wsgi_app(builder.get_environ())
+        assert not payload.called
+        assert list(head_headers.items()) == list(headers.items())
+        assert head_headers.get("ETag") == etag
+        assert b"".join(app_iter) == b""
+
+        builder = EnvironBuilder(path="/20150101000000/http://www.espn.com",
+                                 headers=[("Prefer", "return=minimal")])
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert b"".join(app_iter) == b""
+        assert headers.get("Content-Length") in (None, "0")
+
+        builder = EnvironBuilder(path="/tg/http://www.espn.com")
+        app_iter, status, headers = client.run_wsgi_app(builder.get_environ())
+        assert "302" in status
+        assert headers.get("Location") == \
+            "http://localhost:4000/20150101000000/http://www.espn.com"